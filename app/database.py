@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -12,14 +13,68 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 if not SQLALCHEMY_DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+def _to_async_url(url: str) -> str:
+    """Map a sync postgres URL (postgresql:// or postgresql+psycopg2://) onto the asyncpg driver."""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+def _to_sync_url(url: str) -> str:
+    """Pin bare postgres URLs to psycopg2; SQLAlchemy 2.1 otherwise defaults to psycopg 3, which is not installed."""
+    for prefix in ("postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+psycopg2://" + url[len(prefix):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _to_async_url(SQLALCHEMY_DATABASE_URL)
+
+# Sync engine is kept for startup DDL (create_all) and offline scripts.
+engine = create_engine(_to_sync_url(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine used by the request handlers so queries never block the event loop.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# Columns added after the first release; create_all() never alters existing tables
+SCHEMA_UPGRADES = [
+    "ALTER TABLE step_problems ADD COLUMN IF NOT EXISTS problem_type VARCHAR",
+    "ALTER TABLE ideas ADD COLUMN IF NOT EXISTS normalized_title VARCHAR",
+    "ALTER TABLE guides ADD COLUMN IF NOT EXISTS content_hash VARCHAR",
+    "ALTER TABLE companion_alerts ADD COLUMN IF NOT EXISTS status VARCHAR",
+    "ALTER TABLE companion_alerts ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0",
+    "ALTER TABLE companion_alerts ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP",
+    "ALTER TABLE companion_alerts ADD COLUMN IF NOT EXISTS sent_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE companion_alerts ADD COLUMN IF NOT EXISTS last_error TEXT",
+    "ALTER TABLE companion_alerts ADD COLUMN IF NOT EXISTS dedupe_key VARCHAR",
+    # Dedupe keys no longer carry a fixed throttle window; only open alerts must be unique
+    "DROP INDEX IF EXISTS ix_companion_alerts_dedupe_key",
+    # Help answers are now keyed by guide version; unversioned rows can never match again
+    "ALTER TABLE ai_help_cache ADD COLUMN IF NOT EXISTS content_hash VARCHAR",
+    "ALTER TABLE ai_help_cache DROP CONSTRAINT IF EXISTS uq_help_cache_key",
+    "DELETE FROM ai_help_cache WHERE content_hash IS NULL",
+]
+
+def apply_schema_upgrades(conn):
+    for statement in SCHEMA_UPGRADES:
+        conn.execute(text(statement))
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
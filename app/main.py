@@ -1,20 +1,123 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
+import logging
+import time
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from app.routers import pages, auth, admin
-from app.database import engine, Base
+from app.database import engine, async_engine, Base, apply_schema_upgrades, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from app.utils.search import ensure_search_schema
+from app.utils.problem_rollup import backfill_rollup
+from app.utils import query_stats, metrics
+from app.utils.progress_buffer import progress_buffer
+from app.utils.scenario_pool import scenario_pool
+from app.utils.ideas import idea_merge_worker
+from app.utils.companion_outbox import companion_dispatcher
+from app.utils.assets import AssetStaticFiles
+from app.utils.svg_store import svg_gc
+from app.utils.sessions import ServerSessionMiddleware, session_backend
+from app.utils.help_cache import help_cache
+from app.utils.catalog import guide_catalog
+from app.utils.user_cache import user_cache
+from app.utils.render_cache import render_cache
+from app.utils.prompt_builder import guide_contexts
+from app.utils.llm_router import llm_router
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 Base.metadata.create_all(bind=engine)
+# Upgrade columns first so indexes on them can be created below
+with engine.begin() as conn:
+    apply_schema_upgrades(conn)
+# create_all skips indexes on tables that already exist
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+with engine.begin() as conn:
+    ensure_search_schema(conn)
+    backfill_rollup(conn)
+
+query_stats.install(engine)
+query_stats.install(async_engine.sync_engine)
+
+metrics.register_collector(metrics.cache_collector({
+    "help": help_cache,
+    "guide_catalog": guide_catalog,
+    "user": user_cache,
+    "render": render_cache,
+    "guide_context": guide_contexts,
+}))
+metrics.register_collector(metrics.pool_collector("async", async_engine.sync_engine.pool, DB_POOL_SIZE + DB_MAX_OVERFLOW))
+metrics.register_collector(metrics.counter_collector(
+    "llm_router_events_total", "LLM calls, hedged duplicates sent and won, fallbacks and calls no model answered.",
+    llm_router, "event", ("calls", "hedges", "hedge_wins", "fallbacks", "failures"),
+))
+metrics.register_collector(metrics.counter_collector(
+    "companion_alerts_total", "Companion alerts delivered or given up on.",
+    companion_dispatcher, "outcome", ("sent", "failed"),
+))
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+@app.middleware("http")
+async def track_query_stats(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    metrics.http_requests_in_flight.inc(method=request.method)
+    try:
+        with query_stats.track_queries() as stats:
+            response = await call_next(request)
+        status = response.status_code
+    finally:
+        metrics.http_requests_in_flight.dec(method=request.method)
+        # Route templates (/guide/{guide_id}) keep the label set bounded; unmatched paths share one label
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.http_request_seconds.observe(
+            time.perf_counter() - started, method=request.method, route=route, status=f"{status // 100}xx"
+        )
+        metrics.http_request_db_statements.observe(stats.count, method=request.method, route=route)
+
+    if query_stats.QUERY_STATS_HEADERS:
+        response.headers["X-DB-Queries"] = str(stats.count)
+        response.headers["X-DB-Time-ms"] = f"{stats.duration * 1000:.1f}"
+
+    budget = query_stats.QUERY_BUDGET
+    if budget and stats.count > budget:
+        message = f"{request.method} {request.url.path} ran {stats.count} queries (budget {budget})"
+        if query_stats.QUERY_BUDGET_STRICT:
+            raise query_stats.QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def start_background_workers():
+    progress_buffer.start()
+    scenario_pool.start()
+    idea_merge_worker.start()
+    companion_dispatcher.start()
+    svg_gc.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await progress_buffer.stop()
+    await scenario_pool.stop()
+    await idea_merge_worker.stop()
+    await companion_dispatcher.stop()
+    await svg_gc.stop()
+    await async_engine.dispose()
+
 secret_key = os.getenv("SESSION_SECRET_KEY", "dev_secret_key_12345")
 app.add_middleware(
-    SessionMiddleware, 
+    ServerSessionMiddleware,
+    backend=session_backend,
     secret_key=secret_key,
     session_cookie="yanindayim_session",
     max_age=3600 * 24 * 7, 
@@ -22,7 +125,8 @@ app.add_middleware(
     https_only=False 
 )
 
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# Hashed files under /static/dist and stored SVGs are immutable and served precompressed when possible
+app.mount("/static", AssetStaticFiles(directory="app/static"), name="static")
 
 app.include_router(auth.router)
 app.include_router(admin.router)
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, UniqueConstraint, Index, text
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from app.database import Base
 
 class User(Base):
@@ -27,6 +28,10 @@ class Guide(Base):
     help_options = Column(Text, nullable=True)  # JSON string of custom help options
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Hash of the guide and its steps; maintained by app.utils.guide_version, used as the ETag
+    content_hash = Column(String, nullable=True)
+    # Full-text index over title, content and steps; maintained by app.utils.search
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
 
     # Relationship to steps
     steps = relationship("GuideStep", back_populates="guide", cascade="all, delete-orphan", order_by="GuideStep.step_number")
@@ -45,19 +50,67 @@ class GuideStep(Base):
 
 class StepProblem(Base):
     __tablename__ = "step_problems"
+    __table_args__ = (Index('ix_step_problems_guide_step', 'guide_id', 'step_number'),)
 
     id = Column(Integer, primary_key=True, index=True)
     guide_id = Column(Integer, ForeignKey("guides.id"), nullable=False)
     step_number = Column(Integer, nullable=False)
+    problem_type = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     guide = relationship("Guide")
 
+class StepProblemDaily(Base):
+    """Rollup of StepProblem: reports per (guide, step, problem type, UTC day), maintained on insert and delete."""
+    __tablename__ = "step_problem_daily"
+    __table_args__ = (
+        UniqueConstraint('guide_id', 'step_number', 'problem_type', 'day', name='uq_step_problem_daily'),
+        Index('ix_step_problem_daily_day', 'day'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    guide_id = Column(Integer, ForeignKey("guides.id", ondelete="CASCADE"), nullable=False)
+    step_number = Column(Integer, nullable=False)
+    problem_type = Column(String, nullable=False, default="general")
+    day = Column(Date, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+class AIHelpCache(Base):
+    __tablename__ = "ai_help_cache"
+    # Keyed by the guide's content_hash, so an edit misses on every worker without any purge
+    __table_args__ = (
+        Index('ix_help_cache_key', 'guide_id', 'content_hash', 'step_number', 'normalized_query', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    guide_id = Column(Integer, ForeignKey("guides.id", ondelete="CASCADE"), nullable=False, index=True)
+    content_hash = Column(String)
+    step_number = Column(Integer, nullable=False)
+    normalized_query = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class GeneratedSVG(Base):
+    """Metadata for a stored step illustration (app/static/generated/svg/<hash>.svg)."""
+    __tablename__ = "generated_svgs"
+
+    hash = Column(String, primary_key=True)  # sha256 of the sanitized file
+    byte_size = Column(Integer, nullable=False)
+    prompt_key = Column(String, index=True)  # md5 of step title + description, for reuse across guides
+    reference_count = Column(Integer, default=0)  # steps/guides using it, see svg_store.refresh_reference_counts
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class Idea(Base):
     __tablename__ = "ideas"
+    __table_args__ = (
+        Index('ix_ideas_count_id', 'count', 'id'),
+        Index('ix_ideas_normalized_title', 'normalized_title', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
+    # Dedup key from app.utils.ideas.idea_key; NULL only on rows not yet backfilled by the merge job
+    normalized_title = Column(String, nullable=True)
     count = Column(Integer, default=1)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -101,7 +154,17 @@ class TrustedContact(Base):
     user = relationship("User", back_populates="contacts")
 
 class CompanionAlert(Base):
+    """Outbox row: written by /api/companion/notify, delivered by app.utils.companion_outbox."""
     __tablename__ = "companion_alerts"
+    __table_args__ = (
+        # At most one open alert per key; sent/failed rows stay as throttle history
+        Index(
+            'ix_companion_alerts_open_dedupe', 'dedupe_key', unique=True,
+            postgresql_where=text("status IN ('pending', 'sending')"),
+        ),
+        Index('ix_companion_alerts_dedupe_sent', 'dedupe_key', 'sent_at'),
+        Index('ix_companion_alerts_status_next', 'status', 'next_attempt_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -111,6 +174,15 @@ class CompanionAlert(Base):
     frustration_count = Column(Integer, default=3)
     message = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Delivery state: pending -> sending -> sent | failed. Rows from before the outbox have NULL and are never sent.
+    # While 'sending', next_attempt_at is the claim's lease expiry.
+    status = Column(String, default="pending")
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    # (user, contact, guide, step); repeat taps fold into the open alert with the same key
+    dedupe_key = Column(String, nullable=True)
 
     user = relationship("User")
     contact = relationship("TrustedContact")
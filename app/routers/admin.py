@@ -1,12 +1,32 @@
+import logging
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from app.database import get_db
-from app.models import Guide, User, Idea, GuideStep, StepProblem
+from app.models import Guide, Idea, GuideStep, StepProblem, FraudScenario
+from app.utils.ai_utils import generate_guide_with_ai
+from app.utils.assets import register as register_assets
+from app.utils.help_cache import help_cache
+from app.utils.search import refresh_search_index
+from app.utils.guide_version import refresh_guide_version
+from app.utils.render_cache import render_cache
+from app.utils.catalog import guide_catalog
+from app.utils.sessions import session_backend
+from app.utils.user_cache import user_cache
+from app.utils.problem_rollup import worst_steps, remove_problem, delete_problems
+from app.utils.ideas import merge_duplicate_ideas, find_duplicate_ideas, merge_idea_clusters
+from app.utils.svg_store import collect_garbage, refresh_reference_counts
+from app.utils.scenario_pool import scenario_pool
+from app.utils.image_jobs import enqueue_step_images, needs_generated_image, get_job, list_jobs, PLACEHOLDER_IMAGE_URL
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 templates = Jinja2Templates(directory="app/templates")
+register_assets(templates)
 
 # Admin-only dependency
 def get_admin_user(request: Request):
@@ -15,35 +35,104 @@ def get_admin_user(request: Request):
         raise HTTPException(status_code=403, detail="Admin access required")
     return user
 
-from app.utils.ai_utils import generate_guide_with_ai
-
 @router.get("")
-async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
+async def admin_dashboard(request: Request):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         return RedirectResponse(url="/login", status_code=303)
     
-    # Sort guides by id desc to show newest first
-    guides = db.query(Guide).order_by(Guide.id.desc()).all()
-    ideas = db.query(Idea).order_by(Idea.count.desc()).all()
-    step_problems = db.query(StepProblem).order_by(StepProblem.id.desc()).all()
-    
+    # Panels load lazily from the /admin/api/* endpoints below
     return templates.TemplateResponse("admin_dashboard.html", {
         "request": request,
-        "user": user,
-        "guides": guides,
-        "ideas": ideas,
-        "step_problems": step_problems
+        "user": user
     })
 
+# --- Dashboard panel APIs (keyset-paginated) ---
+
+DASHBOARD_PAGE_SIZE = 20
+DASHBOARD_MAX_PAGE_SIZE = 100
+
+def _page_size(limit: int) -> int:
+    return max(1, min(limit or DASHBOARD_PAGE_SIZE, DASHBOARD_MAX_PAGE_SIZE))
+
+@router.get("/api/guides")
+async def admin_guides_page(request: Request, after_id: int = None, limit: int = DASHBOARD_PAGE_SIZE, db: AsyncSession = Depends(get_db)):
+    get_admin_user(request)
+    limit = _page_size(limit)
+    
+    # Newest first; cursor is the last id seen
+    query = select(Guide.id, Guide.title, Guide.status).order_by(Guide.id.desc()).limit(limit + 1)
+    if after_id:
+        query = query.where(Guide.id < after_id)
+    rows = (await db.execute(query)).all()
+    
+    items = [{"id": r.id, "title": r.title, "status": r.status} for r in rows[:limit]]
+    next_cursor = items[-1]["id"] if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/api/ideas")
+async def admin_ideas_page(request: Request, cursor: str = None, limit: int = DASHBOARD_PAGE_SIZE, db: AsyncSession = Depends(get_db)):
+    get_admin_user(request)
+    limit = _page_size(limit)
+    
+    # Most requested first; cursor is "<count>:<id>" of the last row seen
+    query = select(Idea.id, Idea.title, Idea.count).order_by(Idea.count.desc(), Idea.id.desc()).limit(limit + 1)
+    if cursor:
+        try:
+            last_count, last_id = (int(part) for part in cursor.split(":", 1))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(tuple_(Idea.count, Idea.id) < tuple_(last_count, last_id))
+    rows = (await db.execute(query)).all()
+    
+    items = [{"id": r.id, "title": r.title, "count": r.count} for r in rows[:limit]]
+    next_cursor = f"{items[-1]['count']}:{items[-1]['id']}" if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/api/problems/heatmap")
+async def admin_problem_heatmap(request: Request, limit: int = DASHBOARD_MAX_PAGE_SIZE, db: AsyncSession = Depends(get_db)):
+    get_admin_user(request)
+    
+    # One row per (guide, step) instead of one per report
+    count = func.count(StepProblem.id).label("count")
+    query = (
+        select(StepProblem.guide_id, Guide.title, StepProblem.step_number, count,
+               func.max(StepProblem.created_at).label("last_reported"))
+        .join(Guide, Guide.id == StepProblem.guide_id, isouter=True)
+        .group_by(StepProblem.guide_id, Guide.title, StepProblem.step_number)
+        .order_by(count.desc(), StepProblem.guide_id, StepProblem.step_number)
+        .limit(_page_size(limit))
+    )
+    rows = (await db.execute(query)).all()
+    
+    return {
+        "items": [
+            {
+                "guide_id": r.guide_id,
+                "guide_title": r.title or "Silinmiş Rehber",
+                "step_number": r.step_number,
+                "count": r.count,
+                "last_reported": r.last_reported.isoformat() if r.last_reported else None
+            } for r in rows
+        ]
+    }
+
+@router.get("/api/analytics/worst-steps")
+async def admin_worst_steps(request: Request, days: int = 7, limit: int = 10, db: AsyncSession = Depends(get_db)):
+    get_admin_user(request)
+    
+    # Served from the daily rollup, so cost does not grow with raw step_problems rows
+    days = max(1, min(days, 365))
+    return {"days": days, "items": await worst_steps(db, days=days, limit=_page_size(limit))}
+
 @router.post("/generate")
-async def generate_guide(request: Request, prompt: str = Form(...), db: Session = Depends(get_db)):
+async def generate_guide(request: Request, prompt: str = Form(...), db: AsyncSession = Depends(get_db)):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     import json
-    generated = generate_guide_with_ai(prompt)
+    generated = await generate_guide_with_ai(prompt)
     return {
         "success": True,
         "title": generated["title"],
@@ -68,7 +157,7 @@ async def create_guide(
     step_numbers: list[int] = Form(None),
     help_options: str = Form(None), # JSON string
     generate_ai_images: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
@@ -76,20 +165,20 @@ async def create_guide(
     
     guide = Guide(title=title, content=content, status=status, image_url=image_url, priority=priority, help_options=help_options)
     db.add(guide)
-    db.commit()
-    db.refresh(guide)
+    await db.commit()
+    await db.refresh(guide)
 
     # Handle steps
+    pending_images = []
+    image_urls = [image_url]
     if step_titles:
         for i in range(len(step_titles)):
             img_url = step_images[i] if step_images and step_images[i] else None
             
-            # Automate image generation if missing AND toggle is ON
-            if not img_url and generate_ai_images == "true":
-                from app.utils.ai_utils import generate_step_image
-                generated_url = generate_step_image(title, step_titles[i], step_descriptions[i] if step_descriptions else "")
-                if generated_url:
-                    img_url = generated_url
+            # Queue image generation if missing AND toggle is ON; show a placeholder meanwhile
+            wants_image = not img_url and generate_ai_images == "true"
+            if wants_image:
+                img_url = PLACEHOLDER_IMAGE_URL
 
             step = GuideStep(
                 guide_id=guide.id,
@@ -99,8 +188,20 @@ async def create_guide(
                 image_url=img_url
             )
             db.add(step)
-        db.commit()
+            image_urls.append(img_url)
+            if wants_image:
+                pending_images.append(step)
+
+    await refresh_search_index(db, guide.id)
+    await refresh_guide_version(db, guide.id)
+    await refresh_reference_counts(db, image_urls)
+    await db.commit()
+    guide_catalog.invalidate()
+    render_cache.invalidate()
     
+    if pending_images:
+        job_id = enqueue_step_images(guide.id, title, pending_images)
+        return RedirectResponse(url=f"/admin?image_job={job_id}", status_code=303)
     return RedirectResponse(url="/admin", status_code=303)
 
 @router.post("/guides/create_structured")
@@ -111,10 +212,9 @@ async def create_structured_guide(
     help_options_json: str = Form(None),
     status: str = Form("published"),
     generate_ai_images: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     import json
-    from app.utils.ai_utils import generate_step_image
     
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
@@ -125,22 +225,16 @@ async def create_structured_guide(
     db.add(guide)
     
     # Create the steps
+    pending_images = []
     try:
         steps = json.loads(steps_json)
         
         for s in steps:
-            # Automate image generation if image_url is missing or a generic placeholder
             img_url = s.get("image_url")
-            print(f"DEBUG ADMIN: Processing step '{s['title']}', current img: {img_url}")
-            # Automate image generation if image_url is missing or a generic placeholder AND toggle is ON
-            if (not img_url or "static/img/ui_" in img_url) and generate_ai_images == "true":
-                print(f"DEBUG ADMIN: Triggering image generation for '{s['title']}'...")
-                generated_url = generate_step_image(title, s["title"], s["description"])
-                if generated_url:
-                    print(f"DEBUG ADMIN: Generation SUCCESS: {generated_url}")
-                    img_url = generated_url
-                else:
-                    print(f"DEBUG ADMIN: Generation FAILED for '{s['title']}', keeping placeholder.")
+            # Queue image generation if image_url is missing or a generic placeholder AND toggle is ON
+            wants_image = needs_generated_image(img_url) and generate_ai_images == "true"
+            if wants_image and not img_url:
+                img_url = PLACEHOLDER_IMAGE_URL
 
             step = GuideStep(
                 step_number=s["step_number"],
@@ -149,13 +243,25 @@ async def create_structured_guide(
                 image_url=img_url
             )
             guide.steps.append(step)
+            if wants_image:
+                pending_images.append(step)
         
-        db.commit()
+        await db.flush()
+        await refresh_search_index(db, guide.id)
+        await refresh_guide_version(db, guide.id)
+        await refresh_reference_counts(db, [s.image_url for s in guide.steps])
+        await db.commit()
+        guide_catalog.invalidate()
+        render_cache.invalidate()
     except Exception as e:
         import logging
         logging.error(f"Structured Creation Failed: {e}")
-        db.rollback()
+        await db.rollback()
+        pending_images = []
     
+    if pending_images:
+        job_id = enqueue_step_images(guide.id, title, pending_images)
+        return RedirectResponse(url=f"/admin?image_job={job_id}", status_code=303)
     return RedirectResponse(url="/admin", status_code=303)
 
 @router.get("/guides/new")
@@ -172,12 +278,15 @@ async def new_guide_form(request: Request):
     })
 
 @router.get("/guides/{guide_id}/edit")
-async def edit_guide_form(request: Request, guide_id: int, db: Session = Depends(get_db)):
+async def edit_guide_form(request: Request, guide_id: int, db: AsyncSession = Depends(get_db)):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         return RedirectResponse(url="/login", status_code=303)
     
-    guide = db.query(Guide).filter(Guide.id == guide_id).first()
+    result = await db.execute(
+        select(Guide).options(selectinload(Guide.steps)).where(Guide.id == guide_id)
+    )
+    guide = result.scalars().first()
     if not guide:
         raise HTTPException(status_code=404, detail="Guide not found")
     
@@ -203,16 +312,21 @@ async def update_guide(
     step_images: list[str] = Form(None),
     step_numbers: list[int] = Form(None),
     generate_ai_images: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    guide = db.query(Guide).filter(Guide.id == guide_id).first()
+    result = await db.execute(
+        select(Guide).options(selectinload(Guide.steps)).where(Guide.id == guide_id)
+    )
+    guide = result.scalars().first()
     if not guide:
         raise HTTPException(status_code=404, detail="Guide not found")
 
+    # Images this edit may stop using; their reference counts are refreshed with the new ones
+    image_urls = [guide.image_url, image_url] + [s.image_url for s in guide.steps]
     guide.title = title
     guide.content = content
     guide.status = status
@@ -221,18 +335,17 @@ async def update_guide(
     guide.help_options = help_options
 
     # Update steps - ONLY if new steps are provided
+    pending_images = []
     if step_titles:
-        db.query(GuideStep).filter(GuideStep.guide_id == guide_id).delete()
+        await db.execute(delete(GuideStep).where(GuideStep.guide_id == guide_id))
         
         for i in range(len(step_titles)):
             img_url = step_images[i] if step_images and step_images[i] else None
             
-            # Automate image generation if toggle is ON
-            if not img_url and generate_ai_images == "true":
-                from app.utils.ai_utils import generate_step_image
-                generated_url = generate_step_image(title, step_titles[i], step_descriptions[i] if step_descriptions else "")
-                if generated_url:
-                    img_url = generated_url
+            # Queue image generation if toggle is ON; show a placeholder meanwhile
+            wants_image = not img_url and generate_ai_images == "true"
+            if wants_image:
+                img_url = PLACEHOLDER_IMAGE_URL
 
             step = GuideStep(
                 guide_id=guide.id,
@@ -242,45 +355,124 @@ async def update_guide(
                 image_url=img_url
             )
             db.add(step)
+            image_urls.append(img_url)
+            if wants_image:
+                pending_images.append(step)
     else:
-        print("DEBUG: No new steps provided, preserving existing steps.")
+        logger.info(f"Guide {guide.id} updated without steps; keeping the existing ones")
     
-    db.commit()
+    # Cached help answers were written against the old title/steps
+    await help_cache.invalidate_guide(db, guide.id)
+    await refresh_search_index(db, guide.id)
+    await refresh_guide_version(db, guide.id)
+    await refresh_reference_counts(db, image_urls)
+    await db.commit()
+    guide_catalog.invalidate()
+    render_cache.invalidate()
+
+    if pending_images:
+        job_id = enqueue_step_images(guide.id, title, pending_images)
+        return RedirectResponse(url=f"/admin?image_job={job_id}", status_code=303)
     return RedirectResponse(url="/admin", status_code=303)
 
+@router.post("/svgs/gc")
+async def collect_svg_garbage(request: Request):
+    get_admin_user(request)
+    
+    result = await collect_garbage()
+    return {"success": True, **result}
+
+@router.get("/jobs")
+async def image_jobs(request: Request):
+    get_admin_user(request)
+    return {"jobs": list_jobs()}
+
+@router.get("/jobs/{job_id}")
+async def image_job_status(request: Request, job_id: str):
+    get_admin_user(request)
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @router.post("/guides/{guide_id}/delete")
-async def delete_guide(request: Request, guide_id: int, db: Session = Depends(get_db)):
+async def delete_guide(request: Request, guide_id: int, db: AsyncSession = Depends(get_db)):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    guide = db.query(Guide).filter(Guide.id == guide_id).first()
+    result = await db.execute(
+        select(Guide).options(selectinload(Guide.steps)).where(Guide.id == guide_id)
+    )
+    guide = result.scalars().first()
     if guide:
-        db.delete(guide)
-        db.commit()
+        image_urls = [guide.image_url] + [s.image_url for s in guide.steps]
+        await help_cache.invalidate_guide(db, guide.id)
+        await db.delete(guide)
+        await refresh_reference_counts(db, image_urls)
+        await db.commit()
+        guide_catalog.invalidate()
+        render_cache.invalidate()
     
     return {"success": True}
 
+@router.get("/api/ideas/duplicates")
+async def admin_idea_duplicates(request: Request):
+    get_admin_user(request)
+    
+    # Loose matches are only suggestions; POST /admin/ideas/merge with the confirmed clusters
+    clusters = await find_duplicate_ideas()
+    return {"clusters": [[{"id": i, "title": title, "count": count} for i, title, count in c] for c in clusters]}
+
+@router.post("/ideas/merge")
+async def merge_ideas(request: Request):
+    get_admin_user(request)
+    
+    # {"clusters": [[keep_id, duplicate_id, ...], ...]} merges what the admin confirmed;
+    # without a body only near-identical requests are merged, as in the hourly job
+    data = await request.json() if await request.body() else {}
+    clusters = data.get("clusters") if isinstance(data, dict) else None
+    if clusters is None:
+        removed = await merge_duplicate_ideas()
+    else:
+        try:
+            clusters = [[int(i) for i in c] for c in clusters if isinstance(c, list)]
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="clusters must be lists of idea ids")
+        removed = await merge_idea_clusters(clusters)
+    return {"success": True, "merged": removed}
+
 @router.post("/ideas/{idea_id}/delete")
-async def delete_idea(idea_id: int, request: Request, db: Session = Depends(get_db)):
+async def delete_idea(idea_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         return RedirectResponse(url="/login", status_code=303)
     
-    idea = db.query(Idea).filter(Idea.id == idea_id).first()
+    idea = await db.get(Idea, idea_id)
     if idea:
-        db.delete(idea)
-        db.commit()
+        await db.delete(idea)
+        await db.commit()
     
     return {"success": True}
 
+@router.post("/users/{user_id}/revoke-sessions")
+async def revoke_user_sessions(user_id: int, request: Request):
+    get_admin_user(request)
+    
+    revoked = await session_backend.revoke_user(user_id)
+    user_cache.invalidate(user_id)
+    return {"success": True, "revoked": revoked}
+
 @router.get("/guides/{guide_id}/test")
-async def test_guide(request: Request, guide_id: int, db: Session = Depends(get_db)):
+async def test_guide(request: Request, guide_id: int, db: AsyncSession = Depends(get_db)):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         return RedirectResponse(url="/login", status_code=303)
     
-    guide = db.query(Guide).filter(Guide.id == guide_id).first()
+    result = await db.execute(
+        select(Guide).options(selectinload(Guide.steps)).where(Guide.id == guide_id)
+    )
+    guide = result.scalars().first()
     if not guide:
         raise HTTPException(status_code=404, detail="Guide not found")
     
@@ -291,40 +483,55 @@ async def test_guide(request: Request, guide_id: int, db: Session = Depends(get_
     })
 
 @router.post("/problems/{problem_id}/delete")
-async def delete_problem(problem_id: int, request: Request, db: Session = Depends(get_db)):
+async def delete_problem(problem_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         return RedirectResponse(url="/login", status_code=303)
     
-    problem = db.query(StepProblem).filter(StepProblem.id == problem_id).first()
+    problem = await db.get(StepProblem, problem_id)
     if problem:
-        db.delete(problem)
-        db.commit()
+        await remove_problem(db, problem)
+        await db.commit()
+    
+    return {"success": True}
+
+@router.post("/problems/clear-step")
+async def clear_step_problems(request: Request, db: AsyncSession = Depends(get_db)):
+    user = request.session.get("user")
+    if not user or user.get("role") != "admin":
+        return RedirectResponse(url="/login", status_code=303)
+    
+    data = await request.json()
+    guide_id = data.get("guide_id")
+    step_number = data.get("step_number")
+    if not guide_id or not step_number:
+        return {"success": False, "error": "guide_id and step_number required"}
+    
+    await delete_problems(db, guide_id, step_number)
+    await db.commit()
     
     return {"success": True}
 
 @router.post("/problems/clear")
-async def clear_problems(request: Request, db: Session = Depends(get_db)):
+async def clear_problems(request: Request, db: AsyncSession = Depends(get_db)):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         return RedirectResponse(url="/login", status_code=303)
     
-    db.query(StepProblem).delete()
-    db.commit()
+    await delete_problems(db)
+    await db.commit()
     
     return {"success": True}
 
 # --- Fraud Scenario Management ---
 
-from app.models import FraudScenario
-
 @router.get("/scenarios")
-async def admin_scenarios(request: Request, db: Session = Depends(get_db)):
+async def admin_scenarios(request: Request, db: AsyncSession = Depends(get_db)):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         return RedirectResponse(url="/login", status_code=303)
     
-    scenarios = db.query(FraudScenario).order_by(FraudScenario.id.desc()).all()
+    scenarios = (await db.execute(select(FraudScenario).order_by(FraudScenario.id.desc()))).scalars().all()
     
     return templates.TemplateResponse("admin_scenarios.html", {
         "request": request,
@@ -339,7 +546,7 @@ async def create_scenario(
     correct_action: str = Form(...),
     explanation: str = Form(...),
     difficulty: int = Form(1),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
@@ -352,19 +559,21 @@ async def create_scenario(
         difficulty=difficulty
     )
     db.add(new_scenario)
-    db.commit()
+    await db.commit()
+    scenario_pool.invalidate()
     
     return RedirectResponse(url="/admin/scenarios", status_code=303)
 
 @router.post("/scenarios/{scenario_id}/delete")
-async def delete_scenario(scenario_id: int, request: Request, db: Session = Depends(get_db)):
+async def delete_scenario(scenario_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     user = request.session.get("user")
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    scenario = db.query(FraudScenario).filter(FraudScenario.id == scenario_id).first()
+    scenario = await db.get(FraudScenario, scenario_id)
     if scenario:
-        db.delete(scenario)
-        db.commit()
+        await db.delete(scenario)
+        await db.commit()
+        scenario_pool.invalidate()
     
     return {"success": True}
@@ -1,34 +1,44 @@
-import bcrypt
+import logging
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.models import User
+from app.utils.passwords import hash_password, verify_password, needs_rehash
+from app.utils.assets import register as register_assets
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
-
-def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
-def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+register_assets(templates)
 
 @router.get("/login")
 async def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 @router.post("/login")
-async def login(request: Request, email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == email).first()
+async def login(request: Request, email: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalars().first()
     
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await verify_password(password, user.hashed_password):
         return templates.TemplateResponse("login.html", {
             "request": request,
             "error": "Geçersiz e-posta veya şifre"
         })
     
+    if needs_rehash(user.hashed_password):
+        # Cost factor changed since this hash was made; upgrade it while we have the plain password
+        try:
+            user.hashed_password = await hash_password(password)
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Password rehash failed for user {user.id}: {e}")
+            await db.rollback()
+    
     request.session["user"] = {
         "name": user.name, 
         "email": user.email, 
@@ -43,25 +53,26 @@ async def register_page(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
 @router.post("/register")
-async def register(request: Request, name: str = Form(...), email: str = Form(...), password: str = Form(...), confirm_password: str = Form(...), db: Session = Depends(get_db)):
+async def register(request: Request, name: str = Form(...), email: str = Form(...), password: str = Form(...), confirm_password: str = Form(...), db: AsyncSession = Depends(get_db)):
     if password != confirm_password:
          return templates.TemplateResponse("register.html", {
             "request": request,
             "error": "Şifreler eşleşmiyor"
         })
 
-    user = db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalars().first()
     if user:
         return templates.TemplateResponse("register.html", {
             "request": request,
             "error": "Bu e-posta adresi zaten kayıtlı"
         })
     
-    hashed_password = get_password_hash(password)
+    hashed_password = await hash_password(password)
     new_user = User(email=email, name=name, hashed_password=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     request.session["user"] = {
         "name": new_user.name, 
@@ -74,4 +85,7 @@ async def register(request: Request, name: str = Form(...), email: str = Form(..
 @router.get("/logout")
 async def logout(request: Request):
     request.session.clear()
-    return RedirectResponse(url="/", status_code=303)
+    response = RedirectResponse(url="/", status_code=303)
+    # Pages the browser cached while signed in carry the user's name; the service worker clears its own caches
+    response.headers["Clear-Site-Data"] = '"cache"'
+    return response
@@ -1,72 +1,158 @@
+import json
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Request, Depends, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, FileResponse, JSONResponse, Response, HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import Guide, Idea, StepProblem, User, UserGuideProgress, TrustedContact, CompanionAlert
-from app.utils.ai_utils import get_calming_guidance, get_ai_help_response, generate_fraud_scenario
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, joinedload
+from app.database import get_db, AsyncSessionLocal
+from app.models import Guide, UserGuideProgress, TrustedContact
+from app.utils.ai_utils import get_ai_help_response, stream_ai_help_response, HELP_UNAVAILABLE_MESSAGE, HELP_ERROR_MESSAGE, OFFLINE_FRAUD_SCENARIO
+from app.utils.help_cache import help_cache
+from app.utils.search import search_guides
+from app.utils.catalog import guide_catalog
+from app.utils.progress_buffer import progress_buffer, upsert_progress_stmt
+from app.utils.scenario_pool import scenario_pool
+from app.utils.user_cache import user_cache
+from app.utils.problem_rollup import record_problem
+from app.utils.ideas import record_idea, idea_key
 from app.utils.companion import format_companion_message
+from app.utils.companion_outbox import queue_alert, companion_dispatcher
+from app.utils.offline import get_offline_manifest
+from app.utils.guide_version import guide_content_hash, page_etag, validator_headers, etag_matches
+from app.utils.render_cache import render_cache
+from app.utils.prompt_builder import guide_contexts
+from app.utils.assets import register as register_assets, asset_manifest
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
+register_assets(templates)
 
 @router.get("/offline")
 async def offline_page(request: Request):
     return templates.TemplateResponse("offline.html", {"request": request})
 
+@router.get("/sw.js")
+async def service_worker():
+    # Served from the root so its scope covers every page, not just /static/
+    return FileResponse("app/static/sw.js", media_type="application/javascript", headers={"Cache-Control": "no-cache"})
+
+@router.get("/api/offline-manifest")
+async def offline_manifest(request: Request):
+    manifest = await get_offline_manifest()
+    etag = f'"{manifest["version"]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(manifest, headers=headers)
+
 @router.get("/")
-async def home(request: Request, db: Session = Depends(get_db)):
-    guides = db.query(Guide).limit(6).all()
+async def home(request: Request, db: AsyncSession = Depends(get_db)):
+    catalog = await guide_catalog.get()
+    guides = catalog.guides[:6]
     
     user_session = request.session.get("user")
     user_id = user_session.get("id") if user_session else None
     
     user = None
     if user_id:
-        user = db.query(User).filter(User.id == user_id).first()
-        
-    return templates.TemplateResponse("index.html", {"request": request, "guides": guides, "user": user})
-
-@router.get("/guide/{guide_id}")
-async def guide_page(request: Request, guide_id: int, db: Session = Depends(get_db)):
-    guide = db.query(Guide).filter(Guide.id == guide_id).first()
+        user = await user_cache.get(db, user_id)
+
+    # Keyed by the cards shown, so edits picked up by another worker's catalog refresh re-render too
+    key = tuple((g.id, g.content_hash) for g in guides)
+    html = render_cache.render(templates, "index.html", {"request": request, "guides": guides}, key, user)
+    return HTMLResponse(html)
+
+async def _load_guide(db: AsyncSession, guide_id: int):
+    """(guide, content_hash, last_modified) from the catalog, or the database for drafts. 404 if missing."""
+    guide = await guide_catalog.get_guide(guide_id)
+    if guide:
+        return guide, guide.content_hash, guide.updated_at
+
+    # Not in the published catalog (e.g. a draft) - read it directly
+    result = await db.execute(
+        select(Guide).options(selectinload(Guide.steps)).where(Guide.id == guide_id)
+    )
+    guide = result.scalars().first()
     if not guide:
         raise HTTPException(status_code=404, detail="Guide not found")
+    return guide, guide.content_hash or guide_content_hash(guide, guide.steps), guide.updated_at or guide.created_at
+
+@router.get("/guide/{guide_id}")
+async def guide_page(request: Request, guide_id: int, db: AsyncSession = Depends(get_db)):
+    guide, content_hash, last_modified = await _load_guide(db, guide_id)
+    user = request.session.get("user")
+
+    headers = validator_headers(page_etag(content_hash, user), last_modified)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
     
-    return templates.TemplateResponse("guide.html", {
+    html = render_cache.render(templates, "guide.html", {
         "request": request, 
         "guide": guide,
         "steps": guide.steps,
         "title": guide.title,
-        "user": request.session.get("user")
-    })
+    }, (guide_id, content_hash), user)
+    return HTMLResponse(html, headers=headers)
+
+@router.get("/api/guides/{guide_id}")
+async def guide_api(request: Request, guide_id: int, db: AsyncSession = Depends(get_db)):
+    guide, content_hash, last_modified = await _load_guide(db, guide_id)
+
+    headers = validator_headers(f'"{content_hash}"', last_modified)
+    headers.pop("Vary")  # same JSON for every viewer
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        help_options = json.loads(guide.help_options) if guide.help_options else []
+    except ValueError:
+        help_options = []
+    return JSONResponse({
+        "id": guide.id,
+        "title": guide.title,
+        "content": guide.content,
+        "status": guide.status,
+        "image_url": guide.image_url,
+        "help_options": help_options,
+        "version": content_hash,
+        "updated_at": last_modified.isoformat() if last_modified else None,
+        "steps": [
+            {"step_number": s.step_number, "title": s.title, "description": s.description, "image_url": s.image_url}
+            for s in guide.steps
+        ],
+    }, headers=headers)
 
 @router.get("/profile")
-async def profile_page(request: Request, db: Session = Depends(get_db)):
+async def profile_page(request: Request, db: AsyncSession = Depends(get_db)):
     user_session = request.session.get("user")
     if not user_session:
         return RedirectResponse(url="/login", status_code=303)
     
     user_id = user_session.get("id")
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await user_cache.get(db, user_id)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
 
-    # Get all progress records for this user
-    all_progress = db.query(UserGuideProgress).filter(
-        UserGuideProgress.user_id == user_id
-    ).all()
+    # Get all progress records for this user (guide is rendered per row, so join it in)
+    result = await db.execute(
+        select(UserGuideProgress)
+        .options(joinedload(UserGuideProgress.guide))
+        .where(UserGuideProgress.user_id == user_id)
+    )
+    all_progress = result.scalars().all()
 
     completed_progress = [p for p in all_progress if p.completed]
     in_progress = [p for p in all_progress if not p.completed]
 
     # Get guides user hasn't started
     started_guide_ids = [p.guide_id for p in all_progress]
-    available_query = db.query(Guide).filter(Guide.status == "published")
+    available_query = select(Guide).where(Guide.status == "published")
     if started_guide_ids:
-        available_query = available_query.filter(~Guide.id.in_(started_guide_ids))
-    available_guides = available_query.order_by(Guide.priority.desc()).all()
+        available_query = available_query.where(~Guide.id.in_(started_guide_ids))
+    result = await db.execute(available_query.order_by(Guide.priority.desc()))
+    available_guides = result.scalars().all()
 
     # Calculate weekly streak (guides completed in the last 7 days)
     week_ago = datetime.now(timezone.utc) - timedelta(days=7)
@@ -85,43 +171,52 @@ async def profile_page(request: Request, db: Session = Depends(get_db)):
         "total_completed": len(completed_progress),
     })
 
+def _parse_progress_update(data: dict):
+    """Returns (guide_id, current_step, total_steps) or None if guide_id is missing/invalid."""
+    try:
+        guide_id = int(data.get("guide_id") or 0)
+        current_step = int(data.get("current_step", 1))
+        total_steps = int(data.get("total_steps", 1))
+    except (TypeError, ValueError):
+        return None
+    if not guide_id:
+        return None
+    return guide_id, current_step, total_steps
+
 @router.post("/api/progress/save")
-async def save_progress(request: Request, db: Session = Depends(get_db)):
+async def save_progress(request: Request):
     user_session = request.session.get("user")
     if not user_session:
         return {"success": False, "error": "Not logged in"}
     
     data = await request.json()
-    guide_id = data.get("guide_id")
-    current_step = data.get("current_step", 1)
-    total_steps = data.get("total_steps", 1)
-
-    if not guide_id:
+    update = _parse_progress_update(data)
+    if not update:
         return {"success": False, "error": "guide_id required"}
 
-    user_id = user_session.get("id")
-    progress = db.query(UserGuideProgress).filter(
-        UserGuideProgress.user_id == user_id,
-        UserGuideProgress.guide_id == guide_id
-    ).first()
+    # Buffered; the flusher writes the latest step per (user, guide) as one upsert
+    progress_buffer.add(user_session.get("id"), *update)
+    return {"success": True}
 
-    if progress:
-        progress.current_step = current_step
-        progress.total_steps = total_steps
-    else:
-        progress = UserGuideProgress(
-            user_id=user_id,
-            guide_id=guide_id,
-            current_step=current_step,
-            total_steps=total_steps
-        )
-        db.add(progress)
+@router.post("/api/progress/batch")
+async def save_progress_batch(request: Request):
+    user_session = request.session.get("user")
+    if not user_session:
+        return {"success": False, "error": "Not logged in"}
 
-    db.commit()
-    return {"success": True}
+    data = await request.json()
+    updates = data.get("updates") or []
+    accepted = 0
+    for item in updates:
+        update = _parse_progress_update(item) if isinstance(item, dict) else None
+        if update:
+            progress_buffer.add(user_session.get("id"), *update)
+            accepted += 1
+
+    return {"success": True, "accepted": accepted, "rejected": len(updates) - accepted}
 
 @router.post("/api/progress/complete")
-async def complete_progress(request: Request, db: Session = Depends(get_db)):
+async def complete_progress(request: Request, db: AsyncSession = Depends(get_db)):
     user_session = request.session.get("user")
     if not user_session:
         return {"success": False, "error": "Not logged in"}
@@ -131,38 +226,42 @@ async def complete_progress(request: Request, db: Session = Depends(get_db)):
     if not guide_id:
         return {"success": False, "error": "guide_id required"}
 
-    user_id = user_session.get("id")
-    progress = db.query(UserGuideProgress).filter(
-        UserGuideProgress.user_id == user_id,
-        UserGuideProgress.guide_id == guide_id
-    ).first()
-
-    if progress:
-        progress.completed = True
-        progress.completed_at = datetime.now(timezone.utc)
-    else:
-        progress = UserGuideProgress(
-            user_id=user_id,
-            guide_id=guide_id,
-            completed=True,
-            completed_at=datetime.now(timezone.utc)
-        )
-        db.add(progress)
-
-    db.commit()
+    await db.execute(upsert_progress_stmt(
+        [{
+            "user_id": user_session.get("id"),
+            "guide_id": guide_id,
+            "completed": True,
+            "completed_at": datetime.now(timezone.utc)
+        }],
+        ("completed", "completed_at")
+    ))
+    await db.commit()
     return {"success": True}
 
 @router.get("/api/progress/{guide_id}")
-async def get_progress(request: Request, guide_id: int, db: Session = Depends(get_db)):
+async def get_progress(request: Request, guide_id: int, db: AsyncSession = Depends(get_db)):
     user_session = request.session.get("user")
     if not user_session:
         return {"success": False, "logged_in": False}
     
     user_id = user_session.get("id")
-    progress = db.query(UserGuideProgress).filter(
-        UserGuideProgress.user_id == user_id,
-        UserGuideProgress.guide_id == guide_id
-    ).first()
+    result = await db.execute(
+        select(UserGuideProgress).where(
+            UserGuideProgress.user_id == user_id,
+            UserGuideProgress.guide_id == guide_id
+        )
+    )
+    progress = result.scalars().first()
+
+    # An unflushed save is newer than whatever the table holds
+    pending = progress_buffer.pending(user_id, guide_id)
+    if pending:
+        return {
+            "success": True,
+            "current_step": pending[0],
+            "total_steps": pending[1],
+            "completed": progress.completed if progress else False
+        }
 
     if progress:
         return {
@@ -174,8 +273,9 @@ async def get_progress(request: Request, guide_id: int, db: Session = Depends(ge
     return {"success": True, "current_step": None}
 
 @router.get("/search")
-async def search_page(request: Request, db: Session = Depends(get_db)):
-    guides = db.query(Guide).filter(Guide.status == "published").order_by(Guide.priority.desc(), Guide.id).limit(5).all()
+async def search_page(request: Request, db: AsyncSession = Depends(get_db)):
+    catalog = await guide_catalog.get()
+    guides = catalog.guides[:5]
     return templates.TemplateResponse("search.html", {
         "request": request, 
         "user": request.session.get("user"),
@@ -184,45 +284,43 @@ async def search_page(request: Request, db: Session = Depends(get_db)):
 
 
 @router.get("/api/search")
-async def search_api(q: str, db: Session = Depends(get_db)):
+async def search_api(q: str, db: AsyncSession = Depends(get_db)):
     if not q:
         return []
 
-    guides = db.query(Guide).filter(
-        (Guide.title.ilike(f"%{q}%")) | (Guide.content.ilike(f"%{q}%"))
-    ).order_by(Guide.priority.desc(), Guide.id).limit(10).all()
+    guides = await search_guides(db, q, limit=10, published_only=False)
 
-    return [{"id": g.id, "title": g.title, "content": g.content, "image_url": g.image_url} for g in guides]
+    return [
+        {"id": g.id, "title": g.title, "content": g.content, "image_url": g.image_url, "image_srcset": asset_manifest.srcset(g.image_url)}
+        for g in guides
+    ]
 
 @router.post("/api/ideas/create")
-async def create_idea(request: Request, db: Session = Depends(get_db)):
+async def create_idea(request: Request, db: AsyncSession = Depends(get_db)):
     data = await request.json()
-    title = data.get("title")
-    if not title:
+    title = (data.get("title") or "").strip()
+    if not idea_key(title):
         return {"success": False, "error": "Title required"}
     
-    idea = db.query(Idea).filter(Idea.title == title).first()
-    if idea:
-        idea.count += 1
-    else:
-        idea = Idea(title=title)
-        db.add(idea)
-    
-    db.commit()
+    await record_idea(db, title)
+    await db.commit()
     return {"success": True}
 
 # ===== Companion Mode (Refakatçi Modu) =====
 
 @router.get("/api/contacts")
-async def list_contacts(request: Request, db: Session = Depends(get_db)):
+async def list_contacts(request: Request, db: AsyncSession = Depends(get_db)):
     user_session = request.session.get("user")
     if not user_session:
         return {"success": False, "error": "Not logged in"}
 
-    contacts = db.query(TrustedContact).filter(
-        TrustedContact.user_id == user_session["id"],
-        TrustedContact.is_active == True
-    ).order_by(TrustedContact.created_at).all()
+    result = await db.execute(
+        select(TrustedContact).where(
+            TrustedContact.user_id == user_session["id"],
+            TrustedContact.is_active == True
+        ).order_by(TrustedContact.created_at)
+    )
+    contacts = result.scalars().all()
 
     return {
         "success": True,
@@ -237,7 +335,7 @@ async def list_contacts(request: Request, db: Session = Depends(get_db)):
     }
 
 @router.post("/api/contacts")
-async def add_contact(request: Request, db: Session = Depends(get_db)):
+async def add_contact(request: Request, db: AsyncSession = Depends(get_db)):
     user_session = request.session.get("user")
     if not user_session:
         return {"success": False, "error": "Not logged in"}
@@ -251,10 +349,12 @@ async def add_contact(request: Request, db: Session = Depends(get_db)):
         return {"success": False, "error": "İsim ve telefon zorunludur"}
 
     # Max 3 contacts
-    existing_count = db.query(TrustedContact).filter(
-        TrustedContact.user_id == user_session["id"],
-        TrustedContact.is_active == True
-    ).count()
+    existing_count = await db.scalar(
+        select(func.count(TrustedContact.id)).where(
+            TrustedContact.user_id == user_session["id"],
+            TrustedContact.is_active == True
+        )
+    )
 
     if existing_count >= 3:
         return {"success": False, "error": "En fazla 3 güvenilir kişi ekleyebilirsiniz"}
@@ -266,7 +366,7 @@ async def add_contact(request: Request, db: Session = Depends(get_db)):
         relationship_label=relationship_label
     )
     db.add(contact)
-    db.commit()
+    await db.commit()
 
     return {
         "success": True,
@@ -279,33 +379,39 @@ async def add_contact(request: Request, db: Session = Depends(get_db)):
     }
 
 @router.delete("/api/contacts/{contact_id}")
-async def delete_contact(request: Request, contact_id: int, db: Session = Depends(get_db)):
+async def delete_contact(request: Request, contact_id: int, db: AsyncSession = Depends(get_db)):
     user_session = request.session.get("user")
     if not user_session:
         return {"success": False, "error": "Not logged in"}
 
-    contact = db.query(TrustedContact).filter(
-        TrustedContact.id == contact_id,
-        TrustedContact.user_id == user_session["id"]
-    ).first()
+    result = await db.execute(
+        select(TrustedContact).where(
+            TrustedContact.id == contact_id,
+            TrustedContact.user_id == user_session["id"]
+        )
+    )
+    contact = result.scalars().first()
 
     if not contact:
         return {"success": False, "error": "Kişi bulunamadı"}
 
     contact.is_active = False
-    db.commit()
+    await db.commit()
     return {"success": True}
 
 @router.post("/api/companion/notify")
-async def companion_notify(request: Request, db: Session = Depends(get_db)):
+async def companion_notify(request: Request, db: AsyncSession = Depends(get_db)):
     user_session = request.session.get("user")
     if not user_session:
         return {"success": False, "error": "Not logged in"}
 
     data = await request.json()
-    guide_id = data.get("guide_id")
-    step_number = data.get("step_number", 1)
-    frustration_count = data.get("frustration_count", 3)
+    try:
+        guide_id = int(data["guide_id"]) if data.get("guide_id") else None
+        step_number = int(data.get("step_number", 1))
+        frustration_count = int(data.get("frustration_count", 3))
+    except (TypeError, ValueError):
+        return {"success": False, "error": "Invalid data"}
 
     user_id = user_session["id"]
     user_name = user_session.get("name", "Kullanıcı")
@@ -313,35 +419,31 @@ async def companion_notify(request: Request, db: Session = Depends(get_db)):
     # Get guide title
     guide_title = "Bilinmeyen Rehber"
     if guide_id:
-        guide = db.query(Guide).filter(Guide.id == guide_id).first()
+        guide = await db.get(Guide, guide_id)
         if guide:
             guide_title = guide.title
 
     # Get active contacts
-    contacts = db.query(TrustedContact).filter(
-        TrustedContact.user_id == user_id,
-        TrustedContact.is_active == True
-    ).all()
+    result = await db.execute(
+        select(TrustedContact).where(
+            TrustedContact.user_id == user_id,
+            TrustedContact.is_active == True
+        )
+    )
+    contacts = result.scalars().all()
 
     if not contacts:
         return {"success": False, "error": "Güvenilir kişi eklenmemiş"}
 
-    # Create alerts for all active contacts
+    # Queue one alert per active contact; repeat taps within the throttle window collapse into it
     notified_names = []
+    message = format_companion_message(user_name, guide_title, step_number, frustration_count)
     for contact in contacts:
-        message = format_companion_message(user_name, guide_title, step_number, frustration_count)
-        alert = CompanionAlert(
-            user_id=user_id,
-            contact_id=contact.id,
-            guide_id=guide_id,
-            step_number=step_number,
-            frustration_count=frustration_count,
-            message=message
-        )
-        db.add(alert)
+        await queue_alert(db, user_id, contact.id, guide_id, step_number, frustration_count, message)
         notified_names.append(contact.name)
 
-    db.commit()
+    await db.commit()
+    companion_dispatcher.notify()
 
     return {
         "success": True,
@@ -349,96 +451,162 @@ async def companion_notify(request: Request, db: Session = Depends(get_db)):
         "message": f"{', '.join(notified_names)} bilgilendirildi"
     }
 
-@router.post("/api/guides/report-problem")
-async def report_problem(request: Request, db: Session = Depends(get_db)):
-    data = await request.json()
-    guide_id = data.get("guide_id")
-    step_number = data.get("step_number")
-    problem_type = data.get("problem_type", "general") 
+STATIC_HELP_RESPONSES = {
+    "ui_diff": "Endişelenmeyin, bazen uygulamalar güncellenir ve renkler değişebilir. Önemli olan yazan yazılar ve butonların yeridir. Adı aynı olan butona basmanız yeterlidir.",
+    "stuck": "Bazen işlemler takılabilir veya internet yavaşlayabilir. Lütfen 1-2 dakika bekleyin. Eğer hala ilerlemiyorsa, sol üstteki 'Geri' okuna basıp tekrar girmeyi deneyin.",
+    "no_sms": "Kodun gelmesi 1-2 dakika sürebilir. Telefonunuzun çekip çekmediğine bakın. Eğer gelmezse ekrandaki 'Tekrar Gönder' yazısına basabilirsiniz.",
+    "mistake": "Hiç sorun değil! Teknoloji deneme-yanılma ile öğrenilir. Telefonunuzun alt kısmındaki veya sol üstteki 'Geri' tuşuna basarak bir önceki ekrana dönebilirsiniz.",
+    "error": "Hata mesajları bazen korkutucu olabilir ama endişelenmeyin. Genellikle 'Tamam' veya 'Kapat' tuşuna basıp tekrar denemek sorunu çözer. Eğer devam ederse, uygulamayı tamamen kapatıp yeniden açmayı deneyebilirsiniz.",
+    "wrong_press": "Hiç sorun değil! Telefonunuzun 'Geri' tuşuna basarak bir önceki ekrana dönebilirsiniz.",
+    "not_understand": "Haklısınız, bazen bu adımlar karmaşık gelebilir. Lütfen derin bir nefes alın. Şimdi ekrandaki adımı en basit haliyle tekrar açıklayacağım."
+}
+
+def _help_cache_key(guide, step_number, user_query: str, history: list):
+    """(guide_id, content_hash, step_number, query) when the answer is cacheable, else None."""
+    # Only step-scoped first attempts are cacheable; retries carry history and need a fresh answer
+    if history or not (guide and guide.content_hash and step_number):
+        return None
+    return guide.guide_id, guide.content_hash, step_number, user_query
+
+async def _cached_help_response(db: AsyncSession, cache_key: tuple, user_query: str, guide, step_number) -> str:
+    if cache_key is None:
+        return await get_ai_help_response(user_query, guide, step_number)
+
+    cached = await help_cache.get(db, *cache_key)
+    if cached:
+        return cached
+
+    guidance = await get_ai_help_response(user_query, guide, step_number)
+    if guidance not in (HELP_UNAVAILABLE_MESSAGE, HELP_ERROR_MESSAGE):
+        await help_cache.put(db, *cache_key, guidance)
+    return guidance
+
+def _help_query(problem_type: str, custom_text: str, history: list) -> str:
+    """The question to put to the model, or None when a canned answer fits."""
+    if history:
+        return custom_text if custom_text else f"Sorunum şuydu: {STATIC_HELP_RESPONSES.get(problem_type, problem_type)}"
+    if problem_type in STATIC_HELP_RESPONSES:
+        return None
+    if problem_type == "other" and custom_text:
+        return custom_text
+    return f"Sorun tipi: {problem_type}"
+
+def _int_or_none(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+async def _start_problem_report(db: AsyncSession, data: dict):
+    """Record the report and decide how to answer it: (problem fields, model query or None)."""
+    guide_id = _int_or_none(data.get("guide_id"))
+    step_number = _int_or_none(data.get("step_number"))
+    problem_type = data.get("problem_type", "general")
     custom_text = data.get("custom_text")
-    history = data.get("history", []) 
-    
+    history = data.get("history") or []
+    if not isinstance(history, list):
+        history = []
+
     if guide_id and step_number:
-        problem = StepProblem(guide_id=guide_id, step_number=step_number)
-        db.add(problem)
-        db.commit()
-
-    guide = None
-    step_title = "Genel Yardım"
-    step_description = ""
-    all_steps_data = []
-    
-    if guide_id:
-        guide = db.query(Guide).filter(Guide.id == guide_id).first()
-        if guide:
-            all_steps_data = [{"step_number": s.step_number, "title": s.title, "description": s.description} for s in guide.steps]
-            
-            if step_number:
-                for s in guide.steps:
-                    if s.step_number == step_number:
-                        step_title = s.title
-                        step_description = s.description
-                        break
-    
-    context_msg = f"Rehber: {guide.title if guide else 'Genel Yardım'}, Şu anki Adım: {step_title}. Adım Detayı: {step_description}"
-
-    static_responses = {
-        "ui_diff": "Endişelenmeyin, bazen uygulamalar güncellenir ve renkler değişebilir. Önemli olan yazan yazılar ve butonların yeridir. Adı aynı olan butona basmanız yeterlidir.",
-        "stuck": "Bazen işlemler takılabilir veya internet yavaşlayabilir. Lütfen 1-2 dakika bekleyin. Eğer hala ilerlemiyorsa, sol üstteki 'Geri' okuna basıp tekrar girmeyi deneyin.",
-        "no_sms": "Kodun gelmesi 1-2 dakika sürebilir. Telefonunuzun çekip çekmediğine bakın. Eğer gelmezse ekrandaki 'Tekrar Gönder' yazısına basabilirsiniz.",
-        "mistake": "Hiç sorun değil! Teknoloji deneme-yanılma ile öğrenilir. Telefonunuzun alt kısmındaki veya sol üstteki 'Geri' tuşuna basarak bir önceki ekrana dönebilirsiniz.",
-        "error": "Hata mesajları bazen korkutucu olabilir ama endişelenmeyin. Genellikle 'Tamam' veya 'Kapat' tuşuna basıp tekrar denemek sorunu çözer. Eğer devam ederse, uygulamayı tamamen kapatıp yeniden açmayı deneyebilirsiniz.",
-        "wrong_press": "Hiç sorun değil! Telefonunuzun 'Geri' tuşuna basarak bir önceki ekrana dönebilirsiniz.",
-        "not_understand": "Haklısınız, bazen bu adımlar karmaşık gelebilir. Lütfen derin bir nefes alın. Şimdi ekrandaki adımı en basit haliyle tekrar açıklayacağım."
-    }
+        await record_problem(db, guide_id, step_number, problem_type)
+        await db.commit()
+
+    return (guide_id, step_number, problem_type, history), _help_query(problem_type, custom_text, history)
+
+@router.post("/api/guides/report-problem")
+async def report_problem(request: Request, db: AsyncSession = Depends(get_db)):
+    (guide_id, step_number, problem_type, history), user_query = await _start_problem_report(db, await request.json())
+    if user_query is None:
+        return {"success": True, "guidance": STATIC_HELP_RESPONSES[problem_type]}
 
+    guide = await guide_contexts.get(db, guide_id) if guide_id else None
     if history:
-         user_query = custom_text if custom_text else f"Sorunum şuydu: {static_responses.get(problem_type, problem_type)}"
-         guidance = get_ai_help_response(user_query, context_msg, failed_attempts=history, all_steps=all_steps_data)
-    
-    elif problem_type in static_responses:
-        guidance = static_responses[problem_type]
-    elif problem_type == "other" and custom_text:
-        guidance = get_ai_help_response(custom_text, context_msg, all_steps=all_steps_data)
+        guidance = await get_ai_help_response(user_query, guide, step_number, failed_attempts=history)
     else:
-        guidance = get_ai_help_response(f"Sorun tipi: {problem_type}", context_msg, all_steps=all_steps_data)
-    
+        cache_key = _help_cache_key(guide, step_number, user_query, history)
+        guidance = await _cached_help_response(db, cache_key, user_query, guide, step_number)
+
     return {
-        "success": True, 
+        "success": True,
         "guidance": guidance
     }
 
+def _sse(payload: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def _single_chunk(text: str):
+    yield text
+
+async def _help_events(chunks, cache_key: tuple = None):
+    """
+    SSE stream: one `data: {"delta": ...}` per chunk, then `event: done` with the full text.
+    A complete model answer is written to the help cache under `cache_key` before `done` is sent.
+    """
+    parts = []
+    try:
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield _sse({"delta": chunk})
+    except Exception:
+        # Partial answers are neither cached nor presented as complete
+        yield _sse({"success": False}, event="error")
+        return
+
+    guidance = "".join(parts).strip()
+    if cache_key and guidance not in (HELP_UNAVAILABLE_MESSAGE, HELP_ERROR_MESSAGE):
+        # The request's session is not guaranteed to outlive the response body
+        async with AsyncSessionLocal() as db:
+            await help_cache.put(db, *cache_key, guidance)
+    yield _sse({"success": True, "guidance": guidance}, event="done")
+
+@router.post("/api/guides/report-problem/stream")
+async def report_problem_stream(request: Request, db: AsyncSession = Depends(get_db)):
+    """Same answers as /api/guides/report-problem, as server-sent events so the first words show up immediately."""
+    (guide_id, step_number, problem_type, history), user_query = await _start_problem_report(db, await request.json())
+
+    cache_key = None
+    if user_query is None:
+        chunks = _single_chunk(STATIC_HELP_RESPONSES[problem_type])
+    else:
+        guide = await guide_contexts.get(db, guide_id) if guide_id else None
+        cache_key = _help_cache_key(guide, step_number, user_query, history)
+        cached = await help_cache.get(db, *cache_key) if cache_key else None
+        if cached:
+            chunks, cache_key = _single_chunk(cached), None
+        else:
+            chunks = stream_ai_help_response(user_query, guide, step_number, failed_attempts=history or None)
+
+    return StreamingResponse(
+        _help_events(chunks, cache_key),
+        media_type="text/event-stream",
+        # no-transform / X-Accel-Buffering keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/api/help/intent")
-async def search_intent(request: Request, db: Session = Depends(get_db)):
+async def search_intent(request: Request, db: AsyncSession = Depends(get_db)):
     data = await request.json()
-    query = data.get("query", "").lower()
+    query = data.get("query", "").strip()
     
     if not query:
         return {"results": []}
 
-    guides = db.query(Guide).filter(
-        Guide.status == "published",
-        (Guide.title.ilike(f"%{query}%")) | (Guide.content.ilike(f"%{query}%"))
-    ).limit(3).all()
+    guides = await search_guides(db, query, limit=3)
 
     results = [{"id": g.id, "title": g.title, "type": "guide"} for g in guides]
+    return {"results": results}
     
 @router.get("/api/safety/scenario")
-async def safety_scenario(db: Session = Depends(get_db)):
-    # Try to get a random scenario from DB
-    import random
-    from app.models import FraudScenario
-    
-    count = db.query(FraudScenario).count()
-    if count > 0:
-        random_offset = random.randint(0, count - 1)
-        scenario = db.query(FraudScenario).offset(random_offset).first()
+async def safety_scenario(difficulty: int = None, db: AsyncSession = Depends(get_db)):
+    scenario = await scenario_pool.pick(db, difficulty)
+    if scenario:
         return {
             "scenario": scenario.scenario,
             "correct_action": scenario.correct_action,
             "explanation": scenario.explanation
         }
     
-    # Fallback to AI if DB is empty
-    scenario_data = generate_fraud_scenario()
-    return scenario_data
+    # Pool is empty: answer instantly with the built-in scenario and let the refill worker catch up
+    scenario_pool.request_refill()
+    return dict(OFFLINE_FRAUD_SCENARIO)
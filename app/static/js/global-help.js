@@ -357,26 +357,24 @@ document.addEventListener('DOMContentLoaded', () => {
         helpOptionsGrid.innerHTML = `<div style="text-align: center; padding: 20px;">${loadingMsg} <div class="spinner"></div></div>`;
 
         try {
-            const response = await fetch('/api/guides/report-problem', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    guide_id: currentGuideId,
-                    step_number: currentStepNumber,
-                    problem_type: type,
-                    custom_text: customText,
-                    history: failedAttempts
-                })
+            let aiMsg = null;
+            const guidance = await window.YanindayimHelpStream.request({
+                guide_id: currentGuideId,
+                step_number: currentStepNumber,
+                problem_type: type,
+                custom_text: customText,
+                history: failedAttempts
+            }, (text) => {
+                // Swap the spinner for the answer on the first words, then keep filling it in
+                if (!aiMsg) {
+                    renderGuidance('');
+                    aiMsg = helpOptionsGrid.querySelector('.ai-msg');
+                }
+                aiMsg.textContent = text;
             });
-
-            const data = await response.json();
-
-            if (data.success && data.guidance) {
-                lastGuidanceText = data.guidance; // Store current so we can add to history if it fails
-                renderGuidance(data.guidance);
-            } else {
-                renderGuidance("Şu an bir hata oluştu, lütfen tekrar deneyin veya geri tuşuna basın.");
-            }
+            lastGuidanceText = guidance; // Store current so we can add to history if it fails
+            // Reading mode indexed the answer while it was still empty
+            if (window.YanindayimReadingMode) window.YanindayimReadingMode.refresh();
 
         } catch (error) {
             console.error('Error reporting problem:', error);
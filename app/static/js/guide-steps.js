@@ -210,23 +210,12 @@ async function showProblem() {
         guidanceText.textContent = 'Düşünülüyor...';
 
         try {
-            const response = await fetch('/api/guides/report-problem', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    guide_id: parseInt(guideId),
-                    step_number: stepNum
-                })
+            await window.YanindayimHelpStream.request({
+                guide_id: parseInt(guideId),
+                step_number: stepNum
+            }, (text) => {
+                guidanceText.textContent = text;
             });
-
-            const data = await response.json();
-            if (data.success) {
-                guidanceText.textContent = data.guidance;
-            } else {
-                guidanceText.textContent = 'Sakin olun, yanınızdayız. Bir sorun oluştu ancak her şey düzelecek.';
-            }
         } catch (error) {
             console.error('Error reporting problem:', error);
             guidanceText.textContent = 'Şu an teknik bir aksaklık var ama endişelenmeyin, biz buradayız.';
@@ -0,0 +1,68 @@
+// Streams AI help answers from /api/guides/report-problem/stream (server-sent events over POST),
+// so the first words appear while the rest is still being written.
+// Browsers without streaming fetch fall back to the plain JSON endpoint.
+(function () {
+  const STREAM_URL = '/api/guides/report-problem/stream';
+  const JSON_URL = '/api/guides/report-problem';
+
+  const canStream = !!(window.ReadableStream && window.TextDecoder && 'body' in Response.prototype);
+
+  function parseEvent(block) {
+    let event = 'message';
+    let data = '';
+    block.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) data += line.slice(5).trim();
+    });
+    return { event, data: data ? JSON.parse(data) : {} };
+  }
+
+  async function requestJson(payload, onText) {
+    const response = await fetch(JSON_URL, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(payload)
+    });
+    const data = await response.json();
+    if (!data.success || !data.guidance) throw new Error('help request failed');
+    onText(data.guidance);
+    return data.guidance;
+  }
+
+  // onText(textSoFar) is called for every chunk; resolves with the complete answer.
+  async function request(payload, onText) {
+    if (!canStream) return requestJson(payload, onText);
+
+    const response = await fetch(STREAM_URL, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+      body: JSON.stringify(payload)
+    });
+    if (!response.ok) throw new Error(`help stream failed: ${response.status}`);
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const { event, data } = parseEvent(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        if (event === 'done') {
+          onText(data.guidance);
+          return data.guidance;
+        }
+        if (event === 'error') throw new Error('help stream interrupted');
+        text += data.delta || '';
+        onText(text);
+      }
+    }
+    throw new Error('help stream ended early');
+  }
+
+  window.YanindayimHelpStream = { request };
+})();
@@ -96,7 +96,7 @@
             if (item.image_url) {
                 imageHtml = `
             <div class="card-image-container">
-                <img src="${item.image_url}" alt="${item.title}" class="card-image">
+                <img src="${item.image_url}" ${item.image_srcset ? `srcset="${item.image_srcset}" sizes="(max-width: 700px) 100vw, 400px"` : ''} alt="${item.title}" class="card-image" loading="lazy">
             </div>`;
             } else {
                 imageHtml = `
@@ -1,68 +1,244 @@
-const CACHE_NAME = 'yanindayim-v11';
-const ASSETS_TO_CACHE = [
-    '/',
-    '/static/css/style.css',
-    '/static/js/reading-mode.js',
-    '/static/js/global-help.js',
-    '/static/manifest.json',
-    '/static/img/logo.png',
-    '/static/img/icon-192.png',
-    '/static/img/icon-512.png',
-    '/offline',
-    'https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap'
-];
+// Precache list comes from /api/offline-manifest (published guides, their images and the app shell).
+// Each request type has its own cache with an entry quota; /api/* is never cached.
+// Pages are network-first (they carry the session), static files stale-while-revalidate, hashed files cache-first.
+// Precached pages are fetched without cookies so the offline copies hold no one's name or progress,
+// and visiting /logout drops every page cached while signed in.
+const CACHE_PREFIX = 'yanindayim-';
+const CACHES = {
+    core: CACHE_PREFIX + 'core',
+    pages: CACHE_PREFIX + 'pages',
+    images: CACHE_PREFIX + 'images',
+    runtime: CACHE_PREFIX + 'runtime'
+};
+const QUOTAS = {
+    pages: 80,
+    images: 250,
+    runtime: 60
+};
+const META_CACHE = CACHE_PREFIX + 'meta';
+const MANIFEST_URL = '/api/offline-manifest';
+const MANIFEST_SYNC_INTERVAL = 60 * 60 * 1000;
+
+// Content-addressed URLs never change, so a cached copy is always current
+const IMMUTABLE_PATHS = ['/static/dist/', '/static/generated/svg/'];
+
+let precached = new Set();
+let lastSync = 0;
+
+function isImmutable(url) {
+    return IMMUTABLE_PATHS.some((prefix) => url.pathname.startsWith(prefix));
+}
+
+function cacheFor(url, request) {
+    if (request.mode === 'navigate' || url.pathname === '/' || url.pathname.startsWith('/guide/')) return 'pages';
+    if (request.destination === 'image' || /\.(png|jpe?g|webp|avif|svg)$/.test(url.pathname)) return 'images';
+    return 'runtime';
+}
+
+async function trimCache(type) {
+    const quota = QUOTAS[type];
+    if (!quota) return;
+    const cache = await caches.open(CACHES[type]);
+    const keys = await cache.keys();
+    // Oldest first; precached entries are what makes guides work offline, so they stay
+    const removable = keys.filter((request) => !precached.has(new URL(request.url).href));
+    let excess = keys.length - quota;
+    for (const request of removable) {
+        if (excess-- <= 0) break;
+        await cache.delete(request);
+    }
+}
+
+async function precacheInto(type, urls) {
+    const cache = await caches.open(CACHES[type]);
+    await Promise.all(urls.map(async (url) => {
+        const absolute = new URL(url, self.location.origin);
+        // Hashed files already cached are identical; don't download them again
+        if (isImmutable(absolute) && await cache.match(absolute.href)) return;
+        try {
+            const response = await fetch(absolute.href, { credentials: 'omit' });
+            if (response.ok) await cache.put(absolute.href, response);
+        } catch (err) {
+            console.warn('[Service Worker] Precache failed for', url);
+        }
+    }));
+}
+
+async function pruneCache(type, keep) {
+    const cache = await caches.open(CACHES[type]);
+    for (const request of await cache.keys()) {
+        if (!keep.has(request.url)) await cache.delete(request);
+    }
+}
+
+async function syncManifest(force) {
+    if (!force && Date.now() - lastSync < MANIFEST_SYNC_INTERVAL) return;
+    lastSync = Date.now();
+
+    const meta = await caches.open(META_CACHE);
+    let response;
+    try {
+        response = await fetch(MANIFEST_URL, { cache: 'no-cache' });
+    } catch (err) {
+        return;
+    }
+    if (!response.ok) return;
+    const manifest = await response.clone().json();
+
+    const previous = await meta.match(MANIFEST_URL);
+    const previousVersion = previous ? (await previous.json()).version : null;
+    precached = new Set([...manifest.core, ...manifest.pages, ...manifest.images]
+        .map((url) => new URL(url, self.location.origin).href));
+    if (previousVersion === manifest.version) return;
+
+    console.log('[Service Worker] Offline manifest', manifest.version);
+    await precacheInto('core', manifest.core);
+    await precacheInto('pages', manifest.pages);
+    await precacheInto('images', manifest.images);
+    // Core only ever holds the manifest's shell; old hashed bundles go as soon as they are replaced
+    await pruneCache('core', new Set(manifest.core.map((url) => new URL(url, self.location.origin).href)));
+    await trimCache('pages');
+    await trimCache('images');
+    await meta.put(MANIFEST_URL, response);
+}
+
+async function loadPrecachedSet() {
+    const meta = await caches.open(META_CACHE);
+    const stored = await meta.match(MANIFEST_URL);
+    if (!stored) return;
+    const manifest = await stored.json();
+    precached = new Set([...manifest.core, ...manifest.pages, ...manifest.images]
+        .map((url) => new URL(url, self.location.origin).href));
+}
+
+async function matchAny(request) {
+    for (const name of Object.values(CACHES)) {
+        const cached = await (await caches.open(name)).match(request, { ignoreVary: true });
+        if (cached) return cached;
+    }
+    return null;
+}
+
+async function matchImageVariant(url) {
+    // /static/dist/img/<name>.<hash>.<width>.<fmt>: offline, any cached size/format of the same image will do
+    const match = url.pathname.match(/^(\/static\/dist\/img\/.+\.[0-9a-f]+\.)\d+\.\w+$/);
+    if (!match) return null;
+    const cache = await caches.open(CACHES.images);
+    for (const request of await cache.keys()) {
+        if (new URL(request.url).pathname.startsWith(match[1])) return cache.match(request);
+    }
+    return null;
+}
+
+async function staleWhileRevalidate(event, type) {
+    const request = event.request;
+    const cached = await matchAny(request);
+    const network = fetch(request)
+        .then(async (response) => {
+            if (response.ok && !response.redirected && (response.type === 'basic' || response.type === 'cors')) {
+                const cache = await caches.open(CACHES[type]);
+                await cache.put(request, response.clone());
+                await trimCache(type);
+            }
+            return response;
+        });
+
+    if (cached) {
+        event.waitUntil(network.catch(() => null));
+        return cached;
+    }
+    try {
+        return await network;
+    } catch (err) {
+        const url = new URL(request.url);
+        const variant = type === 'images' ? await matchImageVariant(url) : null;
+        if (variant) return variant;
+        if (request.mode === 'navigate') return caches.match('/offline');
+        throw err;
+    }
+}
+
+async function networkFirst(event, type) {
+    // Pages change with the session (name, progress, admin links), so a cached copy is only for offline
+    try {
+        const response = await fetch(event.request);
+        if (response.ok && !response.redirected) {
+            const cache = await caches.open(CACHES[type]);
+            await cache.put(event.request, response.clone());
+            await trimCache(type);
+        }
+        return response;
+    } catch (err) {
+        return (await matchAny(event.request)) || caches.match('/offline');
+    }
+}
+
+async function logout(event) {
+    // Pages cached while signed in show the user's name; precached anonymous copies come back on the next sync
+    await caches.delete(CACHES.pages);
+    await caches.delete(CACHES.runtime);
+    await (await caches.open(META_CACHE)).delete(MANIFEST_URL);
+    lastSync = 0;
+    return fetch(event.request);
+}
+
+async function cacheFirst(event, type) {
+    const cached = await matchAny(event.request);
+    if (cached) return cached;
+    return staleWhileRevalidate(event, type);
+}
 
 self.addEventListener('install', (event) => {
-    event.waitUntil(
-        caches.open(CACHE_NAME).then((cache) => {
-            console.log('[Service Worker] Caching core assets');
-            return cache.addAll(ASSETS_TO_CACHE);
-        })
-    );
+    event.waitUntil(syncManifest(true));
     self.skipWaiting();
 });
 
 self.addEventListener('activate', (event) => {
-    event.waitUntil(
-        caches.keys().then((keyList) => {
-            return Promise.all(
-                keyList.map((key) => {
-                    if (key !== CACHE_NAME) {
-                        console.log('[Service Worker] Removing old cache', key);
-                        return caches.delete(key);
-                    }
-                })
-            );
-        })
-    );
-    self.clients.claim();
+    event.waitUntil((async () => {
+        // Earlier versions were registered at /static/sw.js and only controlled /static/
+        if (new URL(self.registration.scope).pathname.startsWith('/static/')) {
+            await self.registration.unregister();
+            return;
+        }
+        const current = new Set([...Object.values(CACHES), META_CACHE]);
+        for (const key of await caches.keys()) {
+            if (!current.has(key)) {
+                console.log('[Service Worker] Removing old cache', key);
+                await caches.delete(key);
+            }
+        }
+        await loadPrecachedSet();
+        await self.clients.claim();
+    })());
 });
 
 self.addEventListener('fetch', (event) => {
-    if (event.request.method !== 'GET') return;
-
-    event.respondWith(
-        fetch(event.request)
-            .then((response) => {
-                const responseClone = response.clone();
-
-                caches.open(CACHE_NAME).then((cache) => {
-                    if (event.request.url.startsWith('http')) {
-                        cache.put(event.request, responseClone);
-                    }
-                });
-
-                return response;
-            })
-            .catch(() => {
-                return caches.match(event.request).then((cachedResponse) => {
-                    if (cachedResponse) {
-                        return cachedResponse;
-                    }
-                    if (event.request.mode === 'navigate') {
-                        return caches.match('/offline');
-                    }
-                });
-            })
-    );
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) {
+        if (url.hostname.endsWith('fonts.googleapis.com') || url.hostname.endsWith('fonts.gstatic.com')) {
+            event.respondWith(cacheFirst(event, 'runtime'));
+        }
+        return;
+    }
+    // Live data (progress, help, search) is never served from cache
+    if (url.pathname.startsWith('/api/') || url.pathname.startsWith('/admin') || url.pathname === '/sw.js') return;
+
+    if (url.pathname === '/logout') {
+        event.respondWith(logout(event));
+        return;
+    }
+    if (request.mode === 'navigate') {
+        event.waitUntil(syncManifest(false));
+    }
+    const type = cacheFor(url, request);
+    if (isImmutable(url)) {
+        event.respondWith(cacheFirst(event, type));
+    } else if (request.mode === 'navigate') {
+        event.respondWith(networkFirst(event, type));
+    } else {
+        event.respondWith(staleWhileRevalidate(event, type));
+    }
 });
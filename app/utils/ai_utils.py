@@ -3,6 +3,10 @@ import os
 import json
 import logging
 import hashlib
+from app.utils.llm_router import llm_router
+from app.utils import svg_store
+from app.utils import metrics
+from app.utils.prompt_builder import build_help_prompt, GuideContext
 
 # Configure logger
 logging.basicConfig(level=logging.INFO)
@@ -14,32 +18,42 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if GOOGLE_API_KEY:
     genai.configure(api_key=GOOGLE_API_KEY)
 
-def generate_step_image(guide_title: str, step_title: str, step_description: str) -> str:
+# Fallback help texts; callers use these to tell a real answer from an outage
+HELP_UNAVAILABLE_MESSAGE = "Şu an yapay zeka servisine ulaşamıyorum. Lütfen 'Devam Edemiyorum' gibi hazır seçenekleri kullanın."
+HELP_ERROR_MESSAGE = "Şu an bağlantıda bir sorun var. Lütfen biraz bekleyip tekrar deneyin."
+
+# Fallback fraud scenarios served when Gemini is not configured or fails
+OFFLINE_FRAUD_SCENARIO = {
+    "scenario": "Telefonda biri aradı, 'Ben savcıyım, adınız terör örgütüne karıştı, acil para göndermeniz lazım' dedi.",
+    "correct_action": "hangup",
+    "explanation": "Devlet görevlileri (savcı, polis) asla telefonda para istemez. Bu klasik bir dolandırıcılık yöntemidir."
+}
+FALLBACK_FRAUD_SCENARIO = {
+    "scenario": "Bankadan aradığını söyleyen biri, 'Hesabınız çalındı, şifrenizi söyleyin' diyor.",
+    "correct_action": "hangup",
+    "explanation": "Bankalar asla telefonda şifrenizi istemez. Bu bir dolandırıcılıktır."
+}
+
+# SVG output is much longer than a help answer, so it gets a wider timeout
+SVG_TIMEOUT_SECONDS = float(os.getenv("LLM_SVG_TIMEOUT_SECONDS", "60"))
+
+async def generate_step_image(guide_title: str, step_title: str, step_description: str) -> str:
     """
     Generates a clean SVG vector illustration for a guide step using Gemini.
-    Saves it locally and returns the static path.
+    Stores it in the SVG store and returns the static path.
     """
-    if not GOOGLE_API_KEY:
-        logger.warning("GOOGLE_API_KEY yok. SVG üretilemedi.")
+    if not llm_router.available("svg"):
+        logger.warning("Yapay zeka servisi yapılandırılmamış. SVG üretilemedi.")
         return None
 
-    # Create storage dir if not exists
-    os.makedirs("app/static/generated", exist_ok=True)
-    
-    # Generate unique filename based on content
+    # Same step text -> same illustration, even across guides
     prompt_hash = hashlib.md5(f"{step_title}{step_description}".encode()).hexdigest()
-    filename = f"step_{prompt_hash}.svg"
-    filepath = os.path.join("app/static/generated", filename)
-    static_url = f"/static/generated/{filename}"
-
-    # Cache check
-    if os.path.exists(filepath):
-        logger.info(f"SVG already exists: {static_url}")
-        return static_url
+    cached_url = await svg_store.lookup(prompt_hash)
+    if cached_url:
+        logger.info(f"SVG already exists: {cached_url}")
+        return cached_url
 
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
         svg_prompt = f"""Generate a clean, minimalist SVG illustration for this guide step.
 
 Guide: {guide_title}
@@ -61,7 +75,7 @@ SVG Requirements:
 
 Return ONLY the raw SVG code starting with <svg and ending with </svg>. No markdown, no explanation, no code blocks."""
 
-        response = model.generate_content(svg_prompt)
+        response = await llm_router.generate("svg", svg_prompt, timeout=SVG_TIMEOUT_SECONDS)
         svg_content = response.text.strip()
         
         # Clean up: extract just the SVG if wrapped in markdown
@@ -87,27 +101,28 @@ Return ONLY the raw SVG code starting with <svg and ending with </svg>. No markd
             logger.error(f"SVG GEN: Invalid SVG output for '{step_title}'")
             return None
         
-        # Save the SVG file
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(svg_content)
+        # Sanitized, minified and deduplicated by content hash
+        try:
+            static_url = await svg_store.store_svg(svg_content, prompt_key=prompt_hash)
+        except svg_store.UnsafeSVGError as e:
+            logger.error(f"SVG GEN: Rejected SVG for '{step_title}': {e}")
+            return None
         
-        logger.info(f"SVG GEN SUCCESS: {static_url} ({len(svg_content)} bytes)")
+        logger.info(f"SVG GEN SUCCESS: {static_url}")
         return static_url
 
     except Exception as e:
         logger.error(f"SVG GEN failed for '{step_title}': {e}")
         return None
 
-def generate_guide_with_ai(prompt: str) -> dict:
+async def generate_guide_with_ai(prompt: str) -> dict:
     """Generates a step-by-step guide using Gemini API with specific prompt engineering"""
     
-    if not GOOGLE_API_KEY:
-        logger.warning("GOOGLE_API_KEY not found, falling back to mock data.")
+    if not llm_router.available("guide"):
+        logger.warning("No LLM provider configured, falling back to mock data.")
         return _get_mock_guide(prompt)
 
     try:
-        model = genai.GenerativeModel('gemini-flash-latest')
-        
         system_instruction = """
 You are generating step-by-step guides for an elderly-friendly Turkish web app called “Yanındayım”.
 
@@ -179,7 +194,8 @@ Now generate a high-quality guide for: """
 
         full_prompt = system_instruction + prompt
         
-        response = model.generate_content(
+        response = await llm_router.generate(
+            "guide",
             full_prompt,
             generation_config={"response_mime_type": "application/json"}
         )
@@ -262,21 +278,15 @@ def get_calming_guidance(guide_title: str, step_title: str) -> str:
     import random
     return random.choice(responses)
 
-def generate_fraud_scenario() -> dict:
+async def generate_fraud_scenario() -> dict:
     """
     Generates a random fraud simulation scenario using Gemini.
-    Returns a dict with scenario, correct_action, explanation.
+    Returns a dict with scenario, correct_action, explanation (and difficulty when the model supplies it).
     """
-    if not GOOGLE_API_KEY:
-        return {
-            "scenario": "Telefonda biri aradı, 'Ben savcıyım, adınız terör örgütüne karıştı, acil para göndermeniz lazım' dedi.",
-            "correct_action": "hangup",
-            "explanation": "Devlet görevlileri (savcı, polis) asla telefonda para istemez. Bu klasik bir dolandırıcılık yöntemidir."
-        }
+    if not llm_router.available("fraud"):
+        return dict(OFFLINE_FRAUD_SCENARIO)
 
     try:
-        model = genai.GenerativeModel('gemini-flash-latest')
-        
         prompt = """
         Generate a short, realistic phone or internet fraud scenario targeting elderly people in Turkey.
         Examples: Police/Prosecutor scam, Grandchild in trouble, winning a prize, bank account hacking.
@@ -285,11 +295,12 @@ def generate_fraud_scenario() -> dict:
         {
           "scenario": "The situational text (max 2 sentences, simple Turkish)",
           "correct_action": "hangup" (if it's a scam) or "believe" (if it's safe - but mostly allow scams for education),
-          "explanation": "Why this is a scam (1 sentence simple Turkish)"
+          "explanation": "Why this is a scam (1 sentence simple Turkish)",
+          "difficulty": 1 (obvious scam), 2 (plausible) or 3 (very convincing)
         }
         """
         
-        response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+        response = await llm_router.generate("fraud", prompt, generation_config={"response_mime_type": "application/json"})
         text_response = response.text.strip()
         
         # Clean markdown if present
@@ -303,57 +314,61 @@ def generate_fraud_scenario() -> dict:
 
     except Exception as e:
         logger.error(f"Gemini Fraud Gen Error: {e}")
-        return {
-            "scenario": "Bankadan aradığını söyleyen biri, 'Hesabınız çalındı, şifrenizi söyleyin' diyor.",
-            "correct_action": "hangup",
-            "explanation": "Bankalar asla telefonda şifrenizi istemez. Bu bir dolandırıcılıktır."
-        }
+        return dict(FALLBACK_FRAUD_SCENARIO)
 
-def get_ai_help_response(user_query: str, guide_context: str = None, failed_attempts: list[str] = None, all_steps: list[dict] = None) -> str:
-    """
-    Generates a strict, calming response for specific user problems using Gemini API.
-    Provides context of the entire guide for better problem solving.
-    """
-    if not GOOGLE_API_KEY:
-        return "Şu an yapay zeka servisine ulaşamıyorum. Lütfen 'Devam Edemiyorum' gibi hazır seçenekleri kullanın."
-
-    try:
-        model = genai.GenerativeModel('gemini-flash-latest')
-        
-        # Format all steps for context
-        steps_context = ""
-        if all_steps:
-            steps_context = "\nRehberdeki Tüm Adımlar:\n"
-            for s in all_steps:
-                steps_context += f"- Adım {s.get('step_number')}: {s.get('title')} - {s.get('description')}\n"
-
-        system_instruction = f"""
+HELP_INSTRUCTIONS = """
 You are a calm, patient technical support assistant for elderly users of the "Yanındayım" app.
 Your ONLY job is to help them with the specific problem they describe.
 
 Strict Rules:
 1. Answer in very simple Turkish. Short sentences. No technical jargon.
-2. Use the provided context (Guide Title, Current Step, and ALL other steps) to understand exactly where the user is and what might be confusing.
+2. Use the provided context (Guide Title, Current Step, and the listed steps) to understand exactly where the user is and what might be confusing.
 3. If the input is random chatter, politely refocus on helping them with the app.
 4. Provide 1-2 direct, calming actions.
 5. If the user's problem is that they are stuck, suggest looking at the current or next step's action.
 6. Format instructions as a numbered list (1., 2.).
-
-Context: {guide_context or "Genel Yardım"}{steps_context}
-User Query: {user_query}
 """
 
-        if failed_attempts:
-            # We treat failed_attempts as conversation history
-            history_text = "\n".join([f"- {attempt}" for attempt in failed_attempts])
-            system_instruction += f"\n\nÖNEMLİ: Kullanıcı şu çözümleri denedi ama İŞE YARAMADI:\n{history_text}\n\nLütfen farklı ve daha basit bir çözüm sunun."
+def _help_prompt(user_query: str, guide: GuideContext = None, step_number: int = None, failed_attempts: list[str] = None) -> str:
+    prompt = build_help_prompt(HELP_INSTRUCTIONS, user_query, guide, step_number, failed_attempts)
+    logger.info(prompt.log_line(guide.guide_id if guide else None))
+    metrics.llm_prompt_tokens.observe(prompt.tokens, task="help")
+    return prompt.text
 
-        response = model.generate_content(system_instruction)
-        return response.text.strip()
+async def get_ai_help_response(user_query: str, guide: GuideContext = None, step_number: int = None, failed_attempts: list[str] = None) -> str:
+    """
+    Generates a strict, calming response for specific user problems using Gemini API.
+    Provides the guide's steps around the current one (within the prompt token budget) for better problem solving.
+    """
+    if not llm_router.available("help"):
+        return HELP_UNAVAILABLE_MESSAGE
 
-        response = model.generate_content(system_instruction)
+    try:
+        response = await llm_router.generate("help", _help_prompt(user_query, guide, step_number, failed_attempts))
         return response.text.strip()
 
     except Exception as e:
         logger.error(f"Gemini API Help Error: {e}")
-        return "Şu an bağlantıda bir sorun var. Lütfen biraz bekleyip tekrar deneyin."
+        return HELP_ERROR_MESSAGE
+
+async def stream_ai_help_response(user_query: str, guide: GuideContext = None, step_number: int = None, failed_attempts: list[str] = None):
+    """
+    Same answer as get_ai_help_response, yielded in chunks as the model produces them.
+    Yields a single fallback message if nothing could be generated; a stream that breaks
+    midway re-raises, so the partial text is never mistaken for a complete answer.
+    """
+    if not llm_router.available("help"):
+        yield HELP_UNAVAILABLE_MESSAGE
+        return
+
+    started = False
+    try:
+        async for chunk in llm_router.stream("help", _help_prompt(user_query, guide, step_number, failed_attempts)):
+            started = True
+            yield chunk
+    except Exception as e:
+        logger.error(f"Gemini API Help Stream Error: {e}")
+        if not started:
+            yield HELP_ERROR_MESSAGE
+        else:
+            raise
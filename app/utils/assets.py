@@ -0,0 +1,262 @@
+"""
+Static asset pipeline — build step and template helpers.
+
+`python -m app.utils.assets` (run in the Docker build) writes content-hashed copies of the
+images, CSS and JS under app/static/dist/:
+  * WebP (and AVIF, when Pillow supports it) variants of every image in static/img at several widths
+  * style.css and the JS bundles, each with precompressed .gz and .br siblings
+  * dist/assets.json, the manifest the templates use for srcset and hashed URLs
+
+Without a build the helpers fall back to the original /static URLs.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import anyio
+from markupsafe import Markup, escape
+from starlette.staticfiles import StaticFiles
+from starlette.responses import FileResponse
+
+try:
+    import brotli
+except ImportError:  # .br copies are skipped; .gz is always produced
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "assets.json")
+STATIC_URL = "/static/"
+
+IMAGE_WIDTHS = (320, 640, 960)
+IMAGE_QUALITY = {"avif": 50, "webp": 75}
+BUNDLE_DIRS = ("css", "js")
+HASH_LENGTH = 10
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_SIZES = "(max-width: 700px) 100vw, 640px"
+# Content-addressed paths under /static: a URL never changes content
+IMMUTABLE_PREFIXES = ("dist/", "generated/svg/")
+
+
+def _content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def _hashed_name(rel_path: str, digest: str, suffix: str = None) -> str:
+    """'css/style.css' -> 'dist/css/style.<hash>.css' (or '.<suffix>' instead of the extension)."""
+    root, ext = os.path.splitext(rel_path)
+    return f"dist/{root}.{digest}{suffix or ext}"
+
+
+def _write(rel_path: str, data: bytes):
+    path = os.path.join(STATIC_DIR, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _precompress(rel_path: str, data: bytes):
+    _write(rel_path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(rel_path + ".br", brotli.compress(data, quality=11))
+
+
+def _image_formats() -> list:
+    from PIL import features
+    formats = ["webp"]
+    if features.check("avif"):
+        formats.insert(0, "avif")
+    return formats
+
+
+def build_image(rel_path: str, formats: list) -> dict:
+    from PIL import Image
+
+    with open(os.path.join(STATIC_DIR, rel_path), "rb") as f:
+        data = f.read()
+    digest = _content_hash(data)
+
+    with Image.open(os.path.join(STATIC_DIR, rel_path)) as source:
+        source.load()
+        width, height = source.size
+        image = source.convert("RGBA") if source.mode not in ("RGB", "RGBA") else source
+
+        # Never upscale; an image narrower than the smallest width gets a single variant at its own size
+        widths = [w for w in IMAGE_WIDTHS if w < width] + [min(width, IMAGE_WIDTHS[-1])]
+        variants = {}
+        for fmt in formats:
+            variants[fmt] = []
+            for w in sorted(set(widths)):
+                resized = image if w == width else image.resize((w, round(height * w / width)), Image.LANCZOS)
+                out_rel = _hashed_name(rel_path, digest, f".{w}.{fmt}")
+                out_path = os.path.join(STATIC_DIR, out_rel)
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                options = {"quality": IMAGE_QUALITY[fmt]}
+                if fmt == "webp":
+                    options["method"] = 6  # slowest, smallest encoder setting; this runs once per build
+                resized.save(out_path, fmt.upper(), **options)
+                variants[fmt].append([w, out_rel])
+
+    return {"width": width, "height": height, "variants": variants}
+
+
+def build_bundle(rel_path: str) -> str:
+    with open(os.path.join(STATIC_DIR, rel_path), "rb") as f:
+        data = f.read()
+    out_rel = _hashed_name(rel_path, _content_hash(data))
+    _write(out_rel, data)
+    _precompress(out_rel, data)
+    return out_rel
+
+
+def build(clean: bool = True) -> dict:
+    """Regenerate app/static/dist and its manifest. Returns the manifest."""
+    if clean and os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    manifest = {"files": {}, "images": {}}
+    for folder in BUNDLE_DIRS:
+        for name in sorted(os.listdir(os.path.join(STATIC_DIR, folder))):
+            if name.endswith((".css", ".js")):
+                rel = f"{folder}/{name}"
+                manifest["files"][rel] = build_bundle(rel)
+
+    formats = _image_formats()
+    for name in sorted(os.listdir(os.path.join(STATIC_DIR, "img"))):
+        if name.lower().endswith((".png", ".jpg", ".jpeg")):
+            rel = f"img/{name}"
+            manifest["images"][rel] = build_image(rel, formats)
+
+    _write(os.path.relpath(MANIFEST_PATH, STATIC_DIR), json.dumps(manifest, indent=2).encode("utf-8"))
+    return manifest
+
+
+class AssetManifest:
+    """Read-only view of dist/assets.json, loaded once per process."""
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self._data = None
+
+    def _load(self) -> dict:
+        if self._data is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                logger.warning(f"Asset manifest not found at {self.path}; serving original assets")
+                self._data = {"files": {}, "images": {}}
+        return self._data
+
+    @staticmethod
+    def _rel(url: str):
+        if url and url.startswith(STATIC_URL):
+            return url[len(STATIC_URL):]
+        return None
+
+    def asset_url(self, url: str) -> str:
+        """Hashed URL for a CSS/JS file, e.g. '/static/css/style.css' -> '/static/dist/css/style.<hash>.css'."""
+        hashed = self._load()["files"].get(self._rel(url))
+        return STATIC_URL + hashed if hashed else url
+
+    def image(self, url: str):
+        return self._load()["images"].get(self._rel(url))
+
+    def srcset(self, url: str, fmt: str = "webp") -> str:
+        entry = self.image(url)
+        if not entry or fmt not in entry["variants"]:
+            return ""
+        return ", ".join(f"{STATIC_URL}{path} {w}w" for w, path in entry["variants"][fmt])
+
+    def offline_variant(self, url: str, max_width: int = 640):
+        """URL of the WebP variant a phone would fetch for this image, or None if it has no variants."""
+        entry = self.image(url)
+        if not entry or "webp" not in entry["variants"]:
+            return None
+        variants = entry["variants"]["webp"]
+        fitting = [path for w, path in variants if w <= max_width] or [variants[0][1]]
+        return STATIC_URL + fitting[-1]
+
+    def bundle_urls(self, folders) -> list:
+        """URLs of every CSS/JS bundle: hashed when built, the originals otherwise."""
+        urls = []
+        for folder in folders:
+            for name in sorted(os.listdir(os.path.join(STATIC_DIR, folder))):
+                if name.endswith((".css", ".js")):
+                    urls.append(self.asset_url(f"{STATIC_URL}{folder}/{name}"))
+        return urls
+
+    def picture(self, url: str, alt: str = "", css_class: str = "", sizes: str = DEFAULT_SIZES, loading: str = "lazy") -> Markup:
+        """<picture> with AVIF/WebP sources for pipeline images; a plain <img> for anything else (e.g. generated SVGs)."""
+        attrs = f'alt="{escape(alt)}"'
+        if css_class:
+            attrs += f' class="{escape(css_class)}"'
+        if loading:
+            attrs += f' loading="{escape(loading)}"'
+
+        entry = self.image(url)
+        if not entry:
+            return Markup(f'<img src="{escape(url)}" {attrs}>')
+
+        sources = "".join(
+            f'<source type="image/{fmt}" srcset="{escape(self.srcset(url, fmt))}" sizes="{escape(sizes)}">'
+            for fmt in entry["variants"]
+        )
+        return Markup(
+            f'<picture>{sources}<img src="{escape(url)}" width="{entry["width"]}" height="{entry["height"]}" {attrs}></picture>'
+        )
+
+
+asset_manifest = AssetManifest()
+
+
+def register(templates):
+    """Expose the asset helpers to a Jinja2Templates instance."""
+    templates.env.globals.update(
+        asset_url=asset_manifest.asset_url,
+        picture=asset_manifest.picture,
+    )
+
+
+class AssetStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves content-addressed assets with immutable caching and picks a
+    precompressed .br/.gz sibling when one exists and the client accepts it.
+    """
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if not path.startswith(IMMUTABLE_PREFIXES) or response.status_code != 200:
+            return response
+
+        if isinstance(response, FileResponse):
+            accept = ""
+            for key, value in scope.get("headers", []):
+                if key == b"accept-encoding":
+                    accept = value.decode("latin-1")
+            for encoding, ext in (("br", ".br"), ("gzip", ".gz")):
+                if encoding not in accept:
+                    continue
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + ext)
+                if stat_result is not None:
+                    response = FileResponse(
+                        full_path,
+                        stat_result=stat_result,
+                        media_type=response.media_type,
+                        headers={"Content-Encoding": encoding},
+                    )
+                    break
+            response.headers["Vary"] = "Accept-Encoding"
+
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+if __name__ == "__main__":
+    result = build()
+    print(f"Built {len(result['files'])} bundles and {len(result['images'])} images into {DIST_DIR}")
@@ -0,0 +1,130 @@
+"""In-process snapshot of published guides and their ordered steps, served without touching Postgres."""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.database import AsyncSessionLocal
+from app.models import Guide
+from app.utils.guide_version import guide_content_hash
+
+logger = logging.getLogger(__name__)
+
+# Admin writes invalidate this worker immediately; the TTL bounds staleness on other workers
+CATALOG_TTL_SECONDS = int(os.getenv("CATALOG_TTL_SECONDS", "60"))
+
+
+@dataclass(frozen=True)
+class StepSnapshot:
+    id: int
+    step_number: int
+    title: str
+    description: str
+    image_url: str
+
+
+@dataclass(frozen=True)
+class GuideSnapshot:
+    id: int
+    title: str
+    content: str
+    status: str
+    image_url: str
+    priority: int
+    help_options: str
+    steps: tuple
+    content_hash: str
+    updated_at: datetime
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    built_at: float
+    guides: tuple  # published, ordered by priority desc then id
+    by_id: dict
+
+
+class GuideCatalog:
+    def __init__(self, ttl_seconds: int = CATALOG_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._version = 0
+        self._snapshot = None
+        self._lock = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self):
+        """Drop the snapshot; the next read rebuilds it. Call after any guide/step write commits."""
+        self._version += 1
+        self._snapshot = None
+
+    def _is_fresh(self, snapshot) -> bool:
+        return (
+            snapshot is not None
+            and snapshot.version == self._version
+            and time.time() - snapshot.built_at < self.ttl_seconds
+        )
+
+    async def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            self.hits += 1
+            return snapshot
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Another request may have rebuilt it while we waited
+            if self._is_fresh(self._snapshot):
+                self.hits += 1
+                return self._snapshot
+            self.misses += 1
+            version = self._version
+            snapshot = await self._build(version)
+            if version == self._version:
+                self._snapshot = snapshot
+            return snapshot
+
+    async def get_guide(self, guide_id: int):
+        return (await self.get()).by_id.get(guide_id)
+
+    async def _build(self, version: int) -> CatalogSnapshot:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Guide)
+                .options(selectinload(Guide.steps))
+                .where(Guide.status == "published")
+                .order_by(Guide.priority.desc(), Guide.id)
+            )
+            guides = tuple(
+                GuideSnapshot(
+                    id=g.id,
+                    title=g.title,
+                    content=g.content,
+                    status=g.status,
+                    image_url=g.image_url,
+                    priority=g.priority,
+                    help_options=g.help_options,
+                    steps=tuple(
+                        StepSnapshot(s.id, s.step_number, s.title, s.description, s.image_url) for s in g.steps
+                    ),
+                    content_hash=g.content_hash or guide_content_hash(g, g.steps),
+                    updated_at=g.updated_at or g.created_at,
+                )
+                for g in result.scalars().all()
+            )
+        logger.info(f"Guide catalog rebuilt: {len(guides)} guides (v{version})")
+        return CatalogSnapshot(version=version, built_at=time.time(), guides=guides, by_id={g.id: g for g in guides})
+
+
+guide_catalog = GuideCatalog()
@@ -0,0 +1,223 @@
+"""
+Companion alert outbox — requests only write CompanionAlert rows; a dispatcher delivers
+them in batches through a pluggable channel and retries failures with backoff.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload
+
+from app.database import AsyncSessionLocal
+from app.models import CompanionAlert
+from app.utils.workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+COMPANION_CHANNEL = os.getenv("COMPANION_CHANNEL", "stub")  # 'stub' or 'webhook'
+COMPANION_STUB_PATH = os.getenv("COMPANION_STUB_PATH", "companion_outbox.jsonl")
+COMPANION_WEBHOOK_URL = os.getenv("COMPANION_WEBHOOK_URL")
+# Repeat taps for the same (user, guide, step) within this long of the last send become one message
+COMPANION_THROTTLE_SECONDS = int(os.getenv("COMPANION_THROTTLE_SECONDS", "600"))
+COMPANION_DISPATCH_INTERVAL = float(os.getenv("COMPANION_DISPATCH_INTERVAL", "5"))
+COMPANION_DISPATCH_BATCH = int(os.getenv("COMPANION_DISPATCH_BATCH", "50"))
+COMPANION_MAX_ATTEMPTS = int(os.getenv("COMPANION_MAX_ATTEMPTS", "6"))
+COMPANION_RETRY_BASE_SECONDS = float(os.getenv("COMPANION_RETRY_BASE_SECONDS", "30"))
+# A claimed alert whose worker died is claimed again after this long (so delivery is at-least-once)
+COMPANION_SEND_LEASE_SECONDS = float(os.getenv("COMPANION_SEND_LEASE_SECONDS", "300"))
+
+
+class StubChannel:
+    """Local SMS/WhatsApp sink: appends each message to a JSON-lines file instead of sending it."""
+
+    name = "stub"
+
+    def __init__(self, path: str = COMPANION_STUB_PATH):
+        self.path = path
+
+    def _write(self, record: dict):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def send(self, phone: str, message: str):
+        record = {"to": phone, "message": message, "sent_at": time.time()}
+        await asyncio.to_thread(self._write, record)
+        logger.info(f"Companion stub message to {phone}: {message}")
+
+
+class WebhookChannel:
+    """Posts {'to', 'message'} to an SMS/WhatsApp gateway; any non-2xx response is a failed attempt."""
+
+    name = "webhook"
+
+    def __init__(self, url: str = COMPANION_WEBHOOK_URL, timeout: float = 10):
+        if not url:
+            raise ValueError("COMPANION_WEBHOOK_URL is not set")
+        self.url = url
+        self.timeout = timeout
+
+    async def send(self, phone: str, message: str):
+        response = await asyncio.to_thread(
+            requests.post, self.url, json={"to": phone, "message": message}, timeout=self.timeout
+        )
+        response.raise_for_status()
+
+
+CHANNELS = {
+    "stub": StubChannel,
+    "webhook": WebhookChannel,
+}
+
+
+def create_channel(name: str = COMPANION_CHANNEL):
+    return CHANNELS.get(name, StubChannel)()
+
+
+def throttle_key(user_id: int, contact_id: int, guide_id, step_number) -> str:
+    return f"{user_id}:{contact_id}:{guide_id or 0}:{step_number or 0}"
+
+
+async def queue_alert(db, user_id: int, contact_id: int, guide_id, step_number, frustration_count: int, message: str):
+    """
+    Insert a pending alert, or fold a repeat tap into the open one with the same key.
+    Taps within COMPANION_THROTTLE_SECONDS of the last send, or while one is being sent, are dropped.
+    Caller commits.
+    """
+    key = throttle_key(user_id, contact_id, guide_id, step_number)
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=COMPANION_THROTTLE_SECONDS)
+    recently_sent = await db.scalar(
+        select(CompanionAlert.id)
+        .where(CompanionAlert.dedupe_key == key, CompanionAlert.sent_at > cutoff)
+        .limit(1)
+    )
+    if recently_sent:
+        return
+
+    stmt = insert(CompanionAlert).values(
+        user_id=user_id,
+        contact_id=contact_id,
+        guide_id=guide_id,
+        step_number=step_number,
+        frustration_count=frustration_count,
+        message=message,
+        status="pending",
+        attempts=0,
+        dedupe_key=key,
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["dedupe_key"],
+        index_where=CompanionAlert.status.in_(("pending", "sending")),
+        set_={
+            "frustration_count": func.greatest(CompanionAlert.frustration_count, stmt.excluded.frustration_count),
+            "message": stmt.excluded.message,
+        },
+        where=CompanionAlert.status == "pending",
+    ))
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff: base, 2x base, 4x base ... capped at one hour."""
+    return min(COMPANION_RETRY_BASE_SECONDS * (2 ** (attempts - 1)), 3600)
+
+
+class CompanionDispatcher(PeriodicWorker):
+    # Never cancelled mid-batch: a message handed to the channel always gets its status committed
+    name = "Companion dispatcher"
+
+    def __init__(self, channel=None, interval: float = COMPANION_DISPATCH_INTERVAL):
+        super().__init__(interval)
+        self.channel = channel
+        self.sent = 0
+        self.failed = 0
+
+    async def claim_batch(self) -> list:
+        """
+        Mark one batch of due alerts 'sending' under a lease and commit, so no row lock
+        or pooled connection is held while the channel talks to the network.
+        """
+        async with AsyncSessionLocal() as db:
+            # SKIP LOCKED lets several workers claim from the outbox without taking the same row
+            result = await db.execute(
+                select(CompanionAlert)
+                .options(joinedload(CompanionAlert.contact))
+                .where(
+                    CompanionAlert.status.in_(("pending", "sending")),
+                    CompanionAlert.next_attempt_at <= func.now()
+                )
+                .order_by(CompanionAlert.next_attempt_at, CompanionAlert.id)
+                .limit(COMPANION_DISPATCH_BATCH)
+                .with_for_update(skip_locked=True, of=CompanionAlert)
+            )
+            alerts = result.scalars().all()
+            lease_until = datetime.now(timezone.utc) + timedelta(seconds=COMPANION_SEND_LEASE_SECONDS)
+            for alert in alerts:
+                alert.status = "sending"
+                alert.attempts = (alert.attempts or 0) + 1
+                alert.next_attempt_at = lease_until
+            await db.commit()
+            return alerts
+
+    async def record_results(self, results: list):
+        """Store each (alert, error) outcome; rows reclaimed after their lease ran out are left alone."""
+        async with AsyncSessionLocal() as db:
+            now = datetime.now(timezone.utc)
+            for alert, error in results:
+                if error is None:
+                    values = {"status": "sent", "sent_at": now, "last_error": None}
+                elif alert.attempts >= COMPANION_MAX_ATTEMPTS:
+                    values = {"status": "failed", "last_error": error}
+                else:
+                    values = {
+                        "status": "pending",
+                        "last_error": error,
+                        "next_attempt_at": now + timedelta(seconds=retry_delay(alert.attempts)),
+                    }
+                await db.execute(
+                    update(CompanionAlert)
+                    .where(
+                        CompanionAlert.id == alert.id,
+                        CompanionAlert.status == "sending",
+                        CompanionAlert.attempts == alert.attempts,
+                    )
+                    .values(**values)
+                )
+            await db.commit()
+
+    async def dispatch_batch(self) -> int:
+        """Deliver one batch of due alerts. Returns how many were claimed."""
+        if self.channel is None:
+            self.channel = create_channel()
+        alerts = await self.claim_batch()
+        results = []
+        for alert in alerts:
+            try:
+                await self.channel.send(alert.contact.phone, alert.message)
+                results.append((alert, None))
+                self.sent += 1
+            except Exception as e:
+                results.append((alert, str(e)[:500]))
+                if alert.attempts >= COMPANION_MAX_ATTEMPTS:
+                    self.failed += 1
+                    logger.error(f"Companion alert {alert.id} failed after {alert.attempts} attempts: {e}")
+                else:
+                    logger.warning(f"Companion alert {alert.id} attempt {alert.attempts} failed: {e}")
+        if results:
+            await self.record_results(results)
+        return len(alerts)
+
+    def notify(self):
+        """Wake the dispatcher now instead of at the next interval (call after queueing alerts)."""
+        self.wake()
+
+    async def run_once(self):
+        while await self.dispatch_batch() >= COMPANION_DISPATCH_BATCH:
+            pass
+
+
+companion_dispatcher = CompanionDispatcher()
@@ -0,0 +1,103 @@
+"""
+Guide content versions — a hash over a guide and its steps, stored on Guide.content_hash.
+Used as the ETag of /api/guides/{id} and (with the viewer and build) of the guide page.
+"""
+import hashlib
+import json
+import os
+from datetime import timezone
+from email.utils import format_datetime
+
+from sqlalchemy import select, update, func
+
+from app.models import Guide, GuideStep
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+# Templates and asset bundles that shape the rendered guide page; a deploy that changes them changes every page ETag
+_PAGE_INPUTS = ("base.html", "guide.html")
+
+
+def guide_content_hash(guide, steps) -> str:
+    """Works on ORM rows, catalog snapshots or plain rows with the same attribute names."""
+    payload = {
+        "title": guide.title,
+        "content": guide.content,
+        "status": guide.status,
+        "image_url": guide.image_url,
+        "priority": guide.priority,
+        "help_options": guide.help_options,
+        "steps": [[s.step_number, s.title, s.description, s.image_url] for s in steps],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+async def refresh_guide_version(db, guide_id: int):
+    """
+    Recompute one guide's content hash from its committed-or-flushed rows and bump updated_at
+    if it changed (step-only edits included). Caller commits.
+    """
+    await db.flush()
+    guide = (await db.execute(
+        select(Guide.title, Guide.content, Guide.status, Guide.image_url, Guide.priority, Guide.help_options)
+        .where(Guide.id == guide_id)
+    )).first()
+    if guide is None:
+        return
+    steps = (await db.execute(
+        select(GuideStep.step_number, GuideStep.title, GuideStep.description, GuideStep.image_url)
+        .where(GuideStep.guide_id == guide_id)
+        .order_by(GuideStep.step_number)
+    )).all()
+
+    content_hash = guide_content_hash(guide, steps)
+    await db.execute(
+        update(Guide)
+        .where(Guide.id == guide_id, Guide.content_hash.is_distinct_from(content_hash))
+        .values(content_hash=content_hash, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _build_version() -> str:
+    from app.utils.assets import MANIFEST_PATH
+
+    digest = hashlib.sha256()
+    for path in [os.path.join(TEMPLATE_DIR, name) for name in _PAGE_INPUTS] + [MANIFEST_PATH]:
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"-")
+    return digest.hexdigest()[:8]
+
+
+BUILD_VERSION = _build_version()
+
+
+def page_etag(content_hash: str, user: dict = None) -> str:
+    """Weak ETag for a rendered guide page: content, build and the viewer (the header shows their name)."""
+    viewer = f"{user.get('id')}:{user.get('name')}:{user.get('role')}" if user else "anon"
+    viewer_hash = hashlib.sha256(viewer.encode("utf-8")).hexdigest()[:8]
+    return f'W/"{content_hash}-{BUILD_VERSION}-{viewer_hash}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match comparison (weak, per RFC 9110): any listed tag or '*' matches."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == bare:
+            return True
+    return False
+
+
+def validator_headers(etag: str, last_modified=None) -> dict:
+    """ETag/Last-Modified plus no-cache, so browsers and the service worker always revalidate (cheaply)."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Cookie"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
@@ -0,0 +1,137 @@
+"""AI help response cache — Turkish-normalized, n-gram matched, LRU + TTL, persisted in `ai_help_cache`."""
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import AIHelpCache
+from app.utils.text import normalize_text, similarity
+
+logger = logging.getLogger(__name__)
+
+HELP_CACHE_MAX_ENTRIES = int(os.getenv("HELP_CACHE_MAX_ENTRIES", "2000"))
+HELP_CACHE_TTL_SECONDS = int(os.getenv("HELP_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+HELP_CACHE_SIMILARITY = float(os.getenv("HELP_CACHE_SIMILARITY", "0.6"))
+
+
+class HelpResponseCache:
+    """
+    In-memory LRU of help answers keyed by (guide_id, content_hash, step_number, normalized query).
+    Each (guide_id, content_hash, step_number) bucket is hydrated from the database on first use, so
+    answers survive restarts; writes go to both layers. An edited guide has a new content_hash,
+    so every worker misses on its old answers without being told.
+    """
+
+    def __init__(self, max_entries: int = HELP_CACHE_MAX_ENTRIES, ttl_seconds: int = HELP_CACHE_TTL_SECONDS,
+                 threshold: float = HELP_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries = OrderedDict()  # (guide_id, content_hash, step_number, norm) -> (response, created_ts)
+        self._buckets = {}  # (guide_id, content_hash, step_number) -> set of norms
+        self._loaded = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, bucket: tuple, norm: str, response: str, created_ts: float):
+        key = bucket + (norm,)
+        self._entries[key] = (response, created_ts)
+        self._entries.move_to_end(key)
+        self._buckets.setdefault(bucket, set()).add(norm)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        bucket_key = key[:3]
+        bucket = self._buckets.get(bucket_key)
+        if bucket is not None:
+            bucket.discard(key[3])
+            if not bucket:
+                # Evicted answers may still be in the table: hydrate again on the next lookup
+                del self._buckets[bucket_key]
+                self._loaded.discard(bucket_key)
+
+    def _match(self, bucket: tuple, norm: str):
+        now = time.time()
+        best_key, best_score = None, 0.0
+        for candidate in list(self._buckets.get(bucket, ())):
+            key = bucket + (candidate,)
+            _, created_ts = self._entries[key]
+            if now - created_ts > self.ttl_seconds:
+                self._drop(key)
+                continue
+            score = similarity(norm, candidate)
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key and best_score >= self.threshold:
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][0]
+        return None
+
+    async def _hydrate(self, db, bucket: tuple):
+        guide_id, content_hash, step_number = bucket
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+        result = await db.execute(
+            select(AIHelpCache).where(
+                AIHelpCache.guide_id == guide_id,
+                AIHelpCache.content_hash == content_hash,
+                AIHelpCache.step_number == step_number,
+                AIHelpCache.created_at >= cutoff
+            )
+        )
+        for row in result.scalars().all():
+            self._store(bucket, row.normalized_query, row.response, row.created_at.timestamp())
+        self._loaded.add(bucket)
+
+    async def get(self, db, guide_id: int, content_hash: str, step_number: int, query: str):
+        norm = normalize_text(query)
+        if not norm:
+            return None
+        bucket = (guide_id, content_hash, step_number)
+        if bucket not in self._loaded:
+            await self._hydrate(db, bucket)
+        response = self._match(bucket, norm)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def put(self, db, guide_id: int, content_hash: str, step_number: int, query: str, response: str):
+        norm = normalize_text(query)
+        if not norm:
+            return
+        now = datetime.now(timezone.utc)
+        stmt = insert(AIHelpCache).values(
+            guide_id=guide_id, content_hash=content_hash, step_number=step_number,
+            normalized_query=norm, response=response, created_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["guide_id", "content_hash", "step_number", "normalized_query"],
+            set_={"response": stmt.excluded.response, "created_at": stmt.excluded.created_at}
+        )
+        try:
+            await db.execute(stmt)
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Help cache persist failed: {e}")
+            await db.rollback()
+        self._store((guide_id, content_hash, step_number), norm, response, now.timestamp())
+
+    async def invalidate_guide(self, db, guide_id: int):
+        """
+        Delete every stored answer for a guide (call when its steps change). Versioned keys already
+        keep stale answers from being served; this only frees the space early.
+        """
+        for key in [k for k in self._entries if k[0] == guide_id]:
+            self._drop(key)
+        self._loaded = {b for b in self._loaded if b[0] != guide_id}
+        await db.execute(delete(AIHelpCache).where(AIHelpCache.guide_id == guide_id))
+
+
+help_cache = HelpResponseCache()
@@ -0,0 +1,116 @@
+"""Guide requests (ideas) — contention-free counting on a normalized key, plus a job that merges near-duplicates."""
+import asyncio
+import logging
+import os
+
+from sqlalchemy import select, delete, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import AsyncSessionLocal
+from app.models import Idea
+from app.utils.text import normalize_text, ascii_fold, similarity
+from app.utils.workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+IDEA_MERGE_SIMILARITY = float(os.getenv("IDEA_MERGE_SIMILARITY", "0.6"))
+# The unattended hourly run only folds near-identical requests; looser merges go through the admin
+IDEA_AUTO_MERGE_SIMILARITY = float(os.getenv("IDEA_AUTO_MERGE_SIMILARITY", "0.85"))
+IDEA_MERGE_INTERVAL = float(os.getenv("IDEA_MERGE_INTERVAL", "3600"))
+
+
+def idea_key(title: str) -> str:
+    """'E-Devlet Şifresi' -> 'edevletsifresi': Turkish case fold, ASCII fold, no punctuation or spaces."""
+    return "".join(ascii_fold(normalize_text(title)).split())
+
+
+async def record_idea(db, title: str):
+    """Single-statement upsert: concurrent requests for the same key never lose an increment. Caller commits."""
+    stmt = insert(Idea).values(title=title.strip(), normalized_title=idea_key(title), count=1)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["normalized_title"],
+        set_={"count": Idea.count + 1}
+    ))
+
+
+def cluster_ideas(ideas: list[tuple], threshold: float = IDEA_MERGE_SIMILARITY) -> list[list[tuple]]:
+    """
+    Greedy clustering of (id, key, count) tuples: the most requested idea seeds a cluster
+    and absorbs every remaining idea whose key is similar enough.
+    """
+    remaining = sorted(ideas, key=lambda i: (-i[2], i[0]))
+    clusters = []
+    while remaining:
+        seed, rest = remaining[0], remaining[1:]
+        cluster, remaining = [seed], []
+        for idea in rest:
+            if similarity(seed[1], idea[1]) >= threshold:
+                cluster.append(idea)
+            else:
+                remaining.append(idea)
+        clusters.append(cluster)
+    return clusters
+
+
+async def _load_keys() -> list[tuple]:
+    """(id, key, count, title) for every idea, read without locks; backfills keys missing since the first release."""
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(Idea.id, Idea.normalized_title, Idea.count, Idea.title))).all()
+        for idea_id, key, _, title in rows:
+            if not key:
+                await db.execute(update(Idea).where(Idea.id == idea_id).values(normalized_title=idea_key(title or "")))
+        await db.commit()
+    return [(i, key or idea_key(title or ""), count or 0, title) for i, key, count, title in rows]
+
+
+async def find_duplicate_ideas(threshold: float = IDEA_MERGE_SIMILARITY) -> list[list[tuple]]:
+    """Clusters of more than one idea, most requested first in each. Clustering is O(n²), so it runs off the event loop."""
+    ideas = await _load_keys()
+    clusters = await asyncio.to_thread(cluster_ideas, [idea[:3] for idea in ideas], threshold)
+    titles = {idea[0]: idea[3] for idea in ideas}
+    return [[(i, titles[i], count) for i, _, count in cluster] for cluster in clusters if len(cluster) > 1]
+
+
+async def _merge_cluster(ids: list[int]) -> int:
+    """Fold one cluster into its first id, locking only its rows. Returns rows removed."""
+    async with AsyncSessionLocal() as db:
+        # Live upserts on these rows wait for the merge instead of losing an increment
+        rows = (await db.execute(select(Idea).where(Idea.id.in_(ids)).order_by(Idea.id).with_for_update())).scalars().all()
+        if len(rows) < 2:
+            return 0
+        by_id = {idea.id: idea for idea in rows}
+        canonical = by_id.get(ids[0]) or max(rows, key=lambda i: (i.count or 0, -i.id))
+        removed = [idea.id for idea in rows if idea is not canonical]
+        canonical.count = sum(idea.count or 0 for idea in rows)
+        await db.execute(delete(Idea).where(Idea.id.in_(removed)))
+        await db.commit()
+    return len(removed)
+
+
+async def merge_idea_clusters(clusters: list[list[int]]) -> int:
+    """Merge clusters of idea ids (e.g. the ones an admin confirmed), each into its first id. Returns rows removed."""
+    removed = 0
+    for ids in clusters:
+        removed += await _merge_cluster(ids)
+    if removed:
+        logger.info(f"Idea merge: folded {removed} duplicates")
+    return removed
+
+
+async def merge_duplicate_ideas(threshold: float = IDEA_AUTO_MERGE_SIMILARITY) -> int:
+    """Fold near-duplicate ideas into the most requested one of each cluster. Returns rows removed."""
+    return await merge_idea_clusters([[idea[0] for idea in cluster] for cluster in await find_duplicate_ideas(threshold)])
+
+
+class IdeaMergeWorker(PeriodicWorker):
+    name = "Idea merge"
+    cancel_on_stop = True  # one short transaction per cluster
+
+    def __init__(self, interval: float = IDEA_MERGE_INTERVAL):
+        super().__init__(interval)
+
+    async def run_once(self):
+        await merge_duplicate_ideas(IDEA_AUTO_MERGE_SIMILARITY)
+
+
+idea_merge_worker = IdeaMergeWorker()
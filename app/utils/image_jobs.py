@@ -0,0 +1,109 @@
+"""Background step-image jobs — generate SVGs concurrently and patch GuideStep.image_url as they finish."""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import update
+
+from app.database import AsyncSessionLocal
+from app.models import GuideStep
+from app.utils.ai_utils import generate_step_image
+from app.utils.catalog import guide_catalog
+from app.utils.guide_version import refresh_guide_version
+from app.utils.svg_store import refresh_reference_counts
+
+logger = logging.getLogger(__name__)
+
+IMAGE_JOB_CONCURRENCY = int(os.getenv("IMAGE_JOB_CONCURRENCY", "3"))
+IMAGE_JOB_HISTORY = 100
+
+# Shown until the generated SVG is patched in (or kept if generation fails)
+PLACEHOLDER_IMAGE_URL = "/static/img/ui_selection.png"
+
+_jobs = OrderedDict()  # job_id -> job dict
+_tasks = set()  # strong refs so running jobs are not garbage-collected
+_semaphore = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(IMAGE_JOB_CONCURRENCY)
+    return _semaphore
+
+
+def needs_generated_image(image_url: str) -> bool:
+    """True for steps with no image or only a generic ui_* placeholder."""
+    return not image_url or "static/img/ui_" in image_url
+
+
+def enqueue_step_images(guide_id: int, guide_title: str, steps: list[GuideStep]) -> str:
+    """Start a job generating images for the given (already committed) steps. Returns the job id."""
+    job_id = uuid.uuid4().hex[:12]
+    _jobs[job_id] = {
+        "id": job_id,
+        "guide_id": guide_id,
+        "status": "running",
+        "total": len(steps),
+        "done": 0,
+        "failed": 0,
+        "created_at": time.time(),
+        "finished_at": None,
+        "steps": [
+            {"step_id": s.id, "step_number": s.step_number, "status": "pending", "image_url": s.image_url}
+            for s in steps
+        ],
+    }
+    while len(_jobs) > IMAGE_JOB_HISTORY:
+        _jobs.popitem(last=False)
+
+    task = asyncio.create_task(_run_job(_jobs[job_id], guide_title, [(s.title, s.description or "") for s in steps]))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job_id
+
+
+def get_job(job_id: str):
+    return _jobs.get(job_id)
+
+
+def list_jobs() -> list[dict]:
+    return list(reversed(_jobs.values()))
+
+
+async def _run_job(job: dict, guide_title: str, texts: list[tuple]):
+    await asyncio.gather(*[
+        _run_step(job, entry, guide_title, title, description)
+        for entry, (title, description) in zip(job["steps"], texts)
+    ])
+    job["status"] = "failed" if job["failed"] == job["total"] and job["total"] else "done"
+    job["finished_at"] = time.time()
+    logger.info(f"Image job {job['id']} finished: {job['done']} ok, {job['failed']} failed")
+
+
+async def _run_step(job: dict, entry: dict, guide_title: str, title: str, description: str):
+    async with _get_semaphore():
+        entry["status"] = "running"
+        try:
+            url = await generate_step_image(guide_title, title, description)
+        except Exception as e:
+            logger.error(f"Image job {job['id']} step {entry['step_id']} crashed: {e}")
+            url = None
+
+        if not url:
+            entry["status"] = "failed"
+            job["failed"] += 1
+            return
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(GuideStep).where(GuideStep.id == entry["step_id"]).values(image_url=url))
+            await refresh_guide_version(db, job["guide_id"])
+            await refresh_reference_counts(db, [entry["image_url"], url])
+            await db.commit()
+        guide_catalog.invalidate()
+        entry["status"] = "done"
+        entry["image_url"] = url
+        job["done"] += 1
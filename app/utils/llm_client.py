@@ -0,0 +1,108 @@
+"""Async Gemini client — timeouts, bounded concurrency and thread-pool offload."""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+
+# Dedicated pool so blocking SDK calls never compete with the default executor
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+_semaphore = None
+
+
+class LLMTimeoutError(Exception):
+    """Raised when a Gemini call does not finish within its timeout."""
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    # Created lazily so it binds to the running event loop
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def saturated() -> bool:
+    """True when every concurrency slot is taken, so a new call would have to queue."""
+    return _semaphore is not None and _semaphore.locked()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the LLM thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, lambda: func(*args, **kwargs))
+
+
+async def generate_content(model_name: str, prompt: str, generation_config: dict = None, timeout: float = None):
+    """
+    Calls `GenerativeModel.generate_content` without blocking the event loop.
+    Uses the SDK's native async API when available, otherwise offloads to the thread pool.
+    At most LLM_MAX_CONCURRENCY calls are in flight; waiting for a slot counts towards the timeout.
+    """
+    timeout = timeout or LLM_DEFAULT_TIMEOUT
+    model = genai.GenerativeModel(model_name)
+
+    async def _call():
+        async with _get_semaphore():
+            if hasattr(model, "generate_content_async"):
+                return await model.generate_content_async(prompt, generation_config=generation_config)
+            return await run_blocking(model.generate_content, prompt, generation_config=generation_config)
+
+    try:
+        return await asyncio.wait_for(_call(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"LLM call to {model_name} timed out after {timeout}s")
+        raise LLMTimeoutError(f"{model_name} timed out after {timeout}s")
+
+
+def token_usage(response) -> tuple:
+    """(prompt tokens, output tokens) from a response or stream chunk's usage_metadata, or None."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0
+
+
+async def stream_content(model_name: str, prompt: str, timeout: float = None, usage: dict = None):
+    """
+    Async iterator over the text chunks of a streamed `generate_content`.
+    `timeout` bounds the wait for each chunk (including the first), not the whole answer.
+    The concurrency slot is held until the stream ends or the consumer stops iterating.
+    If `usage` is given it receives the final chunk's token counts as "prompt" and "output".
+    """
+    timeout = timeout or LLM_DEFAULT_TIMEOUT
+    model = genai.GenerativeModel(model_name)
+
+    async with _get_semaphore():
+        try:
+            if hasattr(model, "generate_content_async"):
+                response = await asyncio.wait_for(model.generate_content_async(prompt, stream=True), timeout=timeout)
+                chunks = response.__aiter__()
+                next_chunk = chunks.__anext__
+            else:
+                response = await asyncio.wait_for(
+                    run_blocking(model.generate_content, prompt, stream=True), timeout=timeout
+                )
+                chunks = iter(response)
+                # next() raising StopIteration inside an executor future is not allowed, so use a sentinel
+                next_chunk = lambda: run_blocking(next, chunks, None)
+            while True:
+                chunk = await asyncio.wait_for(next_chunk(), timeout=timeout)
+                if chunk is None:
+                    return
+                counts = token_usage(chunk)
+                if counts and usage is not None:
+                    usage["prompt"], usage["output"] = counts
+                if chunk.text:
+                    yield chunk.text
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            logger.error(f"LLM stream from {model_name} stalled for {timeout}s")
+            raise LLMTimeoutError(f"{model_name} stream stalled for {timeout}s")
@@ -0,0 +1,343 @@
+"""
+LLM routing — per-task model chains over pluggable providers, with hedged requests and ordered fallback.
+
+Every AI task (help, guide, fraud, svg) has a chain of "provider:model" targets. A call goes to
+the first target; if it has not answered after the task's hedge delay, an identical request is
+sent and whichever answers first wins. If a target fails or times out, the next one is tried.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+from app.utils import llm_client, metrics
+from app.utils.llm_client import LLMTimeoutError
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+
+# First model is the primary, the rest are fallbacks in order
+DEFAULT_ROUTES = {
+    "help": ["gemini-flash-latest", "gemini-2.0-flash"],
+    "guide": ["gemini-flash-latest", "gemini-2.0-flash"],
+    "fraud": ["gemini-flash-latest", "gemini-2.0-flash"],
+    "svg": ["gemini-2.0-flash", "gemini-flash-latest"],
+}
+# Only the help answer has a user waiting on it; background jobs don't pay for duplicate calls
+DEFAULT_HEDGE_MS = {"help": 2500, "guide": 0, "fraud": 0, "svg": 0}
+
+
+class LLMUnavailableError(Exception):
+    """Raised when every target in a task's chain failed or none is configured."""
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self):
+        self.available = bool(os.getenv("GOOGLE_API_KEY"))
+
+    def saturated(self) -> bool:
+        return llm_client.saturated()
+
+    async def generate(self, model: str, prompt: str, generation_config: dict = None, timeout: float = None):
+        return await llm_client.generate_content(model, prompt, generation_config=generation_config, timeout=timeout)
+
+    def stream(self, model: str, prompt: str, timeout: float = None, usage: dict = None):
+        return llm_client.stream_content(model, prompt, timeout=timeout, usage=usage)
+
+
+class FakeUsage:
+    def __init__(self, prompt: str, text: str):
+        # Whitespace words stand in for tokens
+        self.prompt_token_count = len(prompt.split())
+        self.candidates_token_count = len(text.split())
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt: str = ""):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt, text)
+
+
+FAKE_HELP = "1. Ekranın altındaki mavi 'Devam' düğmesine dokunun.\n2. Düğmeyi göremiyorsanız sayfayı yavaşça yukarı kaydırın."
+FAKE_SCENARIO = {
+    "scenario": "Kargo firmasından geldiğini söyleyen bir mesajda, paketinizin teslimi için bir linke tıklayıp kart bilgilerinizi girmeniz isteniyor.",
+    "correct_action": "hangup",
+    "explanation": "Kargo firmaları kart bilgisi istemez. Linke tıklamayın, firmayı kendi numarasından arayın.",
+    "difficulty": 1,
+}
+FAKE_GUIDE = {
+    "title": "Örnek Rehber",
+    "steps": [
+        {"step_number": 1, "title": "Uygulamayı Açın", "description": "Telefonunuzda uygulamayı bulun ve dokunun.", "image_url": "/static/img/ui_app_open.png"},
+        {"step_number": 2, "title": "Giriş Yapın", "description": "Bilgilerinizi sakince girin.", "image_url": "/static/img/ui_login.png"},
+        {"step_number": 3, "title": "Tamamlayın", "description": "Onay ekranını görünce işlem bitmiştir.", "image_url": "/static/img/ui_success.png"},
+    ],
+    "help_options": ["Bende farklı görünüyor", "Devam edemiyorum", "Başka bir sorun"],
+}
+FAKE_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 240"><rect width="400" height="240" fill="#FAFAFA"/>'
+    '<rect x="150" y="40" width="100" height="160" rx="12" fill="none" stroke="#4A90D9" stroke-width="3"/>'
+    '<circle cx="200" cy="170" r="10" fill="#F5A623"/></svg>'
+)
+
+
+class FakeProvider:
+    """
+    Offline, deterministic provider: canned answers shaped like each task's output,
+    a fixed latency with every `slow_every`-th call 10x slower, and models that always fail.
+    """
+    name = "fake"
+    available = True
+
+    def __init__(self, latency_ms: float = None, slow_every: int = None, fail_models=None):
+        self.latency_ms = float(os.getenv("LLM_FAKE_LATENCY_MS", "0")) if latency_ms is None else latency_ms
+        self.slow_every = int(os.getenv("LLM_FAKE_SLOW_EVERY", "0")) if slow_every is None else slow_every
+        if fail_models is None:
+            fail_models = [m for m in os.getenv("LLM_FAKE_FAIL_MODELS", "").split(",") if m]
+        self.fail_models = set(fail_models)
+        self.calls = 0
+
+    def saturated(self) -> bool:
+        return False
+
+    def delay(self) -> float:
+        """Seconds the next call takes."""
+        self.calls += 1
+        ms = self.latency_ms
+        if self.slow_every and self.calls % self.slow_every == 0:
+            ms *= 10
+        return ms / 1000
+
+    def respond(self, prompt: str, generation_config: dict = None) -> str:
+        if generation_config and generation_config.get("response_mime_type") == "application/json":
+            return json.dumps(FAKE_GUIDE if '"steps"' in prompt else FAKE_SCENARIO, ensure_ascii=False)
+        if "SVG" in prompt:
+            return FAKE_SVG
+        return FAKE_HELP
+
+    async def generate(self, model: str, prompt: str, generation_config: dict = None, timeout: float = None):
+        delay = self.delay()
+        timeout = timeout or llm_client.LLM_DEFAULT_TIMEOUT
+        if delay > timeout:
+            await asyncio.sleep(timeout)
+            raise LLMTimeoutError(f"{model} timed out after {timeout}s")
+        await asyncio.sleep(delay)
+        if model in self.fail_models:
+            raise RuntimeError(f"fake model {model} is down")
+        return FakeResponse(self.respond(prompt, generation_config), prompt)
+
+    async def stream(self, model: str, prompt: str, timeout: float = None, usage: dict = None):
+        """The same answer as generate(), a word at a time; the latency is paid before the first word."""
+        response = await self.generate(model, prompt, timeout=timeout)
+        if usage is not None:
+            usage["prompt"] = response.usage_metadata.prompt_token_count
+            usage["output"] = response.usage_metadata.candidates_token_count
+        words = response.text.split(" ")
+        for index, word in enumerate(words):
+            if index:
+                await asyncio.sleep(0.01)
+            yield word if index == len(words) - 1 else word + " "
+
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "fake": FakeProvider,
+}
+
+
+def create_provider(name: str):
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {name}")
+    return PROVIDERS[name]()
+
+
+def parse_chain(spec: str, default_provider: str = LLM_PROVIDER) -> list:
+    """'gemini:gemini-flash-latest, fake:help' -> [("gemini", "gemini-flash-latest"), ("fake", "help")]."""
+    chain = []
+    for target in spec.split(","):
+        target = target.strip()
+        if not target:
+            continue
+        provider, _, model = target.rpartition(":")
+        chain.append((provider or default_provider, model))
+    return chain
+
+
+def routes_from_env() -> dict:
+    """LLM_ROUTE_<TASK> overrides a task's chain; otherwise the default models on LLM_PROVIDER."""
+    routes = {}
+    for task, models in DEFAULT_ROUTES.items():
+        spec = os.getenv(f"LLM_ROUTE_{task.upper()}")
+        routes[task] = parse_chain(spec) if spec else [(LLM_PROVIDER, model) for model in models]
+    return routes
+
+
+def hedge_delays_from_env() -> dict:
+    return {
+        task: float(os.getenv(f"LLM_HEDGE_{task.upper()}_MS", str(default)))
+        for task, default in DEFAULT_HEDGE_MS.items()
+    }
+
+
+class LLMRouter:
+    def __init__(self, routes: dict = None, hedge_ms: dict = None, providers: dict = None):
+        self.routes = routes if routes is not None else routes_from_env()
+        self.hedge_ms = hedge_ms if hedge_ms is not None else hedge_delays_from_env()
+        self.providers = dict(providers or {})
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    def provider(self, name: str):
+        if name not in self.providers:
+            self.providers[name] = create_provider(name)
+        return self.providers[name]
+
+    def set_provider(self, name: str, provider):
+        """Replace the provider behind `name` for every route (e.g. a fake in benchmarks)."""
+        self.providers[name] = provider
+
+    def available(self, task: str) -> bool:
+        return any(self.provider(name).available for name, _ in self.routes.get(task, []))
+
+    async def generate(self, task: str, prompt: str, generation_config: dict = None, timeout: float = None):
+        """Response from the first target in `task`'s chain that answers; raises LLMUnavailableError."""
+        self.calls += 1
+        last_error = None
+        for name, model in self.routes.get(task, []):
+            provider = self.provider(name)
+            if not provider.available:
+                continue
+            if last_error is not None:
+                self.fallbacks += 1
+                logger.warning(f"LLM {task}: falling back to {name}:{model}")
+            try:
+                response = await self._hedged(
+                    task, model, "generate", provider,
+                    lambda: provider.generate(model, prompt, generation_config=generation_config, timeout=timeout),
+                )
+                _record_tokens(task, model, llm_client.token_usage(response))
+                return response
+            except Exception as e:
+                logger.error(f"LLM {task}: {name}:{model} failed: {e}")
+                last_error = e
+        self.failures += 1
+        raise LLMUnavailableError(f"no model answered for {task}") from last_error
+
+    async def stream(self, task: str, prompt: str, timeout: float = None):
+        """
+        Async iterator of text chunks. Hedging and fallback race for the first chunk; once a
+        stream has produced text it is committed to, and a later failure propagates.
+        """
+        self.calls += 1
+        last_error = None
+        for name, model in self.routes.get(task, []):
+            provider = self.provider(name)
+            if not provider.available:
+                continue
+            if last_error is not None:
+                self.fallbacks += 1
+                logger.warning(f"LLM {task}: falling back to {name}:{model}")
+
+            def start_stream():
+                # Each attempt fills its own usage dict; only the winner's is recorded
+                usage = {}
+                return _first_chunk(provider.stream(model, prompt, timeout=timeout, usage=usage), usage)
+
+            try:
+                chunks, first, usage = await self._hedged(
+                    task, model, "stream", provider, start_stream,
+                    discard=lambda result: asyncio.ensure_future(result[0].aclose()),
+                )
+            except Exception as e:
+                logger.error(f"LLM {task}: {name}:{model} stream failed: {e}")
+                last_error = e
+                continue
+            try:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+            if usage:
+                _record_tokens(task, model, (usage.get("prompt", 0), usage.get("output", 0)))
+            return
+        self.failures += 1
+        raise LLMUnavailableError(f"no model answered for {task}") from last_error
+
+    async def _hedged(self, task: str, model: str, mode: str, provider, start, discard=None):
+        """
+        Await `start()`; if it is still running after the task's hedge delay, race a second `start()`.
+        Losing attempts are cancelled, or passed to `discard` if they also finished.
+        """
+        async def timed():
+            started, outcome = time.perf_counter(), "error"
+            try:
+                result = await start()
+                outcome = "ok"
+                return result
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                metrics.llm_request_seconds.observe(
+                    time.perf_counter() - started, task=task, model=model, mode=mode, outcome=outcome
+                )
+
+        def attempt():
+            return asyncio.ensure_future(timed())
+
+        attempts = [attempt()]
+        winner = None
+        try:
+            delay = self.hedge_ms.get(task, 0)
+            # A duplicate only helps if it can start right away; under load it just adds queueing
+            if delay and not provider.saturated():
+                done, _ = await asyncio.wait(attempts, timeout=delay / 1000)
+                if not done and not provider.saturated():
+                    self.hedges += 1
+                    attempts.append(attempt())
+
+            pending, error = set(attempts), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    if finished.exception() is None:
+                        winner = finished
+                        if finished is not attempts[0]:
+                            self.hedge_wins += 1
+                        return finished.result()
+                    error = finished.exception()
+            raise error
+        finally:
+            for other in attempts:
+                if not other.done():
+                    other.cancel()
+                elif other is not winner and discard and not other.cancelled() and other.exception() is None:
+                    discard(other.result())
+
+
+async def _first_chunk(chunks, usage: dict) -> tuple:
+    """(stream, first chunk, usage), so a stream can be raced on its time-to-first-chunk."""
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        raise LLMUnavailableError("empty response")
+    return chunks, first, usage
+
+
+def _record_tokens(task: str, model: str, counts: tuple):
+    if not counts:
+        return
+    prompt_tokens, output_tokens = counts
+    metrics.llm_tokens.inc(prompt_tokens, task=task, model=model, kind="prompt")
+    metrics.llm_tokens.inc(output_tokens, task=task, model=model, kind="output")
+
+
+llm_router = LLMRouter()
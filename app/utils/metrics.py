@@ -0,0 +1,194 @@
+"""
+In-process metrics rendered in the Prometheus text format at /metrics.
+
+Request, SQL and LLM code records into the counters and histograms below as it runs.
+Caches, the connection pool and workers keep their own plain counters; collectors registered
+with `register_collector` read those at scrape time. Values are per process.
+"""
+import os
+import threading
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        # SQL hooks also fire from executor threads (startup DDL, sync engine)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+# HTTP
+http_requests_in_flight = Gauge("http_requests_in_flight", "Requests currently being handled.", ["method"])
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "Time until the response headers are ready, by route template.",
+    ["method", "route", "status"],
+)
+http_request_db_statements = Histogram(
+    "http_request_db_statements", "SQL statements run while handling one request.", ["method", "route"],
+    buckets=COUNT_BUCKETS,
+)
+
+# SQL
+db_statement_seconds = Histogram("db_statement_duration_seconds", "SQL statement execution time.", ["verb"])
+
+# LLM
+llm_request_seconds = Histogram(
+    "llm_request_duration_seconds",
+    "LLM attempt latency (time to the first chunk for streams), including hedges and fallbacks.",
+    ["task", "model", "mode", "outcome"], buckets=LLM_BUCKETS,
+)
+llm_prompt_tokens = Histogram(
+    "llm_prompt_tokens_estimated", "Estimated prompt size as built, before sending.", ["task"],
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 4000, 8000),
+)
+llm_tokens = Counter("llm_tokens_total", "Tokens reported by the provider for answers that were used.", ["task", "model", "kind"])
+
+
+def sql_verb(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+def register_collector(collect):
+    """`collect()` returns [(name, kind, help, [(labels dict, value), ...]), ...] at scrape time."""
+    _collectors.append(collect)
+
+
+def cache_collector(caches: dict):
+    """Hit/miss counters of objects with `hits` and `misses` attributes, keyed by cache name."""
+    def collect():
+        return [
+            ("cache_hits_total", "counter", "Cache lookups answered from the cache.",
+             [({"cache": name}, cache.hits) for name, cache in caches.items()]),
+            ("cache_misses_total", "counter", "Cache lookups that had to load or compute.",
+             [({"cache": name}, cache.misses) for name, cache in caches.items()]),
+        ]
+    return collect
+
+
+def pool_collector(name: str, pool, capacity: int):
+    """Checked-out connections of a SQLAlchemy QueuePool against its pool_size + max_overflow."""
+    def collect():
+        checked_out = pool.checkedout()
+        return [
+            ("db_pool_connections_in_use", "gauge", "Connections checked out of the pool.", [({"pool": name}, checked_out)]),
+            ("db_pool_connections_idle", "gauge", "Open connections waiting in the pool.", [({"pool": name}, pool.checkedin())]),
+            ("db_pool_capacity", "gauge", "pool_size + max_overflow.", [({"pool": name}, capacity)]),
+            ("db_pool_saturation", "gauge", "Share of the pool capacity in use (1 = requests queue for a connection).",
+             [({"pool": name}, round(checked_out / capacity, 4) if capacity else 0)]),
+        ]
+    return collect
+
+
+def counter_collector(name: str, documentation: str, obj, label: str, attributes):
+    """Plain integer attributes of `obj` as one counter, e.g. companion_dispatcher.sent/failed."""
+    def collect():
+        return [(name, "counter", documentation, [({label: attr}, getattr(obj, attr)) for attr in attributes])]
+    return collect
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for name, kind, documentation, samples in collect():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+    return "\n".join(lines) + "\n"
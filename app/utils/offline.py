@@ -0,0 +1,57 @@
+"""Offline precache manifest — what the service worker downloads so published guides open without a network."""
+import hashlib
+import json
+
+from app.utils.assets import asset_manifest, BUNDLE_DIRS
+from app.utils.catalog import guide_catalog
+
+# Shell every page needs; bundles and images are added from the asset and guide catalogs
+CORE_URLS = (
+    "/",
+    "/offline",
+    "/static/manifest.json",
+    "/static/img/icon-192.png",
+    "/static/img/icon-512.png",
+    "https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap",
+)
+LOGO_URL = "/static/img/logo.png"
+
+_cached = (None, None)  # (catalog snapshot, manifest built from it)
+
+
+def _image_urls(url: str) -> list:
+    """The file a <picture> would most likely load on a phone, plus the <img> fallback."""
+    if not url:
+        return []
+    variant = asset_manifest.offline_variant(url)
+    return [variant, url] if variant else [url]
+
+
+def build_offline_manifest(snapshot) -> dict:
+    core = list(CORE_URLS) + asset_manifest.bundle_urls(BUNDLE_DIRS) + _image_urls(LOGO_URL)
+    pages, images, revisions = [], [], {}
+    for guide in snapshot.guides:
+        pages.append(f"/guide/{guide.id}")
+        revisions[f"/guide/{guide.id}"] = guide.content_hash
+        images.extend(_image_urls(guide.image_url))
+        for step in guide.steps:
+            images.extend(_image_urls(step.image_url))
+
+    manifest = {
+        "core": list(dict.fromkeys(core)),
+        "pages": pages,
+        "images": list(dict.fromkeys(images)),
+        # Content versions of the pages: an edited guide changes the manifest version and gets re-fetched
+        "revisions": revisions,
+    }
+    # Same content -> same version on every worker, so clients only re-sync on real changes
+    manifest["version"] = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:16]
+    return manifest
+
+
+async def get_offline_manifest() -> dict:
+    global _cached
+    snapshot = await guide_catalog.get()
+    if _cached[0] is not snapshot:
+        _cached = (snapshot, build_offline_manifest(snapshot))
+    return _cached[1]
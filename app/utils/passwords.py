@@ -0,0 +1,65 @@
+"""Password hashing — bcrypt on a dedicated thread pool so logins never stall the event loop."""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# Cost factor for new hashes; existing hashes with another cost are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so threads hash in parallel; keep this at or below the CPU count
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_semaphore = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    # Waiting here (not in the executor queue) keeps excess logins cancellable when clients disconnect
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+    return _semaphore
+
+
+def hash_password_sync(password: str, rounds: int = None) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds or BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def verify_password_sync(password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except ValueError:
+        # Malformed hash in the database
+        return False
+
+
+def hash_rounds(hashed_password: str):
+    """Cost factor of a '$2b$12$...' hash, or None if it cannot be parsed."""
+    parts = (hashed_password or "").split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return hash_rounds(hashed_password) != BCRYPT_ROUNDS
+
+
+async def _run(func, *args):
+    async with _get_semaphore():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, func, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(hash_password_sync, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    if not hashed_password:
+        return False
+    return await _run(verify_password_sync, password, hashed_password)
@@ -0,0 +1,110 @@
+"""Step-problem rollup — (guide, step, problem type, day) -> count, kept current in the reporting transaction."""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, delete, update, func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import Guide, StepProblem, StepProblemDaily
+
+PROBLEM_TYPE_MAX_LENGTH = 100
+
+
+def clean_problem_type(problem_type) -> str:
+    """Problem types are preset keys or free-text guide help options; keep them short and never empty."""
+    value = str(problem_type or "").strip()[:PROBLEM_TYPE_MAX_LENGTH]
+    return value or "general"
+
+
+async def record_problem(db, guide_id: int, step_number: int, problem_type: str):
+    """Add the raw StepProblem row and bump its rollup counter. Caller commits (both land together)."""
+    problem_type = clean_problem_type(problem_type)
+    db.add(StepProblem(guide_id=guide_id, step_number=step_number, problem_type=problem_type))
+
+    stmt = insert(StepProblemDaily).values(
+        guide_id=guide_id,
+        step_number=step_number,
+        problem_type=problem_type,
+        day=datetime.now(timezone.utc).date(),
+        count=1
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        constraint="uq_step_problem_daily",
+        set_={"count": StepProblemDaily.count + stmt.excluded.count}
+    ))
+
+
+async def remove_problem(db, problem: StepProblem):
+    """Delete one StepProblem and take it back out of its rollup counter. Caller commits."""
+    day = (problem.created_at or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+    rollup = (
+        StepProblemDaily.guide_id == problem.guide_id,
+        StepProblemDaily.step_number == problem.step_number,
+        StepProblemDaily.problem_type == clean_problem_type(problem.problem_type),
+        StepProblemDaily.day == day,
+    )
+    await db.delete(problem)
+    await db.execute(update(StepProblemDaily).where(*rollup).values(count=StepProblemDaily.count - 1))
+    await db.execute(delete(StepProblemDaily).where(*rollup, StepProblemDaily.count <= 0))
+
+
+async def delete_problems(db, guide_id: int = None, step_number: int = None):
+    """Delete the raw reports and their rollup rows, for one step or (no arguments) everything. Caller commits."""
+    for model in (StepProblem, StepProblemDaily):
+        stmt = delete(model)
+        if guide_id is not None:
+            stmt = stmt.where(model.guide_id == guide_id, model.step_number == step_number)
+        await db.execute(stmt)
+
+
+def backfill_rollup(conn):
+    """One-off (sync connection): seed an empty rollup from existing step_problems rows."""
+    if conn.execute(text("SELECT 1 FROM step_problem_daily LIMIT 1")).first():
+        return
+    conn.execute(text("""
+        INSERT INTO step_problem_daily (guide_id, step_number, problem_type, day, count)
+        SELECT guide_id, step_number, COALESCE(problem_type, 'general'), (created_at AT TIME ZONE 'UTC')::date, COUNT(*)
+        FROM step_problems
+        WHERE guide_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """))
+
+
+async def worst_steps(db, days: int = 7, limit: int = 10) -> list[dict]:
+    """Steps with the most reports over the last `days` UTC days, with a per-type breakdown."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    total = func.sum(StepProblemDaily.count).label("total")
+    top = (await db.execute(
+        select(StepProblemDaily.guide_id, Guide.title, StepProblemDaily.step_number, total)
+        .join(Guide, Guide.id == StepProblemDaily.guide_id)
+        .where(StepProblemDaily.day >= since)
+        .group_by(StepProblemDaily.guide_id, Guide.title, StepProblemDaily.step_number)
+        .order_by(total.desc(), StepProblemDaily.guide_id, StepProblemDaily.step_number)
+        .limit(limit)
+    )).all()
+    if not top:
+        return []
+
+    keys = {(r.guide_id, r.step_number) for r in top}
+    breakdown = {}
+    rows = (await db.execute(
+        select(StepProblemDaily.guide_id, StepProblemDaily.step_number, StepProblemDaily.problem_type,
+               func.sum(StepProblemDaily.count).label("count"))
+        .where(
+            StepProblemDaily.day >= since,
+            StepProblemDaily.guide_id.in_({k[0] for k in keys})
+        )
+        .group_by(StepProblemDaily.guide_id, StepProblemDaily.step_number, StepProblemDaily.problem_type)
+    )).all()
+    for r in rows:
+        if (r.guide_id, r.step_number) in keys:
+            breakdown.setdefault((r.guide_id, r.step_number), {})[r.problem_type] = r.count
+
+    return [
+        {
+            "guide_id": r.guide_id,
+            "guide_title": r.title,
+            "step_number": r.step_number,
+            "count": r.total,
+            "by_type": breakdown.get((r.guide_id, r.step_number), {})
+        } for r in top
+    ]
@@ -0,0 +1,99 @@
+"""Progress ingestion — coalesce step saves per (user, guide) in memory and flush them as one upsert."""
+import logging
+import os
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.database import AsyncSessionLocal
+from app.models import UserGuideProgress
+from app.utils.workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "2"))
+
+
+def upsert_progress_stmt(rows: list[dict], update_columns: tuple):
+    """INSERT ... ON CONFLICT (user_id, guide_id) DO UPDATE for the given columns."""
+    stmt = insert(UserGuideProgress).values(rows)
+    # Infer the unique index from its columns: init.sql leaves the constraint unnamed
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "guide_id"],
+        set_={col: getattr(stmt.excluded, col) for col in update_columns}
+    )
+
+
+class ProgressBuffer(PeriodicWorker):
+    """
+    Latest-wins buffer of (user_id, guide_id) -> (current_step, total_steps).
+    A burst of clicks on one guide becomes a single row in the next flush.
+    """
+    # Never cancelled mid-flush, so no batch is lost
+    name = "Progress flusher"
+
+    def __init__(self, interval: float = PROGRESS_FLUSH_INTERVAL):
+        super().__init__(interval)
+        self._pending = {}
+
+    def add(self, user_id: int, guide_id: int, current_step: int, total_steps: int):
+        self._pending[(user_id, guide_id)] = (current_step, total_steps)
+
+    def pending(self, user_id: int, guide_id: int):
+        """Unflushed (current_step, total_steps) for read-your-writes, or None."""
+        return self._pending.get((user_id, guide_id))
+
+    def _requeue(self, entries: dict):
+        """Put unflushed entries back for the next tick, unless a newer save has arrived since."""
+        for key, value in entries.items():
+            self._pending.setdefault(key, value)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        rows = [
+            {"user_id": user_id, "guide_id": guide_id, "current_step": step, "total_steps": total}
+            for (user_id, guide_id), (step, total) in batch.items()
+        ]
+        try:
+            await self._write(rows)
+        except Exception:
+            self._requeue(batch)
+            raise
+
+    async def _write(self, rows: list[dict]):
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.execute(upsert_progress_stmt(rows, ("current_step", "total_steps")))
+                await db.commit()
+                return
+            except Exception as e:
+                logger.error(f"Progress batch flush failed ({len(rows)} rows), retrying row by row: {e}")
+                await db.rollback()
+
+            # One bad row (e.g. a deleted guide) must not drop everyone else's progress
+            retry = {}
+            for row in rows:
+                try:
+                    await db.execute(upsert_progress_stmt([row], ("current_step", "total_steps")))
+                    await db.commit()
+                except IntegrityError as e:
+                    logger.error(f"Progress flush dropped {row}: {e}")
+                    await db.rollback()
+                except Exception as e:
+                    # Not the row's fault (connection lost, timeout): keep it for the next tick
+                    logger.error(f"Progress flush deferred {row}: {e}")
+                    retry[(row["user_id"], row["guide_id"])] = (row["current_step"], row["total_steps"])
+                    await db.rollback()
+            self._requeue(retry)
+
+    async def run_once(self):
+        await self.flush()
+
+    async def stop(self):
+        await super().stop()
+        await self.flush()
+
+
+progress_buffer = ProgressBuffer()
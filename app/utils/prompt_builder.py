@@ -0,0 +1,234 @@
+"""
+Token-budgeted help prompts.
+
+Each guide's steps are pre-rendered once into full and title-only lines and cached per content
+hash, so an edit anywhere (on any worker) yields a fresh context. A prompt then spends its budget
+on the current step and its neighbours first, and keeps only the latest failed attempts verbatim,
+folding older ones into a one-line summary.
+"""
+import logging
+import math
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.models import Guide
+from app.utils.catalog import guide_catalog
+
+logger = logging.getLogger(__name__)
+
+HELP_PROMPT_TOKEN_BUDGET = int(os.getenv("HELP_PROMPT_TOKEN_BUDGET", "1200"))
+HELP_HISTORY_WINDOW = int(os.getenv("HELP_HISTORY_WINDOW", "2"))
+GUIDE_CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("GUIDE_CONTEXT_CACHE_MAX_ENTRIES", "512"))
+
+# Gemini averages ~4 characters per token on English; Turkish suffixes push it lower
+CHARS_PER_TOKEN = 3.5
+
+STEP_DESCRIPTION_CHARS = 240
+QUERY_CHARS = 600
+ATTEMPT_CHARS = 500
+SUMMARY_ATTEMPT_CHARS = 80
+SUMMARY_MAX_ATTEMPTS = 5
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def clip(text: str, max_chars: int) -> str:
+    """Whitespace-collapsed `text`, cut at a word boundary to at most `max_chars`."""
+    text = " ".join((text or "").split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - 1]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut + "…"
+
+
+def _first_sentence(text: str) -> str:
+    return re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+
+
+@dataclass(frozen=True)
+class StepContext:
+    step_number: int
+    title: str
+    description: str
+    full_line: str
+    short_line: str
+
+
+@dataclass(frozen=True)
+class GuideContext:
+    guide_id: int
+    title: str
+    content_hash: str
+    steps: tuple  # StepContext, in step order
+
+    def step(self, step_number):
+        for step in self.steps:
+            if step.step_number == step_number:
+                return step
+        return None
+
+    def step_lines(self, step_number, budget_tokens: int) -> list:
+        """
+        Step lines that fit in `budget_tokens`: the current step and its neighbours in full,
+        the rest by title, nearest first; returned in step order.
+        """
+        current = step_number or 1
+        chosen, used = {}, 0
+        for step in sorted(self.steps, key=lambda s: (abs(s.step_number - current), s.step_number)):
+            near = abs(step.step_number - current) <= 1
+            for line in ((step.full_line, step.short_line) if near else (step.short_line,)):
+                cost = estimate_tokens(line) + 1
+                if used + cost <= budget_tokens:
+                    chosen[step.step_number] = line
+                    used += cost
+                    break
+        return [chosen[number] for number in sorted(chosen)]
+
+
+def build_guide_context(guide_id: int, title: str, content_hash: str, steps) -> GuideContext:
+    """`steps` are Guide.steps rows or catalog StepSnapshots."""
+    contexts = []
+    for s in sorted(steps, key=lambda s: s.step_number):
+        description = clip(s.description, STEP_DESCRIPTION_CHARS)
+        contexts.append(StepContext(
+            step_number=s.step_number,
+            title=s.title,
+            description=description,
+            full_line=f"- Adım {s.step_number}: {s.title} - {description}" if description else f"- Adım {s.step_number}: {s.title}",
+            short_line=f"- Adım {s.step_number}: {s.title}",
+        ))
+    return GuideContext(guide_id=guide_id, title=title, content_hash=content_hash, steps=tuple(contexts))
+
+
+class GuideContextCache:
+    """LRU of GuideContexts, reused while the guide's content_hash is unchanged."""
+
+    def __init__(self, max_entries: int = GUIDE_CONTEXT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # guide_id -> GuideContext
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, guide_id: int, content_hash: str):
+        context = self._entries.get(guide_id)
+        if context is not None and context.content_hash == content_hash:
+            self._entries.move_to_end(guide_id)
+            self.hits += 1
+            return context
+        return None
+
+    def _store(self, context: GuideContext) -> GuideContext:
+        self.misses += 1
+        self._entries[context.guide_id] = context
+        self._entries.move_to_end(context.guide_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return context
+
+    async def get(self, db, guide_id: int):
+        """The guide's context, or None if it does not exist."""
+        # Published guides come from the catalog snapshot without a query
+        snapshot = await guide_catalog.get_guide(guide_id)
+        if snapshot is not None:
+            return self._cached(guide_id, snapshot.content_hash) or self._store(
+                build_guide_context(snapshot.id, snapshot.title, snapshot.content_hash, snapshot.steps)
+            )
+
+        # Drafts (admin preview): one cheap query for the version before loading steps
+        content_hash = (await db.execute(select(Guide.content_hash).where(Guide.id == guide_id))).first()
+        if content_hash is None:
+            return None
+        cached = self._cached(guide_id, content_hash[0])
+        if cached:
+            return cached
+        guide = (await db.execute(
+            select(Guide).options(selectinload(Guide.steps)).where(Guide.id == guide_id)
+        )).scalars().first()
+        if guide is None:
+            return None
+        return self._store(build_guide_context(guide.id, guide.title, guide.content_hash, guide.steps))
+
+    def invalidate(self):
+        self._entries.clear()
+
+
+guide_contexts = GuideContextCache()
+
+
+@dataclass(frozen=True)
+class HelpPrompt:
+    text: str
+    tokens: int
+    steps_included: int
+    steps_total: int
+    attempts_verbatim: int
+    attempts_summarized: int
+
+    def log_line(self, guide_id=None) -> str:
+        return (
+            f"Help prompt ~{self.tokens} tokens (guide {guide_id or '-'}, steps {self.steps_included}/{self.steps_total}, "
+            f"attempts {self.attempts_verbatim} verbatim + {self.attempts_summarized} summarized)"
+        )
+
+
+def _history_block(recent: list, older: list) -> str:
+    if not recent and not older:
+        return ""
+    lines = []
+    if older:
+        shown = older[-SUMMARY_MAX_ATTEMPTS:]
+        gist = "; ".join(clip(_first_sentence(a), SUMMARY_ATTEMPT_CHARS) for a in shown)
+        lines.append(f"- (Daha önce {len(older)} öneri daha denendi, özetle: {gist})")
+    lines.extend(f"- {clip(a, ATTEMPT_CHARS)}" for a in recent)
+    history_text = "\n".join(lines)
+    return f"\n\nÖNEMLİ: Kullanıcı şu çözümleri denedi ama İŞE YARAMADI:\n{history_text}\n\nLütfen farklı ve daha basit bir çözüm sunun."
+
+
+def build_help_prompt(instructions: str, user_query: str, guide: GuideContext = None, step_number: int = None,
+                      failed_attempts: list = None, budget: int = HELP_PROMPT_TOKEN_BUDGET) -> HelpPrompt:
+    """
+    `instructions` + context + query + failed attempts, within about `budget` tokens.
+    Fixed parts (instructions, current step, query, recent attempts) are sized first;
+    guide steps fill whatever budget is left.
+    """
+    attempts = [a for a in (failed_attempts or []) if isinstance(a, str) and a.strip()]
+    window = max(HELP_HISTORY_WINDOW, 0)
+    recent, older = (attempts[-window:], attempts[:-window]) if window else ([], attempts)
+
+    current = guide.step(step_number) if guide else None
+    context = (
+        f"Rehber: {guide.title if guide else 'Genel Yardım'}, "
+        f"Şu anki Adım: {current.title if current else 'Genel Yardım'}. "
+        f"Adım Detayı: {current.description if current else ''}"
+    )
+    query = clip(user_query, QUERY_CHARS)
+
+    def assemble(step_lines, recent, older):
+        steps_context = ("\nRehberdeki Adımlar:\n" + "\n".join(step_lines) + "\n") if step_lines else ""
+        return f"{instructions}\nContext: {context}{steps_context}\nUser Query: {query}\n{_history_block(recent, older)}"
+
+    # Shrink the verbatim window before giving up the step list entirely
+    while recent and estimate_tokens(assemble([], recent, older)) > budget:
+        older, recent = older + recent[:1], recent[1:]
+
+    step_lines = []
+    if guide:
+        step_lines = guide.step_lines(step_number, budget - estimate_tokens(assemble([], recent, older)))
+    text = assemble(step_lines, recent, older)
+    return HelpPrompt(
+        text=text,
+        tokens=estimate_tokens(text),
+        steps_included=len(step_lines),
+        steps_total=len(guide.steps) if guide else 0,
+        attempts_verbatim=len(recent),
+        attempts_summarized=len(older),
+    )
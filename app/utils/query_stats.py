@@ -0,0 +1,76 @@
+"""Per-request SQL statement counting and timing, with an optional query budget for catching N+1 regressions."""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the budget; QUERY_BUDGET_STRICT=1 turns overruns into errors (use in tests/CI)
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "0"))
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"
+QUERY_STATS_HEADERS = os.getenv("QUERY_STATS_HEADERS", "0") == "1"
+
+_current = ContextVar("query_stats", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a tracked block runs more SQL statements than its budget allows."""
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.duration += elapsed
+        self.statements.append(statement)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Per execution, not per connection: a statement that raises never reaches the after hook
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    metrics.db_statement_seconds.observe(elapsed, verb=metrics.sql_verb(statement))
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+
+def install(engine):
+    """Attach the counters to a sync Engine (pass `async_engine.sync_engine` for the async one)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def track_queries():
+    """Collect stats for every statement run inside the block (including awaited tasks it spawns)."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int):
+    """`with query_budget(3): ...` raises QueryBudgetExceeded if the block runs more than 3 statements."""
+    with track_queries() as stats:
+        yield stats
+    if stats.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"{stats.count} queries (budget {max_queries}):\n" + "\n".join(stats.statements)
+        )
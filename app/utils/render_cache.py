@@ -0,0 +1,100 @@
+"""
+Rendered page cache — Jinja2 output for public pages, keyed by (template, content version, viewer kind).
+
+Pages are rendered once per key with a placeholder viewer; the viewer's name and id are
+substituted into the cached HTML on the way out, so every logged-in user shares one entry.
+"""
+import os
+from collections import OrderedDict
+
+from markupsafe import escape
+
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "256"))
+
+# NUL never occurs in rendered templates, and autoescaping leaves it untouched
+_NAME_TOKEN = "\x00user:name\x00"
+_INITIAL_TOKEN = "\x00user:initial\x00"
+_ID_TOKEN = "\x00user:id\x00"
+
+
+def _field(user, name: str):
+    if isinstance(user, dict):
+        return user.get(name)
+    return getattr(user, name, None)
+
+
+class _PlaceholderName(str):
+    """Stands in for user.name; `name[0]` (the avatar initial) yields its own token."""
+
+    def __getitem__(self, index):
+        if index == 0:
+            return _INITIAL_TOKEN
+        return str.__getitem__(self, index)
+
+
+class ViewerPlaceholder:
+    """What templates see as `user` while a shared entry is rendered: real flags, token identity."""
+
+    def __init__(self, role: str, voice_support: bool):
+        self.id = _ID_TOKEN
+        self.name = _PlaceholderName(_NAME_TOKEN)
+        self.role = role
+        self.voice_support = voice_support
+
+
+def viewer_key(user) -> tuple:
+    """The parts of the viewer a page can depend on besides their name and id."""
+    if not user:
+        return ("anon",)
+    return (_field(user, "role") or "user", bool(_field(user, "voice_support")))
+
+
+def personalize(html: str, user) -> str:
+    if not user:
+        return html
+    name = _field(user, "name") or ""
+    user_id = _field(user, "id")
+    return (
+        html.replace(_NAME_TOKEN, str(escape(name)))
+        .replace(_INITIAL_TOKEN, str(escape(name[:1])))
+        .replace(_ID_TOKEN, str(int(user_id)) if user_id is not None else "null")
+    )
+
+
+class RenderCache:
+    """Size-bounded LRU of rendered HTML."""
+
+    def __init__(self, max_entries: int = RENDER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        """Drop every entry; call after admin writes to guides."""
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def render(self, templates, name: str, context: dict, key: tuple, user=None) -> str:
+        """
+        Rendered `name` for this content key and viewer. `context` must not contain the user;
+        it is passed in separately so the cached copy never holds a real name.
+        """
+        cache_key = (name, key, viewer_key(user))
+        html = self._entries.get(cache_key)
+        if html is not None:
+            self.hits += 1
+            self._entries.move_to_end(cache_key)
+        else:
+            self.misses += 1
+            viewer = ViewerPlaceholder(*viewer_key(user)) if user else None
+            html = templates.get_template(name).render({**context, "user": viewer})
+            self._entries[cache_key] = html
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return personalize(html, user)
+
+
+render_cache = RenderCache()
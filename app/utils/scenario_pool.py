@@ -0,0 +1,131 @@
+"""Fraud scenario pool — in-memory id index for O(1) random picks, topped up ahead of demand by a refill worker."""
+import logging
+import os
+import random
+import time
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models import FraudScenario
+from app.utils.ai_utils import generate_fraud_scenario, OFFLINE_FRAUD_SCENARIO, FALLBACK_FRAUD_SCENARIO
+from app.utils.llm_router import llm_router
+from app.utils.text import normalize_text
+from app.utils.workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+SCENARIO_POOL_MIN = int(os.getenv("SCENARIO_POOL_MIN", "20"))
+SCENARIO_REFILL_BATCH = int(os.getenv("SCENARIO_REFILL_BATCH", "5"))
+SCENARIO_REFILL_INTERVAL = float(os.getenv("SCENARIO_REFILL_INTERVAL", "600"))
+# Other workers add and delete scenarios too; reload the id index at least this often
+SCENARIO_POOL_RELOAD_SECONDS = float(os.getenv("SCENARIO_POOL_RELOAD_SECONDS", "60"))
+
+VALID_ACTIONS = ("hangup", "believe")
+
+
+def validate_scenario(data) -> dict:
+    """Returns a cleaned scenario dict, or None if the model output is unusable."""
+    if not isinstance(data, dict):
+        return None
+    if data in (OFFLINE_FRAUD_SCENARIO, FALLBACK_FRAUD_SCENARIO):
+        return None
+    scenario = str(data.get("scenario") or "").strip()
+    explanation = str(data.get("explanation") or "").strip()
+    correct_action = str(data.get("correct_action") or "").strip().lower()
+    if not scenario or not explanation or correct_action not in VALID_ACTIONS:
+        return None
+    if len(scenario) > 600 or len(explanation) > 400:
+        return None
+    try:
+        difficulty = min(max(int(data.get("difficulty", 1)), 1), 3)
+    except (TypeError, ValueError):
+        difficulty = 1
+    return {"scenario": scenario, "correct_action": correct_action, "explanation": explanation, "difficulty": difficulty}
+
+
+class ScenarioPool(PeriodicWorker):
+    name = "Scenario refill"
+    cancel_on_stop = True  # refills commit once at the end; a cut-short batch is simply regenerated
+
+    def __init__(self, interval: float = SCENARIO_REFILL_INTERVAL):
+        super().__init__(interval)
+        self._ids = None  # flat list of all ids
+        self._by_difficulty = None  # difficulty -> list of ids
+        self._loaded_at = 0.0
+
+    def _stale(self) -> bool:
+        return self._ids is None or time.monotonic() - self._loaded_at > SCENARIO_POOL_RELOAD_SECONDS
+
+    def invalidate(self):
+        """Drop the id index; call after scenarios are added or deleted."""
+        self._ids = None
+        self._by_difficulty = None
+
+    async def _load(self, db):
+        result = await db.execute(select(FraudScenario.id, FraudScenario.difficulty))
+        ids, by_difficulty = [], {}
+        for scenario_id, difficulty in result.all():
+            ids.append(scenario_id)
+            by_difficulty.setdefault(difficulty or 1, []).append(scenario_id)
+        self._ids, self._by_difficulty = ids, by_difficulty
+        self._loaded_at = time.monotonic()
+
+    async def size(self, db) -> int:
+        if self._stale():
+            await self._load(db)
+        return len(self._ids)
+
+    async def pick(self, db, difficulty: int = None):
+        """A random FraudScenario (one primary-key lookup), or None if the pool is empty."""
+        for attempt in range(2):
+            reloaded = self._stale()
+            if reloaded:
+                await self._load(db)
+            candidates = self._by_difficulty.get(difficulty) if difficulty else self._ids
+            if not candidates:
+                candidates = self._ids
+            if candidates:
+                scenario = await db.get(FraudScenario, random.choice(candidates))
+                if scenario:
+                    return scenario
+            elif reloaded:
+                return None
+            # A dead id (deleted on another worker) or an empty index that another worker may have filled
+            self.invalidate()
+        return None
+
+    async def refill(self):
+        """Generate and store scenarios until the pool reaches SCENARIO_POOL_MIN (at most one batch per call)."""
+        if not llm_router.available("fraud"):
+            return 0
+        async with AsyncSessionLocal() as db:
+            missing = SCENARIO_POOL_MIN - await self.size(db)
+            if missing <= 0:
+                return 0
+            existing = {
+                normalize_text(text) for text in (await db.execute(select(FraudScenario.scenario))).scalars().all()
+            }
+            added = 0
+            for _ in range(min(missing, SCENARIO_REFILL_BATCH)):
+                data = validate_scenario(await generate_fraud_scenario())
+                if not data or normalize_text(data["scenario"]) in existing:
+                    continue
+                existing.add(normalize_text(data["scenario"]))
+                db.add(FraudScenario(**data))
+                added += 1
+            if added:
+                await db.commit()
+                self.invalidate()
+            logger.info(f"Scenario pool refill: added {added}, wanted {missing}")
+            return added
+
+    def request_refill(self):
+        """Wake the refill worker early (e.g. when a request found the pool empty)."""
+        self.wake()
+
+    async def run_once(self):
+        await self.refill()
+
+
+scenario_pool = ScenarioPool()
@@ -0,0 +1,75 @@
+"""Guide search — Turkish tsvector over guides + steps (GIN), pg_trgm title fallback for typos."""
+import os
+import re
+
+from sqlalchemy import select, func, text
+
+from app.models import Guide
+from app.utils.text import turkish_casefold
+
+SEARCH_CONFIG = "turkish"
+# How much one point of Guide.priority weighs against text relevance (ts_rank_cd is ~0..1)
+PRIORITY_WEIGHT = float(os.getenv("SEARCH_PRIORITY_WEIGHT", "0.02"))
+
+# Fold Turkish dotted/dotless I in SQL the same way turkish_casefold does in Python
+def _folded(expr: str) -> str:
+    return f"translate(coalesce({expr}, ''), 'İI', 'iı')"
+
+_VECTOR_SQL = f"""
+    setweight(to_tsvector('{SEARCH_CONFIG}', {_folded('title')}), 'A') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', {_folded("(SELECT string_agg(s.title, ' ') FROM guide_steps s WHERE s.guide_id = guides.id)")}), 'B') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', {_folded("content")} || ' ' || {_folded("(SELECT string_agg(s.description, ' ') FROM guide_steps s WHERE s.guide_id = guides.id)")}), 'C')
+"""
+
+SEARCH_SCHEMA_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE guides ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS ix_guides_search_vector ON guides USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_guides_title_trgm ON guides USING gin (title gin_trgm_ops)",
+]
+
+
+def ensure_search_schema(conn):
+    """Idempotent startup DDL (sync connection): extension, column, indexes, backfill of unindexed guides."""
+    for statement in SEARCH_SCHEMA_DDL:
+        conn.execute(text(statement))
+    conn.execute(text(f"UPDATE guides SET search_vector = {_VECTOR_SQL} WHERE search_vector IS NULL"))
+
+
+async def refresh_search_index(db, guide_id: int):
+    """Recompute one guide's search vector from its title, content and steps. Caller commits."""
+    await db.flush()
+    await db.execute(text(f"UPDATE guides SET search_vector = {_VECTOR_SQL} WHERE id = :guide_id"), {"guide_id": guide_id})
+
+
+def _prefix_tsquery(query: str) -> str:
+    """'e-devlet şifr' -> 'e:* & devlet:* & şifr:*' so type-ahead matches partial words."""
+    terms = re.findall(r"\w+", turkish_casefold(query))
+    return " & ".join(f"{t}:*" for t in terms)
+
+
+async def search_guides(db, query: str, limit: int = 10, published_only: bool = True) -> list[Guide]:
+    """Full-text search ranked by relevance blended with priority; falls back to title trigrams."""
+    ts_query = _prefix_tsquery(query)
+    if not ts_query:
+        return []
+
+    tsq = func.to_tsquery(SEARCH_CONFIG, ts_query)
+    score = func.ts_rank_cd(Guide.search_vector, tsq) + func.coalesce(Guide.priority, 0) * PRIORITY_WEIGHT
+    stmt = select(Guide).where(Guide.search_vector.op("@@")(tsq))
+    if published_only:
+        stmt = stmt.where(Guide.status == "published")
+    result = await db.execute(stmt.order_by(score.desc(), Guide.id).limit(limit))
+    guides = result.scalars().all()
+    if guides:
+        return guides
+
+    # Typo fallback: `title %> q` is word_similarity(q, title) above threshold, served by the trigram index
+    similarity = func.word_similarity(query, Guide.title)
+    stmt = select(Guide).where(Guide.title.op("%>")(query))
+    if published_only:
+        stmt = stmt.where(Guide.status == "published")
+    result = await db.execute(
+        stmt.order_by((similarity + func.coalesce(Guide.priority, 0) * PRIORITY_WEIGHT).desc(), Guide.id).limit(limit)
+    )
+    return result.scalars().all()
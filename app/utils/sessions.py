@@ -0,0 +1,179 @@
+"""Server-side sessions — the cookie carries only a signed session id; data lives in a pluggable backend."""
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+import itsdangerous
+from itsdangerous.exc import BadSignature
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # 'memory' or 'sqlite'
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.db")
+# Re-write an unchanged session (sliding expiry) at most this often
+SESSION_REFRESH_SECONDS = int(os.getenv("SESSION_REFRESH_SECONDS", str(24 * 3600)))
+
+
+def _user_id(data: dict):
+    user = data.get("user") or {}
+    return user.get("id")
+
+
+class MemorySessionBackend:
+    """Single-node store: dict of session id -> (data, expires_at)."""
+
+    def __init__(self):
+        self._sessions = {}
+
+    async def get(self, sid: str):
+        entry = self._sessions.get(sid)
+        if entry is None:
+            return None
+        data, expires_at = entry
+        if expires_at < time.time():
+            self._sessions.pop(sid, None)
+            return None
+        return data, expires_at
+
+    async def set(self, sid: str, data: dict, ttl: int):
+        self._sessions[sid] = (data, time.time() + ttl)
+        # Opportunistic sweep so abandoned sessions do not pile up
+        if len(self._sessions) % 1000 == 0:
+            now = time.time()
+            for key in [k for k, (_, exp) in self._sessions.items() if exp < now]:
+                self._sessions.pop(key, None)
+
+    async def delete(self, sid: str):
+        self._sessions.pop(sid, None)
+
+    async def revoke_user(self, user_id: int) -> int:
+        sids = [sid for sid, (data, _) in self._sessions.items() if _user_id(data) == user_id]
+        for sid in sids:
+            self._sessions.pop(sid, None)
+        return len(sids)
+
+
+class SQLiteSessionBackend:
+    """
+    Local key-value stand-in for a shared store (e.g. Redis): every worker on the host
+    opens the same SQLite file, so sessions and revocations are visible across processes.
+    """
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, user_id INTEGER, data TEXT, expires_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_user_id ON sessions (user_id)")
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            return cursor.fetchall(), cursor.rowcount
+
+    async def _run(self, sql: str, params: tuple = ()):
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def get(self, sid: str):
+        rows, _ = await self._run("SELECT data, expires_at FROM sessions WHERE sid = ?", (sid,))
+        if not rows:
+            return None
+        data, expires_at = rows[0]
+        if expires_at < time.time():
+            await self.delete(sid)
+            return None
+        return json.loads(data), expires_at
+
+    async def set(self, sid: str, data: dict, ttl: int):
+        await self._run(
+            "INSERT OR REPLACE INTO sessions (sid, user_id, data, expires_at) VALUES (?, ?, ?, ?)",
+            (sid, _user_id(data), json.dumps(data), time.time() + ttl)
+        )
+
+    async def delete(self, sid: str):
+        await self._run("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    async def revoke_user(self, user_id: int) -> int:
+        _, deleted = await self._run("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        return deleted
+
+
+def create_backend(name: str = SESSION_BACKEND):
+    if name == "sqlite":
+        return SQLiteSessionBackend()
+    return MemorySessionBackend()
+
+
+session_backend = create_backend()
+
+
+class ServerSessionMiddleware:
+    """Drop-in replacement for Starlette's SessionMiddleware that keeps `request.session` server-side."""
+
+    def __init__(self, app, backend, secret_key: str, session_cookie: str = "session",
+                 max_age: int = 14 * 24 * 3600, same_site: str = "lax", https_only: bool = False):
+        self.app = app
+        self.backend = backend
+        self.signer = itsdangerous.TimestampSigner(str(secret_key))
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        sid, initial, expires_at = None, {}, 0
+        if self.session_cookie in connection.cookies:
+            try:
+                sid = self.signer.unsign(connection.cookies[self.session_cookie], max_age=self.max_age).decode("utf-8")
+            except BadSignature:
+                sid = None
+            if sid:
+                entry = await self.backend.get(sid)
+                if entry is None:
+                    sid = None  # expired or revoked
+                else:
+                    initial, expires_at = entry
+
+        scope["session"] = json.loads(json.dumps(initial))
+
+        async def send_wrapper(message):
+            nonlocal sid
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                headers = MutableHeaders(scope=message)
+                if session:
+                    changed = session != initial
+                    stale = expires_at - time.time() < self.max_age - SESSION_REFRESH_SECONDS
+                    if sid and _user_id(session) != _user_id(initial):
+                        # New identity (login/logout/switch): rotate the id to prevent fixation
+                        await self.backend.delete(sid)
+                        sid = None
+                    if not sid or changed or stale:
+                        sid = sid or secrets.token_urlsafe(32)
+                        await self.backend.set(sid, session, self.max_age)
+                        signed = self.signer.sign(sid).decode("utf-8")
+                        headers.append(
+                            "Set-Cookie",
+                            f"{self.session_cookie}={signed}; path=/; Max-Age={self.max_age}; {self.security_flags}"
+                        )
+                elif sid:
+                    await self.backend.delete(sid)
+                    headers.append(
+                        "Set-Cookie",
+                        f"{self.session_cookie}=null; path=/; expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}"
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,311 @@
+"""
+Generated step SVGs — sanitized, minified and stored content-addressed under
+static/generated/svg/<sha256>.svg, with one GeneratedSVG metadata row per file.
+
+Identical outputs share one file. References are whatever GuideStep/Guide image_url
+point at a stored file; writers of image_url keep GeneratedSVG.reference_count current,
+and the garbage collector recounts and removes files nothing points at.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import AsyncSessionLocal
+from app.models import GeneratedSVG, GuideStep, Guide
+from app.utils.catalog import guide_catalog
+from app.utils.guide_version import refresh_guide_version
+from app.utils.workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+GENERATED_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "generated")
+SVG_DIR = os.path.join(GENERATED_DIR, "svg")
+SVG_URL_PREFIX = "/static/generated/svg/"
+LEGACY_URL_PREFIX = "/static/generated/"
+
+SVG_MAX_BYTES = int(os.getenv("SVG_MAX_BYTES", str(64 * 1024)))
+# Unreferenced files younger than this are kept: an image job may not have patched its step yet
+SVG_GC_GRACE_SECONDS = int(os.getenv("SVG_GC_GRACE_SECONDS", str(24 * 3600)))
+SVG_GC_INTERVAL = float(os.getenv("SVG_GC_INTERVAL", str(6 * 3600)))
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+ET.register_namespace("", SVG_NS)
+ET.register_namespace("xlink", XLINK_NS)
+
+# Presentational elements only: no script, foreignObject, style, image, a, animate or set
+ALLOWED_ELEMENTS = {
+    "svg", "g", "defs", "symbol", "use", "rect", "circle", "ellipse", "line", "polyline", "polygon",
+    "path", "linearGradient", "radialGradient", "stop", "clipPath", "mask", "text", "tspan",
+}
+DROPPED_ATTRIBUTES = {"id", "class", "version", "space", "data-name"}
+_UNSAFE_VALUE = re.compile(r"javascript:|data:|expression\s*\(|@import|url\(\s*(?!['\"]?#)", re.IGNORECASE)
+_LONG_DECIMAL = re.compile(r"(\d+\.\d{2})\d+")
+
+
+class UnsafeSVGError(ValueError):
+    """Raised when model output is not a usable SVG."""
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _referenced_ids(root) -> set:
+    """ids used by url(#...) or href="#..."; all other ids are dropped when minifying."""
+    ids = set()
+    for el in root.iter():
+        for value in el.attrib.values():
+            ids.update(re.findall(r"url\(\s*['\"]?#([^)'\"\s]+)", value))
+            if value.startswith("#"):
+                ids.add(value[1:])
+    return ids
+
+
+def _clean(el, keep_ids: set):
+    for child in list(el):
+        if not isinstance(child.tag, str) or _local(child.tag) not in ALLOWED_ELEMENTS:
+            el.remove(child)
+            continue
+        _clean(child, keep_ids)
+
+    for name in list(el.attrib):
+        local, value = _local(name), el.attrib[name]
+        if local.lower().startswith("on") or _UNSAFE_VALUE.search(value):
+            del el.attrib[name]
+        elif local == "href" and not value.startswith("#"):
+            del el.attrib[name]
+        elif local == "id" and value in keep_ids:
+            continue
+        elif local in DROPPED_ATTRIBUTES:
+            del el.attrib[name]
+        else:
+            el.attrib[name] = _LONG_DECIMAL.sub(r"\1", value)
+
+    # Whitespace between elements carries nothing; keep real text content only
+    if el.text and not el.text.strip():
+        el.text = None
+    if el.tail and not el.tail.strip():
+        el.tail = None
+
+
+def sanitize_svg(raw: str) -> str:
+    """Allowlist-sanitize and minify an SVG document. Raises UnsafeSVGError if it cannot be used."""
+    if re.search(r"<!DOCTYPE|<!ENTITY", raw, re.IGNORECASE):
+        raise UnsafeSVGError("DTDs and entities are not allowed")
+    try:
+        root = ET.fromstring(raw)
+    except ET.ParseError as e:
+        raise UnsafeSVGError(f"not well-formed: {e}")
+    if _local(root.tag) != "svg":
+        raise UnsafeSVGError(f"root element is <{_local(root.tag)}>")
+    if not root.tag.startswith("{"):
+        # No xmlns on the root: move every element into the SVG namespace
+        for el in root.iter():
+            if isinstance(el.tag, str) and not el.tag.startswith("{"):
+                el.tag = f"{{{SVG_NS}}}{el.tag}"
+
+    _clean(root, _referenced_ids(root))
+    root.attrib.pop("width", None)  # the page sizes the image; viewBox keeps the aspect ratio
+    root.attrib.pop("height", None)
+    root.set("viewBox", root.get("viewBox", "0 0 400 240"))
+
+    svg = ET.tostring(root, encoding="unicode", short_empty_elements=True)
+    if len(svg.encode("utf-8")) > SVG_MAX_BYTES:
+        raise UnsafeSVGError(f"{len(svg)} bytes exceeds SVG_MAX_BYTES")
+    return svg
+
+
+def svg_url(digest: str) -> str:
+    return f"{SVG_URL_PREFIX}{digest}.svg"
+
+
+def _stored_digest(url: str):
+    """The hash of a stored-SVG URL, or None for any other image."""
+    if url and url.startswith(SVG_URL_PREFIX) and url.endswith(".svg"):
+        return url[len(SVG_URL_PREFIX):-len(".svg")]
+    return None
+
+
+def _path(digest: str) -> str:
+    return os.path.join(SVG_DIR, f"{digest}.svg")
+
+
+def _write_file(digest: str, data: bytes):
+    path = _path(digest)
+    if os.path.exists(path):
+        return
+    os.makedirs(SVG_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+async def lookup(prompt_key: str):
+    """URL of an SVG already generated for this prompt, or None."""
+    async with AsyncSessionLocal() as db:
+        digest = (await db.execute(
+            select(GeneratedSVG.hash).where(GeneratedSVG.prompt_key == prompt_key).limit(1)
+        )).scalar()
+        if not digest or not os.path.exists(_path(digest)):
+            return None
+        # The caller is about to point a step at it: restart the GC grace period
+        await db.execute(update(GeneratedSVG).where(GeneratedSVG.hash == digest).values(created_at=func.now()))
+        await db.commit()
+    return svg_url(digest)
+
+
+async def store_svg(raw: str, prompt_key: str = None) -> str:
+    """Sanitize, deduplicate and store an SVG; returns its /static URL. Raises UnsafeSVGError."""
+    data = sanitize_svg(raw).encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+
+    await asyncio.to_thread(_write_file, digest, data)
+    async with AsyncSessionLocal() as db:
+        # A duplicate may be an old orphan; refreshing created_at keeps the GC off it until the step is patched
+        await db.execute(
+            insert(GeneratedSVG)
+            .values(hash=digest, byte_size=len(data), prompt_key=prompt_key)
+            .on_conflict_do_update(index_elements=["hash"], set_={"created_at": func.now()})
+        )
+        await db.commit()
+    logger.info(f"SVG stored: {digest[:12]} ({len(raw)} -> {len(data)} bytes)")
+    return svg_url(digest)
+
+
+async def _referenced_urls(db) -> dict:
+    """image_url -> number of steps/guides pointing at it, for generated images only."""
+    counts = {}
+    for column in (GuideStep.image_url, Guide.image_url):
+        urls = (await db.execute(select(column).where(column.like(f"{LEGACY_URL_PREFIX}%")))).scalars().all()
+        for url in urls:
+            counts[url] = counts.get(url, 0) + 1
+    return counts
+
+
+async def refresh_reference_counts(db, urls):
+    """
+    Recount reference_count for the stored SVGs among `urls` (the old and new image_urls of an
+    edit). Runs in the caller's transaction, so call it after the change and before commit.
+    """
+    digests = {_stored_digest(url) for url in urls} - {None}
+    if not digests:
+        return
+    await db.flush()
+    for digest in digests:
+        url = svg_url(digest)
+        steps = select(func.count()).select_from(GuideStep).where(GuideStep.image_url == url).scalar_subquery()
+        guides = select(func.count()).select_from(Guide).where(Guide.image_url == url).scalar_subquery()
+        await db.execute(
+            update(GeneratedSVG).where(GeneratedSVG.hash == digest).values(reference_count=steps + guides)
+        )
+
+
+async def adopt_legacy_files() -> int:
+    """Move pre-store step_<md5>.svg images into the store and repoint the steps that use them."""
+    adopted = 0
+    async with AsyncSessionLocal() as db:
+        refs = await _referenced_urls(db)
+    for url in refs:
+        if url.startswith(SVG_URL_PREFIX):
+            continue
+        path = os.path.join(GENERATED_DIR, os.path.basename(url))
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                new_url = await store_svg(f.read())
+        except (OSError, UnsafeSVGError) as e:
+            logger.warning(f"SVG store: could not adopt {url}: {e}")
+            continue
+        async with AsyncSessionLocal() as db:
+            guide_ids = set((await db.execute(select(GuideStep.guide_id).where(GuideStep.image_url == url))).scalars())
+            guide_ids.update((await db.execute(select(Guide.id).where(Guide.image_url == url))).scalars())
+            await db.execute(update(GuideStep).where(GuideStep.image_url == url).values(image_url=new_url))
+            await db.execute(update(Guide).where(Guide.image_url == url).values(image_url=new_url))
+            for guide_id in guide_ids:
+                await refresh_guide_version(db, guide_id)
+            await refresh_reference_counts(db, [new_url])
+            await db.commit()
+        adopted += 1
+    if adopted:
+        guide_catalog.invalidate()
+    return adopted
+
+
+def _remove(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except OSError:
+        return 0
+
+
+async def collect_garbage() -> dict:
+    """Delete stored and legacy SVGs no step or guide references. Returns counts for logging/admin."""
+    adopted = await adopt_legacy_files()
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=SVG_GC_GRACE_SECONDS)
+    removed, freed = 0, 0
+
+    async with AsyncSessionLocal() as db:
+        refs = await _referenced_urls(db)
+        rows = (await db.execute(select(GeneratedSVG))).scalars().all()
+        known = set()
+        orphans = []
+        for row in rows:
+            known.add(f"{row.hash}.svg")
+            # Reconcile with the tables in case an image_url was changed outside the app
+            row.reference_count = refs.get(svg_url(row.hash), 0)
+            if row.reference_count == 0 and row.created_at and row.created_at < cutoff:
+                orphans.append(row.hash)
+        if orphans:
+            await db.execute(delete(GeneratedSVG).where(GeneratedSVG.hash.in_(orphans)))
+        await db.commit()
+
+    for digest in orphans:
+        freed += await asyncio.to_thread(_remove, _path(digest))
+        removed += 1
+
+    # Files with no metadata row: legacy step_<md5>.svg and leftovers from crashed writes
+    referenced_names = {os.path.basename(url) for url in refs}
+    for folder in (GENERATED_DIR, SVG_DIR):
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if not os.path.isfile(path) or name in known or name in referenced_names:
+                continue
+            if not name.endswith((".svg", ".tmp")):
+                continue
+            if os.path.getmtime(path) > time.time() - SVG_GC_GRACE_SECONDS:
+                continue
+            freed += await asyncio.to_thread(_remove, path)
+            removed += 1
+
+    if removed or adopted:
+        logger.info(f"SVG GC: adopted {adopted} legacy files, removed {removed} files ({freed} bytes)")
+    return {"adopted": adopted, "removed": removed, "freed_bytes": freed}
+
+
+class SVGGarbageCollector(PeriodicWorker):
+    name = "SVG GC"
+    cancel_on_stop = True  # files left behind are collected on the next run
+
+    def __init__(self, interval: float = SVG_GC_INTERVAL):
+        super().__init__(interval)
+
+    async def run_once(self):
+        await collect_garbage()
+
+
+svg_gc = SVGGarbageCollector()
@@ -0,0 +1,38 @@
+"""Turkish-aware text normalization shared by search, caching and deduplication."""
+import re
+
+
+def turkish_casefold(text: str) -> str:
+    """Lowercase with Turkish rules: I -> ı and İ -> i (str.lower() gets both wrong)."""
+    return text.replace("I", "ı").replace("İ", "i").lower()
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold, drop punctuation and collapse whitespace."""
+    text = turkish_casefold(text or "")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+# Folds Turkish letters onto ASCII so "sifre" and "şifre" compare equal
+_ASCII_FOLD = str.maketrans("çğıöşüâîû", "cgiosuaiu")
+
+
+def ascii_fold(text: str) -> str:
+    """Map already case-folded Turkish letters to their ASCII look-alikes."""
+    return text.translate(_ASCII_FOLD)
+
+
+def _ngrams(text: str, n: int = 3) -> set:
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard similarity of character trigrams."""
+    if a == b:
+        return 1.0
+    grams_a, grams_b = _ngrams(a), _ngrams(b)
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
@@ -0,0 +1,53 @@
+"""Small LRU + TTL cache of user records so authenticated page views skip the per-request User fetch."""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from app.models import User
+
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "5000"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    name: str
+    email: str
+    role: str
+
+
+class UserCache:
+    def __init__(self, max_entries: int = USER_CACHE_MAX_ENTRIES, ttl_seconds: int = USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # user_id -> (UserSnapshot, cached_at)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, db, user_id: int):
+        """The user's snapshot, or None if the user does not exist."""
+        entry = self._entries.get(user_id)
+        if entry and time.time() - entry[1] < self.ttl_seconds:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        user = await db.get(User, user_id)
+        if not user:
+            self._entries.pop(user_id, None)
+            return None
+        snapshot = UserSnapshot(id=user.id, name=user.name, email=user.email, role=user.role)
+        self._entries[user_id] = (snapshot, time.time())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+
+user_cache = UserCache()
@@ -0,0 +1,62 @@
+"""Periodic background workers — the start/stop/loop shared by every job wired into app startup."""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """
+    Calls `run_once()` right after `start()`, then every `interval` seconds or as soon as `wake()` is called.
+    Errors are logged and the loop carries on. `stop()` lets a running pass finish unless
+    `cancel_on_stop` is set, for passes that are safe to abandon halfway (they run in a transaction
+    or are simply retried next time).
+    """
+
+    name = "Background worker"
+    cancel_on_stop = False
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task = None
+        self._stop = None
+        self._wakeup = None
+
+    async def run_once(self):
+        raise NotImplementedError
+
+    def wake(self):
+        """Run the next pass now instead of at the next interval."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"{self.name} failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if self._task is None:
+            self._stop = asyncio.Event()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        if self.cancel_on_stop:
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,25 @@
+"""
+Latency-injecting stand-in for Gemini, for benchmarks.
+
+install() puts a jittered FakeProvider behind the "gemini" provider name, so help answers,
+fraud scenarios and SVGs go through the real routing, hedging and fallback but cost a
+realistic wait instead of an API call.
+"""
+import os
+import random
+
+from app.utils.llm_router import FakeProvider
+
+BENCH_LLM_LATENCY_MS = float(os.getenv("BENCH_LLM_LATENCY_MS", "800"))
+BENCH_LLM_JITTER = float(os.getenv("BENCH_LLM_JITTER", "0.3"))  # +/- fraction of the latency
+
+
+class JitteredFakeProvider(FakeProvider):
+    def delay(self) -> float:
+        jitter = 1 + random.uniform(-BENCH_LLM_JITTER, BENCH_LLM_JITTER)
+        return super().delay() * jitter
+
+
+def install():
+    from app.utils.llm_router import llm_router
+    llm_router.set_provider("gemini", JitteredFakeProvider(latency_ms=BENCH_LLM_LATENCY_MS))
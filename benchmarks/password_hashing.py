@@ -0,0 +1,72 @@
+"""
+Login hashing benchmark: bcrypt throughput vs. latency of unrelated work on the same event loop.
+
+Runs N concurrent "logins" (bcrypt verify) twice — inline on the event loop (the old
+behaviour) and through app.utils.passwords — while a probe coroutine plays the part of
+an unrelated route that should answer every 10 ms. Lateness of the probe is what other
+users of the worker would feel.
+
+    python -m benchmarks.password_hashing --logins 32 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import passwords  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe(stop: asyncio.Event, lateness: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lateness.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+
+async def inline_login(password: str, hashed: str):
+    return passwords.verify_password_sync(password, hashed)
+
+
+async def run(mode: str, logins: int, hashed: str):
+    login = inline_login if mode == "inline" else passwords.verify_password
+    stop, lateness = asyncio.Event(), []
+    probe_task = asyncio.create_task(probe(stop, lateness))
+    await asyncio.sleep(PROBE_INTERVAL * 3)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login("benchmark-password", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe_task
+    assert all(results), "verification failed"
+
+    lateness.sort()
+    p99 = lateness[min(len(lateness) - 1, int(len(lateness) * 0.99))] if lateness else 0.0
+    print(
+        f"{mode:>7}: {logins / elapsed:7.1f} logins/s | "
+        f"probe lateness p50 {statistics.median(lateness) if lateness else 0.0:7.1f} ms, "
+        f"p99 {p99:7.1f} ms, max {max(lateness, default=0.0):7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=32, help="concurrent login attempts")
+    parser.add_argument("--rounds", type=int, default=passwords.BCRYPT_ROUNDS, help="bcrypt cost factor")
+    args = parser.parse_args()
+
+    hashed = passwords.hash_password_sync("benchmark-password", args.rounds)
+    print(f"bcrypt cost {args.rounds}, {passwords.PASSWORD_HASH_WORKERS} hash workers, {args.logins} logins")
+    for mode in ("inline", "pooled"):
+        asyncio.run(run(mode, args.logins, hashed))
+
+
+if __name__ == "__main__":
+    main()
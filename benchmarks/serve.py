@@ -0,0 +1,32 @@
+"""
+Run the app for benchmarking: real database, fake LLM.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.serve --port 8001
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Must be set before the app is imported: modules read it at import time to decide whether AI is available
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("SESSION_SECRET_KEY", "benchmark")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the app with a fake LLM for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    import uvicorn
+    from benchmarks import fake_llm
+    from app.main import app
+
+    fake_llm.install()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
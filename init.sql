@@ -1,3 +1,6 @@
+-- Extensions
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Create tables
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
@@ -16,7 +19,9 @@ CREATE TABLE IF NOT EXISTS guides (
     priority INTEGER DEFAULT 0,
     help_options TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE
+    updated_at TIMESTAMP WITH TIME ZONE,
+    content_hash VARCHAR,
+    search_vector TSVECTOR
 );
 
 CREATE TABLE IF NOT EXISTS guide_steps (
@@ -29,19 +34,40 @@ CREATE TABLE IF NOT EXISTS guide_steps (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Search indexes (search_vector is filled by the app at startup and on every admin edit)
+CREATE INDEX IF NOT EXISTS ix_guides_search_vector ON guides USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS ix_guides_title_trgm ON guides USING gin (title gin_trgm_ops);
+
 CREATE TABLE IF NOT EXISTS step_problems (
     id SERIAL PRIMARY KEY,
     guide_id INTEGER REFERENCES guides(id) ON DELETE CASCADE,
     step_number INTEGER NOT NULL,
+    problem_type VARCHAR,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS ix_step_problems_guide_step ON step_problems (guide_id, step_number);
+
+-- Daily rollup of step_problems, maintained by the app on every report
+CREATE TABLE IF NOT EXISTS step_problem_daily (
+    id SERIAL PRIMARY KEY,
+    guide_id INTEGER NOT NULL REFERENCES guides(id) ON DELETE CASCADE,
+    step_number INTEGER NOT NULL,
+    problem_type VARCHAR NOT NULL DEFAULT 'general',
+    day DATE NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_step_problem_daily UNIQUE (guide_id, step_number, problem_type, day)
+);
+CREATE INDEX IF NOT EXISTS ix_step_problem_daily_day ON step_problem_daily (day);
 
 CREATE TABLE IF NOT EXISTS ideas (
     id SERIAL PRIMARY KEY,
     title VARCHAR(255),
+    normalized_title VARCHAR,
     count INTEGER DEFAULT 1,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS ix_ideas_count_id ON ideas (count, id);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_ideas_normalized_title ON ideas (normalized_title);
 
 -- Seed default users
 INSERT INTO users (name, email, hashed_password, role) VALUES
@@ -161,6 +187,29 @@ CREATE TABLE IF NOT EXISTS trusted_contacts (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- AI Help Response Cache
+CREATE TABLE IF NOT EXISTS ai_help_cache (
+    id SERIAL PRIMARY KEY,
+    guide_id INTEGER NOT NULL REFERENCES guides(id) ON DELETE CASCADE,
+    content_hash VARCHAR,
+    step_number INTEGER NOT NULL,
+    normalized_query VARCHAR NOT NULL,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_ai_help_cache_guide_id ON ai_help_cache (guide_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_help_cache_key ON ai_help_cache (guide_id, content_hash, step_number, normalized_query);
+
+-- Generated step SVGs (files live in app/static/generated/svg/<hash>.svg)
+CREATE TABLE IF NOT EXISTS generated_svgs (
+    hash VARCHAR PRIMARY KEY,
+    byte_size INTEGER NOT NULL,
+    prompt_key VARCHAR,
+    reference_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_generated_svgs_prompt_key ON generated_svgs (prompt_key);
+
 -- Companion Alerts
 CREATE TABLE IF NOT EXISTS companion_alerts (
     id SERIAL PRIMARY KEY,
@@ -170,8 +219,17 @@ CREATE TABLE IF NOT EXISTS companion_alerts (
     step_number INTEGER,
     frustration_count INTEGER DEFAULT 3,
     message TEXT NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    status VARCHAR DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    dedupe_key VARCHAR
 );
+CREATE UNIQUE INDEX IF NOT EXISTS ix_companion_alerts_open_dedupe ON companion_alerts (dedupe_key) WHERE status IN ('pending', 'sending');
+CREATE INDEX IF NOT EXISTS ix_companion_alerts_dedupe_sent ON companion_alerts (dedupe_key, sent_at);
+CREATE INDEX IF NOT EXISTS ix_companion_alerts_status_next ON companion_alerts (status, next_attempt_at);
 
 INSERT INTO fraud_scenarios (scenario, correct_action, explanation, difficulty) VALUES
 ('Telefonda kendini polis veya savcı olarak tanıtan biri aradı. ''Adınız bir terör örgütü soruşturmasına karıştı, bankadaki paranızı güvence altına almamız lazım, size vereceğimiz hesap numarasına paranızı gönderin'' diyor.', 'hangup', 'Devlet görevlileri (Polis, Savcı, Jandarma) asla vatandaştan para istemez veya hesap numarası vermez. Bu en yaygın dolandırıcılık yöntemidir. Telefonu hemen kapatın ve 155''i arayın.', 1),
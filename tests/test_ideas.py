@@ -0,0 +1,43 @@
+import pytest
+
+from app.utils.ideas import cluster_ideas, idea_key
+
+
+@pytest.mark.parametrize("title, key", [
+    ("E-Devlet Şifresi", "edevletsifresi"),
+    ("e-devlet sifresi", "edevletsifresi"),
+    ("  E DEVLET   ŞİFRESİ!! ", "edevletsifresi"),
+    ("IĞDIR", "igdir"),
+    ("", ""),
+])
+def test_idea_key_folds_case_punctuation_and_turkish_letters(title, key):
+    assert idea_key(title) == key
+
+
+def test_cluster_seeds_with_most_requested_idea():
+    ideas = [
+        (1, idea_key("WhatsApp görüntülü arama"), 2),
+        (2, idea_key("Whatsapp goruntulu arama nasıl"), 9),
+        (3, idea_key("e-Nabız randevu"), 4),
+    ]
+    clusters = cluster_ideas(ideas, threshold=0.6)
+    assert [[i[0] for i in c] for c in clusters] == [[2, 1], [3]]
+
+
+def test_cluster_ties_are_broken_by_lowest_id():
+    ideas = [(5, "mhrsrandevu", 3), (4, "mhrsrandevusu", 3)]
+    assert cluster_ideas(ideas, threshold=0.6)[0][0][0] == 4
+
+
+def test_dissimilar_ideas_stay_apart():
+    ideas = [(1, idea_key("E-Devlet"), 1), (2, idea_key("Yemek siparişi"), 1)]
+    assert len(cluster_ideas(ideas, threshold=0.6)) == 2
+
+
+def test_threshold_one_only_merges_identical_keys():
+    ideas = [(1, "edevlet", 1), (2, "edevlet", 1), (3, "edevlett", 1)]
+    assert [[i[0] for i in c] for c in cluster_ideas(ideas, threshold=1.0)] == [[1, 2], [3]]
+
+
+def test_empty_input():
+    assert cluster_ideas([]) == []
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils.llm_router import FAKE_HELP, FakeProvider, LLMRouter, LLMUnavailableError
+
+
+class _ScriptedProvider(FakeProvider):
+    """FakeProvider whose calls take the given latencies in turn and that records which models it was asked for."""
+
+    def __init__(self, latencies_ms=(), fail_models=(), broken_stream_models=()):
+        super().__init__(latency_ms=0, slow_every=0, fail_models=fail_models)
+        self.latencies = list(latencies_ms)
+        self.broken_stream_models = set(broken_stream_models)
+        self.models = []
+
+    def delay(self) -> float:
+        self.calls += 1
+        return (self.latencies.pop(0) if self.latencies else 0) / 1000
+
+    async def generate(self, model, prompt, generation_config=None, timeout=None):
+        self.models.append(model)
+        return await super().generate(model, prompt, generation_config=generation_config, timeout=timeout)
+
+    async def stream(self, model, prompt, timeout=None, usage=None):
+        first = True
+        async for chunk in super().stream(model, prompt, timeout=timeout, usage=usage):
+            if not first and model in self.broken_stream_models:
+                raise RuntimeError(f"{model} dropped the connection")
+            first = False
+            yield chunk
+
+
+def _router(provider, models, hedge_ms=0):
+    return LLMRouter(
+        routes={"help": [("fake", model) for model in models]},
+        hedge_ms={"help": hedge_ms},
+        providers={"fake": provider},
+    )
+
+
+async def _collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_no_hedge_when_the_primary_answers_within_the_delay():
+    provider = _ScriptedProvider(latencies_ms=[10])
+    router = _router(provider, ["a"], hedge_ms=200)
+
+    response = asyncio.run(router.generate("help", "soru"))
+    assert response.text == FAKE_HELP
+    assert (router.hedges, router.hedge_wins, provider.calls) == (0, 0, 1)
+
+
+def test_hedge_fires_after_the_delay_and_the_primary_can_still_win():
+    provider = _ScriptedProvider(latencies_ms=[60, 500])
+    router = _router(provider, ["a"], hedge_ms=20)
+
+    asyncio.run(router.generate("help", "soru"))
+    assert (router.hedges, router.hedge_wins, provider.calls) == (1, 0, 2)
+
+
+def test_hedge_win_is_counted_when_the_duplicate_answers_first():
+    provider = _ScriptedProvider(latencies_ms=[500, 10])
+    router = _router(provider, ["a"], hedge_ms=20)
+
+    started = time.perf_counter()
+    response = asyncio.run(router.generate("help", "soru"))
+    elapsed = time.perf_counter() - started
+    assert response.text == FAKE_HELP
+    assert (router.hedges, router.hedge_wins) == (1, 1)
+    assert elapsed < 0.4  # the slow primary was cancelled, not awaited
+
+
+def test_fallback_follows_the_configured_order():
+    provider = _ScriptedProvider(fail_models=["a", "b"])
+    router = _router(provider, ["a", "b", "c"])
+
+    response = asyncio.run(router.generate("help", "soru"))
+    assert response.text == FAKE_HELP
+    assert provider.models == ["a", "b", "c"]
+    assert (router.fallbacks, router.failures) == (2, 0)
+
+
+def test_unavailable_providers_are_skipped_without_counting_a_fallback():
+    down, up = _ScriptedProvider(), _ScriptedProvider()
+    down.available = False
+    router = LLMRouter(
+        routes={"help": [("down", "a"), ("up", "b")]}, hedge_ms={}, providers={"down": down, "up": up},
+    )
+
+    asyncio.run(router.generate("help", "soru"))
+    assert (down.models, up.models, router.fallbacks) == ([], ["b"], 0)
+
+
+def test_each_call_with_no_answer_counts_a_failure():
+    provider = _ScriptedProvider(fail_models=["a", "b"])
+    router = _router(provider, ["a", "b"])
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(router.generate("help", "soru"))
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(_collect(router.stream("help", "soru")))
+    assert (router.calls, router.fallbacks, router.failures) == (2, 2, 2)
+
+
+def test_stream_falls_back_before_the_first_chunk():
+    provider = _ScriptedProvider(fail_models=["a"])
+    router = _router(provider, ["a", "b"])
+
+    chunks = asyncio.run(_collect(router.stream("help", "soru")))
+    assert "".join(chunks) == FAKE_HELP
+    assert provider.models == ["a", "b"]
+    assert (router.fallbacks, router.failures) == (1, 0)
+
+
+def test_stream_is_committed_after_its_first_chunk():
+    provider = _ScriptedProvider(broken_stream_models=["a"])
+    router = _router(provider, ["a", "b"])
+    received = []
+
+    async def consume():
+        async for chunk in router.stream("help", "soru"):
+            received.append(chunk)
+
+    with pytest.raises(RuntimeError, match="dropped the connection"):
+        asyncio.run(consume())
+    assert received == [FAKE_HELP.split(" ")[0] + " "]
+    assert provider.models == ["a"]  # never switched to "b" mid-answer
+    assert (router.fallbacks, router.failures) == (0, 0)
+
+
+def test_hedged_stream_keeps_the_first_chunk_winner():
+    provider = _ScriptedProvider(latencies_ms=[500, 10])
+    router = _router(provider, ["a"], hedge_ms=20)
+
+    chunks = asyncio.run(_collect(router.stream("help", "soru")))
+    assert "".join(chunks) == FAKE_HELP
+    assert (router.hedges, router.hedge_wins) == (1, 1)
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+from app.utils.prompt_builder import build_guide_context, build_help_prompt, clip, estimate_tokens
+
+INSTRUCTIONS = "Sen yardımsever bir asistansın."
+
+
+def _guide(step_count: int, description: str = "Ekrandaki mavi butona basın ve bekleyin. " * 4):
+    steps = [
+        SimpleNamespace(step_number=n, title=f"Adım başlığı {n}", description=description)
+        for n in range(1, step_count + 1)
+    ]
+    return build_guide_context(1, "e-Devlet Girişi", "hash", steps)
+
+
+def test_clip_cuts_at_a_word_boundary():
+    assert clip("bir  iki\nüç", 50) == "bir iki üç"
+    assert clip("bir iki üç dört", 10) == "bir iki…"
+
+
+def test_small_guide_is_included_in_full():
+    guide = _guide(3)
+    prompt = build_help_prompt(INSTRUCTIONS, "Butonu bulamıyorum", guide, step_number=2)
+    assert prompt.steps_included == prompt.steps_total == 3
+    assert "- Adım 2: Adım başlığı 2 - Ekrandaki" in prompt.text
+    assert prompt.tokens == estimate_tokens(prompt.text)
+
+
+def test_long_guide_stays_within_budget():
+    guide = _guide(60)
+    prompt = build_help_prompt(INSTRUCTIONS, "Butonu bulamıyorum", guide, step_number=30, budget=400)
+    assert prompt.tokens <= 400
+    assert 0 < prompt.steps_included < prompt.steps_total
+    # The current step and its neighbours are kept in full before any distant step
+    for n in (29, 30, 31):
+        assert f"- Adım {n}: Adım başlığı {n} - Ekrandaki" in prompt.text
+    assert "- Adım 1: Adım başlığı 1 - " not in prompt.text
+
+
+def test_distant_steps_fall_back_to_titles_nearest_first():
+    guide = _guide(12)
+    full = build_help_prompt(INSTRUCTIONS, "Soru", guide, step_number=6, budget=10_000)
+    tight = build_help_prompt(INSTRUCTIONS, "Soru", guide, step_number=6, budget=full.tokens - 40)
+    assert tight.tokens <= full.tokens - 40
+    assert tight.steps_included < tight.steps_total
+    for n in (5, 6, 7):
+        assert f"- Adım {n}: Adım başlığı {n} - " in tight.text
+    assert "- Adım 8: Adım başlığı 8\n" in tight.text
+    assert "- Adım 12:" not in tight.text
+
+
+def test_only_recent_attempts_are_verbatim():
+    attempts = [f"Öneri {n}: ayarlardan uygulamayı kapatıp açın." for n in range(1, 6)]
+    prompt = build_help_prompt(INSTRUCTIONS, "Olmadı", _guide(3), step_number=1, failed_attempts=attempts)
+    assert prompt.attempts_verbatim == 2
+    assert prompt.attempts_summarized == 3
+    assert "Daha önce 3 öneri daha denendi" in prompt.text
+    assert "- Öneri 5: ayarlardan uygulamayı kapatıp açın." in prompt.text
+
+
+def test_verbatim_window_shrinks_before_the_budget_is_exceeded():
+    attempts = ["Çok uzun bir açıklama " * 20, "Bir başka uzun açıklama " * 20]
+    prompt = build_help_prompt(INSTRUCTIONS, "Olmadı", None, failed_attempts=attempts, budget=200)
+    assert prompt.attempts_verbatim < 2
+    assert prompt.attempts_verbatim + prompt.attempts_summarized == 2
+    assert prompt.tokens <= 200
+
+
+def test_blank_attempts_are_ignored():
+    prompt = build_help_prompt(INSTRUCTIONS, "Soru", None, failed_attempts=["", "  ", None])
+    assert prompt.attempts_verbatim == prompt.attempts_summarized == 0
+    assert "İŞE YARAMADI" not in prompt.text
+
+
+def test_without_a_guide():
+    prompt = build_help_prompt(INSTRUCTIONS, "Soru", None)
+    assert "Rehber: Genel Yardım" in prompt.text
+    assert prompt.steps_total == 0
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from app.utils.ai_utils import FALLBACK_FRAUD_SCENARIO, OFFLINE_FRAUD_SCENARIO
+from app.utils import scenario_pool as pool_module
+from app.utils.scenario_pool import ScenarioPool, validate_scenario
+
+VALID = {
+    "scenario": "  Kargo şirketinden aradığını söyleyen biri SMS kodunu istiyor.  ",
+    "correct_action": "HangUp",
+    "explanation": "Kargo firmaları doğrulama kodu istemez.",
+    "difficulty": "2",
+}
+
+
+def test_valid_scenario_is_cleaned():
+    assert validate_scenario(VALID) == {
+        "scenario": "Kargo şirketinden aradığını söyleyen biri SMS kodunu istiyor.",
+        "correct_action": "hangup",
+        "explanation": "Kargo firmaları doğrulama kodu istemez.",
+        "difficulty": 2,
+    }
+
+
+@pytest.mark.parametrize("difficulty, expected", [(0, 1), (7, 3), ("zor", 1), (None, 1)])
+def test_difficulty_is_clamped(difficulty, expected):
+    assert validate_scenario({**VALID, "difficulty": difficulty})["difficulty"] == expected
+
+
+def test_missing_difficulty_defaults_to_one():
+    data = {k: v for k, v in VALID.items() if k != "difficulty"}
+    assert validate_scenario(data)["difficulty"] == 1
+
+
+@pytest.mark.parametrize("data", [
+    None,
+    "scenario",
+    [VALID],
+    {**VALID, "scenario": "   "},
+    {**VALID, "explanation": None},
+    {**VALID, "correct_action": "call back"},
+    {**VALID, "scenario": "x" * 601},
+    {**VALID, "explanation": "x" * 401},
+])
+def test_unusable_output_is_rejected(data):
+    assert validate_scenario(data) is None
+
+
+@pytest.mark.parametrize("data", [OFFLINE_FRAUD_SCENARIO, FALLBACK_FRAUD_SCENARIO])
+def test_canned_fallbacks_are_not_stored(data):
+    assert validate_scenario(dict(data)) is None
+
+
+class _Rows:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+class _ScenarioTable:
+    """Just enough of an AsyncSession for ScenarioPool: the id query and primary-key gets."""
+
+    def __init__(self, scenarios: dict):
+        self.scenarios = scenarios  # id -> difficulty
+        self.loads = 0
+
+    async def execute(self, stmt):
+        self.loads += 1
+        return _Rows(list(self.scenarios.items()))
+
+    async def get(self, model, scenario_id):
+        return scenario_id if scenario_id in self.scenarios else None
+
+
+def test_pool_reloads_after_its_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(pool_module.time, "monotonic", lambda: clock[0])
+    pool, db = ScenarioPool(), _ScenarioTable({1: 1})
+
+    assert asyncio.run(pool.pick(db)) == 1
+    db.scenarios = {2: 1}  # replaced on another worker
+    clock[0] += pool_module.SCENARIO_POOL_RELOAD_SECONDS + 1
+    assert asyncio.run(pool.pick(db)) == 2
+    assert db.loads == 2
+
+
+def test_pool_reloads_on_a_dead_id_or_empty_index():
+    pool, db = ScenarioPool(), _ScenarioTable({})
+    assert asyncio.run(pool.pick(db)) is None
+    db.scenarios = {7: 2}  # filled by another worker
+    assert asyncio.run(pool.pick(db)) == 7
+    db.scenarios = {8: 2}  # 7 deleted elsewhere
+    assert asyncio.run(pool.pick(db, difficulty=2)) == 8
@@ -0,0 +1,69 @@
+import pytest
+
+from app.utils.svg_store import UnsafeSVGError, sanitize_svg
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" viewBox="0 0 10 10">{}</svg>'
+
+
+def test_script_and_unknown_elements_are_removed():
+    out = sanitize_svg(SVG.format(
+        '<script>alert(1)</script><foreignObject><div>x</div></foreignObject><rect width="5" height="5"/>'
+    ))
+    assert "script" not in out
+    assert "foreignObject" not in out
+    assert "<rect" in out
+
+
+def test_event_handler_attributes_are_removed():
+    out = sanitize_svg(SVG.format('<circle r="2" onclick="alert(1)" ONLOAD="alert(2)"/>'))
+    assert "onclick" not in out.lower()
+    assert "onload" not in out.lower()
+    assert 'r="2"' in out
+
+
+def test_external_references_are_removed():
+    out = sanitize_svg(SVG.format(
+        '<use href="https://evil.example/x.svg#a"/>'
+        '<use xlink:href="javascript:alert(1)"/>'
+        '<rect fill="url(https://evil.example/p.svg)" style="fill:url(http://evil.example/)"/>'
+    ))
+    assert "evil.example" not in out
+    assert "javascript" not in out
+
+
+def test_internal_references_keep_their_ids():
+    out = sanitize_svg(SVG.format(
+        '<defs><linearGradient id="g"><stop offset="0"/></linearGradient></defs>'
+        '<rect id="unused" fill="url(#g)"/><use href="#g"/>'
+    ))
+    assert 'id="g"' in out
+    assert 'fill="url(#g)"' in out
+    assert 'href="#g"' in out
+    assert "unused" not in out
+
+
+@pytest.mark.parametrize("raw", [
+    '<!DOCTYPE svg [<!ENTITY x "boom">]><svg xmlns="http://www.w3.org/2000/svg">&x;</svg>',
+    '<!ENTITY x SYSTEM "file:///etc/passwd"><svg/>',
+])
+def test_dtd_and_entities_are_rejected(raw):
+    with pytest.raises(UnsafeSVGError):
+        sanitize_svg(raw)
+
+
+@pytest.mark.parametrize("raw", ["not xml at all", "<html><body/></html>"])
+def test_non_svg_input_is_rejected(raw):
+    with pytest.raises(UnsafeSVGError):
+        sanitize_svg(raw)
+
+
+def test_output_is_minified():
+    out = sanitize_svg(
+        '<svg width="400" height="240">\n  <path d="M 1.23456 2.34567 L 3 4" class="x"/>\n</svg>'
+    )
+    assert "\n" not in out
+    assert 'width="400"' not in out
+    assert 'viewBox="0 0 400 240"' in out
+    assert "1.23 2.34" in out
+    assert "class" not in out
+    assert out.startswith('<svg xmlns="http://www.w3.org/2000/svg"')